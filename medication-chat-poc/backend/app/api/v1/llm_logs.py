@@ -7,6 +7,7 @@ API endpoints for viewing LLM model interactions and responses
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Dict, Any, Optional
 import logging
+import re
 
 from app.services.medical_ai_service import MedicalAIService
 from app.services.llm_logger import llm_logger
@@ -14,6 +15,9 @@ from app.services.llm_logger import llm_logger
 router = APIRouter(prefix="/llm", tags=["LLM Logs"])
 logger = logging.getLogger(__name__)
 
+# Any character in the Thai Unicode block
+_THAI_RE = re.compile("[\u0e00-\u0e7f]")
+
 @router.get("/interactions", response_model=List[Dict[str, Any]])
 async def get_llm_interactions(
     limit: int = Query(10, ge=1, le=100, description="Number of interactions to retrieve"),
@@ -185,7 +189,7 @@ async def get_medical_responses(
                             "tokens_used": response_data.get('tokens_used'),
                             "confidence_score": response_data.get('confidence_score'),
                             "session_id": "unknown",
-                            "language": "thai" if any(ord(c) >= 0x0E00 and ord(c) <= 0x0E7F for c in response_text) else "english"
+                            "language": "thai" if _THAI_RE.search(response_text) else "english"
                         })
 
                 if len(medical_responses) >= limit:
@@ -4,11 +4,21 @@ Advanced Few-Shot Learning System
 Comprehensive few-shot examples for medical AI improvement
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+import os
+import re
+import sys
+import numpy as np
+from typing import Callable, Dict, List, Optional, Any, Mapping, NamedTuple, Set, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+from app.util.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +27,23 @@ try:
     from app.services.rag_few_shot_service import rag_few_shot_service
     RAG_AVAILABLE = True
 except ImportError as e:
-    logger.warning(f"RAG few-shot service not available: {e}")
+    logger.warning("RAG few-shot service not available: %s", e)
     RAG_AVAILABLE = False
 
+# Numba JIT for the indicator-hit kernel; the numpy matrix product is the fallback
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Upper bound on the knowledge-base lookup so a slow KB cannot hold up diagnosis
+RAG_RETRIEVAL_TIMEOUT = float(os.getenv("FEWSHOT_RAG_TIMEOUT", "5.0"))
+# Opt-in: skip the knowledge-base lookup when the local best match is already this confident
+RAG_SKIP_WHEN_CONFIDENT = os.getenv("FEWSHOT_RAG_SKIP_WHEN_CONFIDENT", "0") == "1"
+RAG_SKIP_CONFIDENCE = 0.92
+
+
 class MedicalDomain(Enum):
     """Medical domains for specialized learning"""
     CARDIOVASCULAR = "cardiovascular"
@@ -35,38 +59,545 @@ class MedicalDomain(Enum):
     PEDIATRIC = "pediatric"
     GYNECOLOGICAL = "gynecological"
 
-@dataclass
+    # Members are singletons compared by identity; the C-level identity hash replaces Enum's
+    # Python-level hash(self._name_), which every enum-keyed dict lookup would otherwise pay for
+    __hash__ = object.__hash__
+
+def _pooled(value: Any) -> Any:
+    """Intern strings (recursively through lists/tuples) so repeated drug/action names share one object"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_pooled(item) for item in value)
+    return value
+
+class Diagnosis(NamedTuple):
+    """Fixed-schema diagnosis record - tuple slots instead of a per-example dict"""
+    icd_code: str
+    name: str
+    confidence: float = 0.0
+    urgency: str = "moderate"
+
+    @classmethod
+    def from_mapping(cls, data: Mapping[str, Any]) -> "Diagnosis":
+        """Convert a feedback/RAG diagnosis dict, keeping the old .get() defaults"""
+        return cls(
+            icd_code=_pooled(data.get("icd_code", "")),
+            name=_pooled(data.get("name", "")),
+            confidence=data.get("confidence", 0.0),
+            urgency=_pooled(data.get("urgency", "moderate"))
+        )
+
+@dataclass(slots=True, frozen=True)
 class FewShotExample:
-    """Enhanced few-shot learning example"""
+    """Enhanced few-shot learning example (immutable, no per-instance __dict__)"""
     id: str
     domain: MedicalDomain
     symptoms_thai: str
     symptoms_english: str
-    diagnosis: Dict[str, Any]
-    treatment: Dict[str, Any]
-    key_indicators: List[str]
-    differential_diagnosis: List[Dict[str, Any]]
-    red_flags: List[str]
+    diagnosis: Diagnosis
+    treatment: Mapping[str, Any]
+    key_indicators: Tuple[str, ...]
+    differential_diagnosis: Tuple[Mapping[str, Any], ...]
+    red_flags: Tuple[str, ...]
     confidence_level: float
     complexity: str  # simple, moderate, complex
     learning_notes: str
+    rag_source: bool = False
+    rag_retrieval_score: float = 0.0
+    # Lowercased copies computed once, so scoring loops are pure substring tests
+    _ki_lower: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    _red_flags_lower: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    _symptoms_thai_lower: str = field(init=False, repr=False, compare=False)
+    _domain_value: str = field(init=False, repr=False, compare=False)
+    # Treatment block as rendered into prompts, encoded once instead of per request
+    _treatment_str: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Feedback/RAG callers still pass lists - normalise to read-only tuples
+        object.__setattr__(self, 'key_indicators', tuple(self.key_indicators))
+        object.__setattr__(self, 'red_flags', tuple(self.red_flags))
+        object.__setattr__(self, 'differential_diagnosis',
+                           tuple(MappingProxyType({k: _pooled(v) for k, v in dx.items()})
+                                 for dx in self.differential_diagnosis))
+        object.__setattr__(self, 'complexity', sys.intern(self.complexity))
+
+        # Share repeated treatment/diagnosis strings ("Paracetamol", "Call 1669", "high") across examples
+        if not isinstance(self.diagnosis, Diagnosis):
+            object.__setattr__(self, 'diagnosis', Diagnosis.from_mapping(self.diagnosis))
+        object.__setattr__(self, 'treatment',
+                           MappingProxyType({k: _pooled(v) for k, v in self.treatment.items()}))
+
+        object.__setattr__(self, '_ki_lower', tuple(indicator.lower() for indicator in self.key_indicators))
+        object.__setattr__(self, '_red_flags_lower', tuple(flag.lower() for flag in self.red_flags))
+        object.__setattr__(self, '_symptoms_thai_lower', self.symptoms_thai.lower())
+        object.__setattr__(self, '_domain_value', sys.intern(self.domain.value))
+        object.__setattr__(self, '_treatment_str', json.dumps(dict(self.treatment), indent=2, ensure_ascii=False, default=str))
+
+class _DomainExamples(Dict[MedicalDomain, List[FewShotExample]]):
+    """Domain -> examples; a domain's examples are built by its factory on first access
+
+    Domains without a factory start empty, like a defaultdict(list). on_load runs once
+    per domain, right after its examples are stored.
+    """
+
+    def __init__(self, factories: Mapping[MedicalDomain, Callable[[], List[FewShotExample]]],
+                 on_load: Callable[[MedicalDomain], None]):
+        super().__init__()
+        self._factories = factories
+        self._on_load = on_load
+
+    def __missing__(self, domain: MedicalDomain) -> List[FewShotExample]:
+        factory = self._factories.get(domain)
+        examples = self[domain] = factory() if factory is not None else []
+        self._on_load(domain)
+        return examples
+
+    def load_all(self) -> None:
+        """Build every domain that has a factory (in factory order)"""
+        for domain in self._factories:
+            self[domain]  # __missing__ builds and stores it
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _indicator_hit_kernel(offsets, term_ids, query_flags):
+        """Per-example indicator hit counts over CSR rows (offsets/term_ids) - no Python objects inside"""
+        n_examples = offsets.shape[0] - 1
+        hits = np.zeros(n_examples, dtype=np.int32)
+        for row in range(n_examples):
+            count = 0
+            for j in range(offsets[row], offsets[row + 1]):
+                count += query_flags[term_ids[j]]
+            hits[row] = count
+        return hits
+
+# Domain classification rules in priority order (first matching domain wins)
+_DOMAIN_KEYWORD_RULES: Tuple[Tuple[MedicalDomain, Tuple[str, ...]], ...] = (
+    (MedicalDomain.CARDIOVASCULAR, ('เจ็บหน้าอก', 'ใจเต้น', 'ความดัน', 'ขาบวม')),
+    (MedicalDomain.RESPIRATORY, ('หายใจ', 'ไอ', 'เสียงหวีด', 'ปอด')),
+    (MedicalDomain.GASTROINTESTINAL, ('ปวดท้อง', 'อาเจียน', 'ท้องเสีย', 'ถ่าย')),
+    (MedicalDomain.NEUROLOGICAL, ('ปวดหัว', 'ชัก', 'เดิน', 'พูด', 'สติ')),
+    (MedicalDomain.MUSCULOSKELETAL, ('ปวดข้อ', 'บวม', 'แดง', 'ร้อน')),
+    (MedicalDomain.ENDOCRINE, ('เบาหวาน', 'น้ำตาล', 'ปัสสาวะบ่อย', 'กระหาย')),
+    (MedicalDomain.INFECTIOUS, ('ไข้', 'หนาวสั่น', 'ติดเชื้อ')),
+    (MedicalDomain.PSYCHIATRIC, ('เศร้า', 'วิตก', 'กังวล', 'นอนไม่หลับ')),
+    (MedicalDomain.DERMATOLOGICAL, ('ผื่น', 'คัน', 'แสง')),
+)
+
+def _rank_domain_keywords(rules) -> Dict[str, Tuple[int, MedicalDomain]]:
+    """keyword -> (rule priority, domain); a keyword keeps its earliest rule"""
+    ranked: Dict[str, Tuple[int, MedicalDomain]] = {}
+    for rank, (domain, keywords) in enumerate(rules):
+        for keyword in keywords:
+            ranked.setdefault(keyword, (rank, domain))
+    return ranked
+
+_DOMAIN_KEYWORD_RANK = _rank_domain_keywords(_DOMAIN_KEYWORD_RULES)
+_DOMAIN_MATCHER = KeywordMatcher(_DOMAIN_KEYWORD_RANK)
+
+# RAG example domain rules (diagnosis name + symptoms), same first-match-wins priority
+_RAG_DOMAIN_RULES: Tuple[Tuple[MedicalDomain, Tuple[str, ...]], ...] = (
+    (MedicalDomain.CARDIOVASCULAR, ('heart', 'cardiac', 'หัวใจ', 'หน้าอก')),
+    (MedicalDomain.RESPIRATORY, ('lung', 'respiratory', 'ปอด', 'หายใจ', 'ไอ')),
+    (MedicalDomain.GASTROINTESTINAL, ('stomach', 'ท้อง', 'อาหาร', 'gastro')),
+    (MedicalDomain.NEUROLOGICAL, ('brain', 'neuro', 'สมอง', 'ประสาท')),
+    (MedicalDomain.MUSCULOSKELETAL, ('bone', 'joint', 'กระดูก', 'ข้อ')),
+    (MedicalDomain.ENDOCRINE, ('diabetes', 'thyroid', 'เบาหวาน', 'ไทรอยด์')),
+    (MedicalDomain.INFECTIOUS, ('infection', 'fever', 'ติดเชื้อ', 'ไข้')),
+)
+_RAG_DOMAIN_RANK = _rank_domain_keywords(_RAG_DOMAIN_RULES)
+_RAG_DOMAIN_MATCHER = KeywordMatcher(_RAG_DOMAIN_RANK)
+
+# Safety screens: serious diagnoses must not be suggested for mild presentations
+_RAG_SERIOUS_INDICATORS = ('วัณโรค', 'tuberculosis', 'cancer', 'มะเร็ง', 'stroke', 'heart attack')
+_RAG_MILD_INDICATORS = ('เล็กน้อย', 'mild', '38 องศา', 'สองสามวัน', 'น้ำมูกเขียว')
+_STATIC_SERIOUS_INDICATORS = _RAG_SERIOUS_INDICATORS + ('meningitis', 'เยื่อหุ้มสมอง', 'sepsis', 'brain tumor')
+_STATIC_MILD_INDICATORS = _RAG_MILD_INDICATORS + ('เมื่อย', 'วันเดียว')
+_MENINGITIS_REQUIRED_SYMPTOMS = ('ชัก', 'seizure', 'แข็งทื่อ', 'stiff neck', 'ไข้สูงมาก', 'severe fever')
+
+_MENINGITIS_INDICATORS = ('meningitis', 'เยื่อหุ้มสมอง')
+
+# Safety screen bits: diagnosis-name terms and symptom terms, one flag per indicator list
+_SAFE_RAG_SERIOUS = 1
+_SAFE_STATIC_SERIOUS = 2
+_SAFE_MENINGITIS = 4
+_SAFE_RAG_MILD = 8
+_SAFE_STATIC_MILD = 16
+_SAFE_MENINGITIS_REQUIRED = 32
+
+def _keyword_bits(groups) -> Dict[str, int]:
+    """keyword -> OR of the bits of every indicator list containing it"""
+    bits: Dict[str, int] = {}
+    for bit, keywords in groups:
+        for keyword in keywords:
+            bits[keyword] = bits.get(keyword, 0) | bit
+    return bits
+
+_SAFETY_DIAGNOSIS_BITS = _keyword_bits((
+    (_SAFE_RAG_SERIOUS, _RAG_SERIOUS_INDICATORS),
+    (_SAFE_STATIC_SERIOUS, _STATIC_SERIOUS_INDICATORS),
+    (_SAFE_MENINGITIS, _MENINGITIS_INDICATORS),
+))
+_SAFETY_SYMPTOM_BITS = _keyword_bits((
+    (_SAFE_RAG_MILD, _RAG_MILD_INDICATORS),
+    (_SAFE_STATIC_MILD, _STATIC_MILD_INDICATORS),
+    (_SAFE_MENINGITIS_REQUIRED, _MENINGITIS_REQUIRED_SYMPTOMS),
+))
+_SAFETY_DIAGNOSIS_MATCHER = KeywordMatcher(_SAFETY_DIAGNOSIS_BITS)
+_SAFETY_SYMPTOM_MATCHER = KeywordMatcher(_SAFETY_SYMPTOM_BITS)
+
+def _safety_mask(diagnosis_lower: str, symptoms_lower: str) -> int:
+    """Every safety screen flag for a diagnosis/symptoms pair: one keyword pass per field"""
+    mask = 0
+    for keyword in _SAFETY_DIAGNOSIS_MATCHER.find(diagnosis_lower):
+        mask |= _SAFETY_DIAGNOSIS_BITS[keyword]
+    for keyword in _SAFETY_SYMPTOM_MATCHER.find(symptoms_lower):
+        mask |= _SAFETY_SYMPTOM_BITS[keyword]
+    return mask
+
+# Terms that make a symptom word a key indicator for feedback-learned examples
+_INDICATOR_TERMS = (
+    'ปวด', 'เจ็บ', 'บวม', 'แดง', 'ร้อน', 'ไข้', 'ไอ', 'หายใจ',
+    'ใจเต้น', 'เหงื่อ', 'คลื่นไส้', 'อาเจียน', 'ท้องเสีย',
+    'ปัสสาวะ', 'เศร้า', 'วิตก', 'นอนไม่หลับ', 'เมื่อย'
+)
+# Whole whitespace-delimited word containing any term; the lookbehind anchors each match at a word start
+_INDICATOR_WORD_RE = re.compile(r"(?<!\S)\S*?(?:" + "|".join(map(re.escape, _INDICATOR_TERMS)) + r")\S*")
+
+# Domain-specific confidence boosts, each reading the boost keywords found by one shared scan
+_CLASSIC_ACS = frozenset(('เจ็บหน้าอก', 'ปวดร้าว'))
+_ARTHRITIS_SIGNS = frozenset(('บวม', 'แดง', 'ร้อน'))
+_DIABETES_SIGNS = frozenset(('ปัสสาวะบ่อย', 'กระหายน้ำ', 'น้ำหนักลด'))
+
+def _cardiovascular_boost(hits: Set[str]) -> float:
+    # Higher confidence for classic presentations
+    return 0.1 if _CLASSIC_ACS <= hits else 0.0
+
+def _musculoskeletal_boost(hits: Set[str]) -> float:
+    # Arthritis pattern enhancement
+    return 0.15 if 'ปวดข้อ' in hits and not _ARTHRITIS_SIGNS.isdisjoint(hits) else 0.0
+
+def _endocrine_boost(hits: Set[str]) -> float:
+    # Diabetes pattern enhancement
+    return 0.2 if len(_DIABETES_SIGNS & hits) >= 2 else 0.0
+
+def _emergency_boost(hits: Set[str]) -> float:
+    # Emergency presentations should have high confidence
+    return 0.1
+
+_DOMAIN_ENHANCERS: Mapping[MedicalDomain, Callable[[Set[str]], float]] = MappingProxyType({
+    MedicalDomain.CARDIOVASCULAR: _cardiovascular_boost,
+    MedicalDomain.MUSCULOSKELETAL: _musculoskeletal_boost,
+    MedicalDomain.ENDOCRINE: _endocrine_boost,
+    MedicalDomain.EMERGENCY: _emergency_boost,
+})
+_DOMAIN_BOOST_MATCHER = KeywordMatcher(_CLASSIC_ACS | _ARTHRITIS_SIGNS | _DIABETES_SIGNS | {'ปวดข้อ'})
+
+def _compile_matcher(domain_key: str, vocab: Tuple[str, ...]) -> Callable[[str], Tuple[bool, ...]]:
+    """Generate a straight-line query encoder: one (term in q) flag per vocab column, for a lowercased query
+
+    Terms are embedded via repr(), so feedback-derived text is always a plain string literal.
+    """
+    lines = ["def match(q):", "    return ("]
+    for term in vocab:
+        lines.append(f"        {term!r} in q,")
+    lines.append("    )")
+
+    namespace: Dict[str, Any] = {}
+    exec(compile("\n".join(lines), f"<match_{domain_key}>", "exec"), namespace)
+    return namespace["match"]
+
+# Specialised prompt templates per medical domain (shared, read-only)
+_DOMAIN_TEMPLATES: Mapping[MedicalDomain, str] = MappingProxyType({
+    MedicalDomain.CARDIOVASCULAR: """
+🫀 CARDIOVASCULAR DOMAIN TEMPLATE:
+When analyzing cardiovascular symptoms, consider:
+1. ACUTE CORONARY SYNDROME: Chest pain + radiation + sweating + dyspnea
+2. HEART FAILURE: Edema + orthopnea + fatigue + JVD
+3. HYPERTENSIVE CRISIS: BP >180/120 + end-organ damage
+4. ARRHYTHMIAS: Palpitations + dizziness + syncope
+
+RED FLAGS: Chest pain, severe dyspnea, syncope, severe hypertension
+IMMEDIATE ACTION: ECG, cardiac enzymes, chest X-ray
+""",
+
+    MedicalDomain.RESPIRATORY: """
+🫁 RESPIRATORY DOMAIN TEMPLATE:
+When analyzing respiratory symptoms, consider:
+1. PNEUMONIA: Fever + cough + sputum + chest pain
+2. ASTHMA: Wheezing + dyspnea + triggers + nocturnal symptoms
+3. PNEUMOTHORAX: Sudden dyspnea + unilateral chest pain
+4. PULMONARY EMBOLISM: Sudden dyspnea + chest pain + risk factors
+
+RED FLAGS: Severe dyspnea, hemoptysis, sudden onset, hypoxia
+IMMEDIATE ACTION: Oxygen saturation, chest X-ray, ABG
+""",
+
+    MedicalDomain.GASTROINTESTINAL: """
+🫃 GASTROINTESTINAL DOMAIN TEMPLATE:
+When analyzing GI symptoms, consider:
+1. APPENDICITIS: RLQ pain + fever + McBurney's point
+2. CHOLECYSTITIS: RUQ pain + Murphy's sign + fever
+3. BOWEL OBSTRUCTION: Crampy pain + vomiting + distension
+4. GI BLEEDING: Hematemesis + melena + anemia
+
+RED FLAGS: Severe abdominal pain, rigidity, hematemesis, melena
+IMMEDIATE ACTION: Vitals, CBC, amylase/lipase, imaging
+""",
+
+    MedicalDomain.NEUROLOGICAL: """
+🧠 NEUROLOGICAL DOMAIN TEMPLATE:
+When analyzing neurological symptoms, consider:
+1. STROKE: FAST positive + sudden onset + focal deficit
+2. MENINGITIS: Fever + headache + neck stiffness + altered mental status
+3. SEIZURE: Convulsion + altered consciousness + post-ictal state
+4. MIGRAINE: Throbbing headache + photophobia + aura
+
+RED FLAGS: Sudden severe headache, focal deficit, altered consciousness
+IMMEDIATE ACTION: Neurological exam, glucose, CT brain
+""",
+
+    MedicalDomain.MUSCULOSKELETAL: """
+🦴 MUSCULOSKELETAL DOMAIN TEMPLATE:
+When analyzing MSK symptoms, consider:
+1. OSTEOARTHRITIS: Single joint + morning stiffness + age-related
+2. RHEUMATOID ARTHRITIS: Multiple joints + symmetrical + morning stiffness >1hr
+3. GOUT: Sudden severe joint pain + usually big toe + nocturnal
+4. SEPTIC ARTHRITIS: Hot joint + fever + restricted movement
+
+RED FLAGS: Hot swollen joint + fever, multiple joint involvement
+IMMEDIATE ACTION: Joint examination, ESR/CRP, joint aspiration if indicated
+""",
+
+    MedicalDomain.ENDOCRINE: """
+🔥 ENDOCRINE DOMAIN TEMPLATE:
+When analyzing endocrine symptoms, consider:
+1. DIABETES: Polyuria + polydipsia + polyphagia + hyperglycemia
+2. HYPERTHYROIDISM: Weight loss + palpitations + heat intolerance + tremor
+3. HYPOTHYROIDISM: Weight gain + fatigue + cold intolerance + bradycardia
+4. ADRENAL CRISIS: Hypotension + electrolyte imbalance + altered mental status
+
+RED FLAGS: DKA, thyroid storm, adrenal crisis, severe electrolyte imbalance
+IMMEDIATE ACTION: Blood glucose, electrolytes, thyroid function
+"""
+})
+
+# Common mistake patterns to learn from (shared, read-only)
+_MISTAKE_PATTERNS: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+    "missed_emergency": (
+        "ไม่สังเกตอาการฉุกเฉิน",
+        "ประเมิน urgency ต่ำเกินไป",
+        "ไม่ส่งโรงพยาบาลเมื่อควรส่ง"
+    ),
+    "wrong_category": (
+        "วินิจฉัยผิดหมวดโรค",
+        "คิดเป็นโรคทั่วไปแต่เป็นโรคเฉพาะทาง",
+        "ไม่คิดถึง differential diagnosis"
+    ),
+    "missed_red_flags": (
+        "ไม่สังเกต red flag symptoms",
+        "ไม่ถามอาการเพิ่มเติม",
+        "ไม่ประเมินความรุนแรง"
+    ),
+    "confidence_issues": (
+        "มั่นใจเกินไปในการวินิจฉัยที่ไม่แน่นอน",
+        "มั่นใจต่ำเกินไปในการวินิจฉัยที่ชัดเจน",
+        "ไม่พิจารณาความน่าจะเป็น"
+    )
+})
+
+# Specialised prompt bodies; {domain} is filled in per domain at import, {symptoms} per request
+_COMPLEX_PROMPT_TEMPLATE = """
+🧠 COMPLEX DIAGNOSTIC ANALYSIS - {domain} DOMAIN
+
+ADVANCED DIAGNOSTIC FRAMEWORK:
+
+1️⃣ PATTERN RECOGNITION:
+- Primary symptom cluster analysis
+- Timeline and progression assessment
+- Associated symptoms mapping
+- Risk factor evaluation
+
+2️⃣ DIFFERENTIAL DIAGNOSIS TREE:
+- Most likely diagnosis (>70% confidence)
+- Alternative diagnoses (30-70% confidence)
+- Rare but critical diagnoses (<30% but high risk)
+
+3️⃣ RED FLAG ASSESSMENT:
+- Emergency indicators requiring immediate action
+- Concerning patterns needing urgent evaluation
+- Stable presentations for outpatient management
+
+4️⃣ EVIDENCE-BASED REASONING:
+- Clinical probability scoring
+- Supporting evidence strength
+- Contradictory evidence analysis
+- Uncertainty acknowledgment
+
+PATIENT PRESENTATION:
+{symptoms}
+
+DIAGNOSTIC APPROACH:
+1. Systematically analyze each symptom cluster
+2. Consider temporal relationships and triggers
+3. Apply domain-specific diagnostic criteria
+4. Weight differential diagnoses by probability
+5. Identify any red flags requiring immediate action
+6. Provide confidence intervals for each diagnosis
+7. Recommend next steps based on uncertainty level
+
+CRITICAL THINKING REQUIREMENTS:
+- Question initial impressions
+- Consider multiple diagnostic pathways
+- Acknowledge diagnostic uncertainty
+- Prioritize patient safety over diagnostic confidence
+"""
+
+_EMERGENCY_PROMPT_TEMPLATE = """
+🚨 EMERGENCY DIAGNOSTIC PROTOCOL - {domain}
+
+EMERGENCY ASSESSMENT FRAMEWORK:
+
+⚡ IMMEDIATE TRIAGE (First 30 seconds):
+- Life-threatening conditions (ABCs)
+- Time-critical diagnoses
+- Immediate intervention needs
+
+🎯 RAPID DIFFERENTIAL (Next 2 minutes):
+- Most likely emergency diagnosis
+- Critical alternative diagnoses
+- Benign mimics to exclude
+
+⏰ TIME-SENSITIVE ACTIONS:
+- Immediate interventions required
+- Diagnostic tests needed urgently
+- Specialist consultation triggers
+
+🔴 RED FLAG IDENTIFICATION:
+- Cardiovascular: Chest pain + radiation + hemodynamic instability
+- Neurological: Focal deficits + altered consciousness + sudden onset
+- Respiratory: Severe dyspnea + hypoxia + asymmetric findings
+- GI: Severe pain + hematemesis/melena + hemodynamic compromise
+
+PATIENT PRESENTATION:
+{symptoms}
+
+EMERGENCY ANALYSIS PROTOCOL:
+1. IMMEDIATE THREAT ASSESSMENT: Life/limb/organ threatening?
+2. RAPID PATTERN RECOGNITION: Classic emergency presentations?
+3. CRITICAL DECISION POINTS: Admit/discharge/urgent referral?
+4. TIME-SENSITIVE INTERVENTIONS: What cannot wait?
+5. DIFFERENTIAL PRIORITIES: Most dangerous diagnosis first
+6. SAFETY NET: What could we be missing?
+
+RESPONSE FORMAT:
+- Emergency Level: CRITICAL/HIGH/MODERATE/LOW
+- Immediate Actions: [List 3 most urgent steps]
+- Primary Diagnosis: [Most likely with confidence %]
+- Cannot Miss: [Dangerous alternatives to exclude]
+- Timeline: [How quickly must this be addressed?]
+"""
+
+_DIFFERENTIAL_PROMPT_TEMPLATE = """
+🎯 DIFFERENTIAL DIAGNOSIS GENERATOR - {domain}
+
+SYSTEMATIC DIFFERENTIAL APPROACH:
+
+📊 SYMPTOM CLUSTER ANALYSIS:
+Primary Symptoms: [Extract key symptoms]
+Secondary Symptoms: [Supporting symptoms]
+Timeline: [Acute/subacute/chronic]
+Context: [Triggers, precipitants, associations]
+
+🔄 DIFFERENTIAL CATEGORIES:
+
+1️⃣ MOST LIKELY (Confidence >70%):
+- Common presentations in this domain
+- Classic symptom patterns
+- Epidemiologically probable
+
+2️⃣ POSSIBLE (Confidence 30-70%):
+- Atypical presentations of common conditions
+- Less common but plausible diagnoses
+- Symptom overlap scenarios
+
+3️⃣ CANNOT MISS (Confidence <30% but critical):
+- Life-threatening conditions
+- Progressive/irreversible conditions
+- Conditions requiring immediate intervention
+
+4️⃣ RARE BUT RELEVANT:
+- Zebra diagnoses worth considering
+- Condition-specific risk factors present
+- Unusual presentations of serious conditions
+
+PATIENT SYMPTOMS:
+{symptoms}
+
+DIFFERENTIAL GENERATION PROCESS:
+1. Identify dominant symptom pattern
+2. List all conditions that could cause this pattern
+3. Rank by probability in this patient population
+4. Separate "common" from "cannot miss" diagnoses
+5. Consider atypical presentations
+6. Factor in patient demographics and risk factors
+7. Acknowledge diagnostic uncertainty
+
+OUTPUT STRUCTURE:
+- Primary Diagnosis: [Most likely with reasoning]
+- Active Differentials: [2-3 strong alternatives]
+- Cannot Miss: [Critical conditions to exclude]
+- Working Diagnosis Confidence: [Percentage]
+- Next Diagnostic Steps: [Tests/examinations needed]
+- Red Flags to Monitor: [Warning signs to watch for]
+"""
+
+def _prerender_specialized_prompts() -> Mapping[Tuple[str, MedicalDomain], Tuple[str, str]]:
+    """(kind, domain) -> text before/after the symptoms, so a request is one concatenation"""
+    templates = {
+        "complex": _COMPLEX_PROMPT_TEMPLATE,
+        "emergency": _EMERGENCY_PROMPT_TEMPLATE,
+        "differential": _DIFFERENTIAL_PROMPT_TEMPLATE,
+    }
+    rendered: Dict[Tuple[str, MedicalDomain], Tuple[str, str]] = {}
+    for kind, template in templates.items():
+        head, tail = template.split("{symptoms}")
+        for domain in MedicalDomain:
+            rendered[(kind, domain)] = (head.replace("{domain}", domain.value.upper()), tail)
+    return MappingProxyType(rendered)
+
+_SPECIALIZED_PROMPTS = _prerender_specialized_prompts()
 
 class AdvancedFewShotLearning:
     """Advanced few-shot learning system with comprehensive medical examples"""
 
     def __init__(self):
-        self.examples = self._initialize_comprehensive_examples()
-        self.domain_templates = self._create_domain_templates()
-        self.mistake_patterns = self._initialize_mistake_patterns()
+        factories = self._example_factories()
+        # A domain's examples and indicator matrix are both built on its first lookup
+        self.examples = _DomainExamples(factories, on_load=self._build_indicator_matrix)
+        self.domain_templates = _DOMAIN_TEMPLATES
+        self.mistake_patterns = _MISTAKE_PATTERNS
+        self._indicator_vocab: Dict[MedicalDomain, Tuple[str, ...]] = {}
+        self._indicator_matrix: Dict[MedicalDomain, np.ndarray] = {}
+        self._indicator_csr: Dict[MedicalDomain, Tuple[np.ndarray, np.ndarray]] = {}
+        self._matchers: Dict[MedicalDomain, Callable[[str], Tuple[bool, ...]]] = {}
+
+        # Per-instance so update_examples_from_feedback can invalidate it
+        self._few_shot_prompt_cache = lru_cache(maxsize=512)(self._build_few_shot_prompt)
+
+        # Opt-in so tests and short-lived scripts skip the extra startup work
+        if os.getenv("FEWSHOT_WARMUP", "0") == "1":
+            self.warmup()
 
-        logger.info(f"🧠 Advanced Few-Shot Learning initialized with {len(self.examples)} examples")
+        logger.info("🧠 Advanced Few-Shot Learning initialized with %d example domains (built on first use)",
+                    len(factories))
 
-    def _initialize_comprehensive_examples(self) -> Dict[str, List[FewShotExample]]:
-        """Initialize comprehensive few-shot examples across all medical domains"""
+    def _example_factories(self) -> Dict[MedicalDomain, Callable[[], List[FewShotExample]]]:
+        """Per-domain builders for the comprehensive few-shot examples (called on first access)"""
 
         return {
             # CARDIOVASCULAR DOMAIN
-            "cardiovascular": [
+            MedicalDomain.CARDIOVASCULAR: lambda: [
                 FewShotExample(
                     id="cv_001",
                     domain=MedicalDomain.CARDIOVASCULAR,
@@ -83,13 +614,13 @@ class AdvancedFewShotLearning:
                         "hospital": ["PCI within 90min", "Thrombolysis", "Cardiac monitoring"],
                         "medications": ["Dual antiplatelet", "Beta blocker", "ACE inhibitor", "Statin"]
                     },
-                    key_indicators=["เจ็บหน้าอกกลาง", "ปวดร้าวไปแขน", "หายใจลำบาก", "เหงื่อแตก"],
+                    key_indicators=("เจ็บหน้าอกกลาง", "ปวดร้าวไปแขน", "หายใจลำบาก", "เหงื่อแตก"),
                     differential_diagnosis=[
                         {"name": "Unstable Angina", "icd": "I20.0"},
                         {"name": "Aortic Dissection", "icd": "I71.00"},
                         {"name": "Pulmonary Embolism", "icd": "I26.9"}
                     ],
-                    red_flags=["เจ็บหน้าอกรุนแรง", "เหงื่อแตกเย็น", "ปวดร้าวไปแขน"],
+                    red_flags=("เจ็บหน้าอกรุนแรง", "เหงื่อแตกเย็น", "ปวดร้าวไปแขน"),
                     confidence_level=0.95,
                     complexity="complex",
                     learning_notes="ไม่ผิดพลาดได้ - ต้องส่งโรงพยาบาลทันที"
@@ -111,12 +642,12 @@ class AdvancedFewShotLearning:
                         "medications": ["Nifedipine", "Labetalol", "Hydralazine"],
                         "target": "Reduce BP by 10-20% in first hour"
                     },
-                    key_indicators=["ปวดหัว", "ตาพร่า", "ความดันสูงมาก"],
+                    key_indicators=("ปวดหัว", "ตาพร่า", "ความดันสูงมาก"),
                     differential_diagnosis=[
                         {"name": "Stroke", "icd": "I64"},
                         {"name": "Kidney disease", "icd": "N18.9"}
                     ],
-                    red_flags=["ความดัน > 180/120", "อาการทางสมอง"],
+                    red_flags=("ความดัน > 180/120", "อาการทางสมอง"),
                     confidence_level=0.90,
                     complexity="moderate",
                     learning_notes="ความดันสูงมากกับอาการ = วิกฤต"
@@ -137,12 +668,12 @@ class AdvancedFewShotLearning:
                         "medications": ["ACE inhibitor", "Diuretics", "Beta blocker"],
                         "lifestyle": ["Salt restriction", "Fluid restriction", "Weight monitoring"]
                     },
-                    key_indicators=["ขาบวม", "หายใจลำบากเมื่อนอน", "อ่อนเพลีย"],
+                    key_indicators=("ขาบวม", "หายใจลำบากเมื่อนอน", "อ่อนเพลีย"),
                     differential_diagnosis=[
                         {"name": "Kidney disease", "icd": "N18.9"},
                         {"name": "Liver disease", "icd": "K72.9"}
                     ],
-                    red_flags=["หายใจลำบากรุนแรง", "ไอเป็นเลือด"],
+                    red_flags=("หายใจลำบากรุนแรง", "ไอเป็นเลือด"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="ขาบวม + หายใจลำบาก = หัวใจล้มเหลว"
@@ -150,7 +681,7 @@ class AdvancedFewShotLearning:
             ],
 
             # RESPIRATORY DOMAIN
-            "respiratory": [
+            MedicalDomain.RESPIRATORY: lambda: [
                 # COMMON CONDITIONS FIRST - Critical to prevent serious mismatches
                 FewShotExample(
                     id="resp_common_001",
@@ -168,12 +699,12 @@ class AdvancedFewShotLearning:
                         "supportive": ["Rest", "Fluids", "Warm compress"],
                         "duration": "7-10 days self-limiting"
                     },
-                    key_indicators=["ไข้เล็กน้อย", "ไข้ 38", "ไอแห้ง", "น้ำมูกเขียว", "สองสามวัน", "มาสองสามวัน"],
+                    key_indicators=("ไข้เล็กน้อย", "ไข้ 38", "ไอแห้ง", "น้ำมูกเขียว", "สองสามวัน", "มาสองสามวัน"),
                     differential_diagnosis=[
                         {"name": "Viral rhinitis", "icd": "J00"},
                         {"name": "Allergic rhinitis", "icd": "J30.9"}
                     ],
-                    red_flags=["ไข้สูงเกิน 39", "หายใจลำบาก", "เจ็บหน้าอกมาก"],
+                    red_flags=("ไข้สูงเกิน 39", "หายใจลำบาก", "เจ็บหน้าอกมาก"),
                     confidence_level=0.95,
                     complexity="simple",
                     learning_notes="ไข้เล็กน้อย + ไอแห้ง + น้ำมูกเขียว + สองสามวัน = หวัดธรรมดา"
@@ -195,12 +726,12 @@ class AdvancedFewShotLearning:
                         "supportive": ["Bed rest", "Hydration", "Isolation"],
                         "complications": "Monitor for pneumonia"
                     },
-                    key_indicators=["ไข้", "ไอ", "เสมหะเหลือง", "เมื่อยตัว", "ไม่ได้กลิ่น"],
+                    key_indicators=("ไข้", "ไอ", "เสมหะเหลือง", "เมื่อยตัว", "ไม่ได้กลิ่น"),
                     differential_diagnosis=[
                         {"name": "Common cold", "icd": "J00"},
                         {"name": "COVID-19", "icd": "U07.1"}
                     ],
-                    red_flags=["หายใจลำบาก", "ไข้สูงติดต่อ", "ปวดหน้าอกมาก"],
+                    red_flags=("หายใจลำบาก", "ไข้สูงติดต่อ", "ปวดหน้าอกมาก"),
                     confidence_level=0.90,
                     complexity="simple",
                     learning_notes="ไข้ + ไอ + เสมหะ + เมื่อย + ไม่ได้กลิ่น = ไข้หวัดใหญ่"
@@ -221,12 +752,12 @@ class AdvancedFewShotLearning:
                         "immediate": ["Oxygen", "Chest X-ray", "Needle decompression if tension"],
                         "definitive": ["Chest tube insertion", "Monitor"]
                     },
-                    key_indicators=["หายใจลำบากฉับพลัน", "เจ็บหน้าอกข้างเดียว"],
+                    key_indicators=("หายใจลำบากฉับพลัน", "เจ็บหน้าอกข้างเดียว"),
                     differential_diagnosis=[
                         {"name": "Pulmonary embolism", "icd": "I26.9"},
                         {"name": "MI", "icd": "I21.9"}
                     ],
-                    red_flags=["หายใจลำบากรุนแรง", "ความดันตก"],
+                    red_flags=("หายใจลำบากรุนแรง", "ความดันตก"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="หายใจลำบากฉับพลัน + เจ็บข้างเดียว = ปอดแฟบ"
@@ -248,12 +779,12 @@ class AdvancedFewShotLearning:
                         "medications": ["RIPE therapy 6 months", "DOT"],
                         "isolation": "Respiratory precautions"
                     },
-                    key_indicators=["ไอเป็นเลือด", "ไข้", "น้ำหนักลด", "เหงื่อกลางคืน"],
+                    key_indicators=("ไอเป็นเลือด", "ไข้", "น้ำหนักลด", "เหงื่อกลางคืน"),
                     differential_diagnosis=[
                         {"name": "Lung cancer", "icd": "C78.00"},
                         {"name": "Pneumonia", "icd": "J18.9"}
                     ],
-                    red_flags=["ไอเป็นเลือดต่อเนื่อง", "น้ำหนักลดมาก"],
+                    red_flags=("ไอเป็นเลือดต่อเนื่อง", "น้ำหนักลดมาก"),
                     confidence_level=0.70,
                     complexity="complex",
                     learning_notes="ไอเป็นเลือด + ไข้นาน + น้ำหนักลดมาก + เหงื่อกลางคืน = วัณโรค (ต้องมีไอเลือด!)"
@@ -275,12 +806,12 @@ class AdvancedFewShotLearning:
                         "maintenance": ["ICS", "LABA", "Trigger avoidance"],
                         "education": "Inhaler technique, Action plan"
                     },
-                    key_indicators=["หอบหืด", "เสียงหวีด", "ไอกลางคืน"],
+                    key_indicators=("หอบหืด", "เสียงหวีด", "ไอกลางคืน"),
                     differential_diagnosis=[
                         {"name": "COPD", "icd": "J44.9"},
                         {"name": "Heart failure", "icd": "I50.9"}
                     ],
-                    red_flags=["หายใจลำบากรุนแรง", "พูดไม่ได้"],
+                    red_flags=("หายใจลำบากรุนแรง", "พูดไม่ได้"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="หวีด + ไอกลางคืน + ทำให้หายใจขาด = หืด"
@@ -288,7 +819,7 @@ class AdvancedFewShotLearning:
             ],
 
             # GASTROINTESTINAL DOMAIN
-            "gastrointestinal": [
+            MedicalDomain.GASTROINTESTINAL: lambda: [
                 FewShotExample(
                     id="gi_001",
                     domain=MedicalDomain.GASTROINTESTINAL,
@@ -304,12 +835,12 @@ class AdvancedFewShotLearning:
                         "immediate": ["NPO", "IV fluids", "Pain control", "Antibiotics"],
                         "definitive": ["Appendectomy", "Laparoscopic preferred"]
                     },
-                    key_indicators=["ปวดท้องน้อยขวา", "มีไข้", "ปวดเมื่อกด"],
+                    key_indicators=("ปวดท้องน้อยขวา", "มีไข้", "ปวดเมื่อกด"),
                     differential_diagnosis=[
                         {"name": "Ovarian cyst", "icd": "N83.2"},
                         {"name": "UTI", "icd": "N39.0"}
                     ],
-                    red_flags=["ปวดรุนแรงฉับพลัน", "ไข้สูง", "ท้องแข็ง"],
+                    red_flags=("ปวดรุนแรงฉับพลัน", "ไข้สูง", "ท้องแข็ง"),
                     confidence_level=0.90,
                     complexity="moderate",
                     learning_notes="ปวดท้องขวาล่าง + ไข้ + กด = ไส้ติ่ง"
@@ -331,12 +862,12 @@ class AdvancedFewShotLearning:
                         "medications": ["Antibiotics", "ORS", "Probiotics"],
                         "monitoring": "Hydration status"
                     },
-                    key_indicators=["ถ่ายเป็นเลือด", "ท้องเสีย", "ไข้"],
+                    key_indicators=("ถ่ายเป็นเลือด", "ท้องเสีย", "ไข้"),
                     differential_diagnosis=[
                         {"name": "IBD", "icd": "K51.9"},
                         {"name": "Colon cancer", "icd": "C18.9"}
                     ],
-                    red_flags=["เลือดมาก", "ขาดน้ำ", "ไข้สูง"],
+                    red_flags=("เลือดมาก", "ขาดน้ำ", "ไข้สูง"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="ถ่ายเลือด + ไข้ + ท้องเสีย = ติดเชื้อลำไส้"
@@ -358,12 +889,12 @@ class AdvancedFewShotLearning:
                         "lifestyle": ["Avoid spicy food", "Small meals", "No alcohol"],
                         "follow_up": "2 weeks if no improvement"
                     },
-                    key_indicators=["ปวดท้องบน", "แสบกลางอก", "อาหารไม่ย่อย"],
+                    key_indicators=("ปวดท้องบน", "แสบกลางอก", "อาหารไม่ย่อย"),
                     differential_diagnosis=[
                         {"name": "Peptic ulcer", "icd": "K27.9"},
                         {"name": "GERD", "icd": "K21.9"}
                     ],
-                    red_flags=["อาเจียนเป็นเลือด", "ถ่ายดำ", "น้ำหนักลด"],
+                    red_flags=("อาเจียนเป็นเลือด", "ถ่ายดำ", "น้ำหนักลด"),
                     confidence_level=0.80,
                     complexity="simple",
                     learning_notes="ปวดท้องบน + แสบ + ท้องอืด = กระเพาะ"
@@ -371,7 +902,7 @@ class AdvancedFewShotLearning:
             ],
 
             # NEUROLOGICAL DOMAIN
-            "neurological": [
+            MedicalDomain.NEUROLOGICAL: lambda: [
                 FewShotExample(
                     id="neuro_001",
                     domain=MedicalDomain.NEUROLOGICAL,
@@ -388,12 +919,12 @@ class AdvancedFewShotLearning:
                         "acute": ["Thrombolysis if <4.5hr", "Aspirin", "Monitor"],
                         "rehab": "Physical therapy, Speech therapy"
                     },
-                    key_indicators=["อ่อนแรงครึ่งซีก", "พูดไม่ชัด", "หน้าเบี้ยว"],
+                    key_indicators=("อ่อนแรงครึ่งซีก", "พูดไม่ชัด", "หน้าเบี้ยว"),
                     differential_diagnosis=[
                         {"name": "TIA", "icd": "G93.1"},
                         {"name": "Brain tumor", "icd": "C71.9"}
                     ],
-                    red_flags=["FAST positive", "อาการฉับพลัน"],
+                    red_flags=("FAST positive", "อาการฉับพลัน"),
                     confidence_level=0.95,
                     complexity="complex",
                     learning_notes="FAST + อาการฉับพลัน = stroke ส่งทันที"
@@ -414,12 +945,12 @@ class AdvancedFewShotLearning:
                         "immediate": ["Call 1669", "CT brain", "Lumbar puncture if CT negative"],
                         "management": ["ICU", "Nimodipine", "Aneurysm clipping/coiling"]
                     },
-                    key_indicators=["ปวดหัวรุนแรงสุด", "ฉับพลัน", "กลัวแสง"],
+                    key_indicators=("ปวดหัวรุนแรงสุด", "ฉับพลัน", "กลัวแสง"),
                     differential_diagnosis=[
                         {"name": "Migraine", "icd": "G43.9"},
                         {"name": "Meningitis", "icd": "G03.9"}
                     ],
-                    red_flags=["thunderclap headache", "ปวดหัวรุนแรงสุด"],
+                    red_flags=("thunderclap headache", "ปวดหัวรุนแรงสุด"),
                     confidence_level=0.90,
                     complexity="complex",
                     learning_notes="ปวดหัวรุนแรงสุดในชีวิต = เลือดออกในสมอง"
@@ -440,12 +971,12 @@ class AdvancedFewShotLearning:
                         "immediate": ["Antibiotics IV", "Dexamethasone", "Seizure control"],
                         "investigations": ["Lumbar puncture", "Blood culture", "CT brain"]
                     },
-                    key_indicators=["ชัก", "ไข้", "ปวดหัว", "คอแข็ง"],
+                    key_indicators=("ชัก", "ไข้", "ปวดหัว", "คอแข็ง"),
                     differential_diagnosis=[
                         {"name": "Encephalitis", "icd": "G04.9"},
                         {"name": "Brain abscess", "icd": "G06.0"}
                     ],
-                    red_flags=["ชัก + ไข้", "คอแข็ง", "ผื่นไม่หาย"],
+                    red_flags=("ชัก + ไข้", "คอแข็ง", "ผื่นไม่หาย"),
                     confidence_level=0.85,
                     complexity="complex",
                     learning_notes="ชัก + ไข้ + ปวดหัว = เยื่อหุ้มสมอง"
@@ -453,7 +984,7 @@ class AdvancedFewShotLearning:
             ],
 
             # MUSCULOSKELETAL DOMAIN
-            "musculoskeletal": [
+            MedicalDomain.MUSCULOSKELETAL: lambda: [
                 FewShotExample(
                     id="msk_001",
                     domain=MedicalDomain.MUSCULOSKELETAL,
@@ -470,12 +1001,12 @@ class AdvancedFewShotLearning:
                         "non_pharmacological": ["Physio", "Weight loss", "Heat/cold therapy"],
                         "advanced": ["Intra-articular injection", "Joint replacement"]
                     },
-                    key_indicators=["ปวดข้อ", "บวม", "แดง", "ร้อน", "ข้อติด"],
+                    key_indicators=("ปวดข้อ", "บวม", "แดง", "ร้อน", "ข้อติด"),
                     differential_diagnosis=[
                         {"name": "Rheumatoid arthritis", "icd": "M06.9"},
                         {"name": "Gout", "icd": "M10.9"}
                     ],
-                    red_flags=["ข้อหลายข้อ", "ไข้", "น้ำหนักลด"],
+                    red_flags=("ข้อหลายข้อ", "ไข้", "น้ำหนักลด"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="ข้อเดียว + บวมแดงร้อน + ติดเช้า = ข้ออักเสบ"
@@ -497,12 +1028,12 @@ class AdvancedFewShotLearning:
                         "monitoring": ["Liver function", "Blood count", "CRP/ESR"],
                         "lifestyle": ["Joint protection", "Exercise", "Rest during flares"]
                     },
-                    key_indicators=["หลายข้อ", "มีไข้", "สลับกัน", "เช้ามาก"],
+                    key_indicators=("หลายข้อ", "มีไข้", "สลับกัน", "เช้ามาก"),
                     differential_diagnosis=[
                         {"name": "SLE", "icd": "M32.9"},
                         {"name": "Psoriatic arthritis", "icd": "M07.3"}
                     ],
-                    red_flags=["ข้อพังทลาย", "อวัยวะอื่นเกี่ยว"],
+                    red_flags=("ข้อพังทลาย", "อวัยวะอื่นเกี่ยว"),
                     confidence_level=0.80,
                     complexity="complex",
                     learning_notes="หลายข้อ + ไข้ + สลับ + เช้า = รูมาตอยด์"
@@ -524,12 +1055,12 @@ class AdvancedFewShotLearning:
                         "chronic": ["Allopurinol", "Lifestyle modification"],
                         "lifestyle": ["Low purine diet", "Alcohol reduction", "Weight loss"]
                     },
-                    key_indicators=["นิ้วเท้า", "บวมแดงมาก", "ฉับพลัน", "กลางคืน"],
+                    key_indicators=("นิ้วเท้า", "บวมแดงมาก", "ฉับพลัน", "กลางคืน"),
                     differential_diagnosis=[
                         {"name": "Septic arthritis", "icd": "M00.9"},
                         {"name": "Pseudogout", "icd": "M11.9"}
                     ],
-                    red_flags=["ข้อติดเชื้อ", "ไข้สูง"],
+                    red_flags=("ข้อติดเชื้อ", "ไข้สูง"),
                     confidence_level=0.90,
                     complexity="moderate",
                     learning_notes="นิ้วเท้า + บวมแดงมาก + ฉับพลัน = เกาต์"
@@ -537,7 +1068,7 @@ class AdvancedFewShotLearning:
             ],
 
             # ENDOCRINE DOMAIN
-            "endocrine": [
+            MedicalDomain.ENDOCRINE: lambda: [
                 FewShotExample(
                     id="endo_001",
                     domain=MedicalDomain.ENDOCRINE,
@@ -554,12 +1085,12 @@ class AdvancedFewShotLearning:
                         "long_term": ["Metformin", "Lifestyle modification", "HbA1c monitoring"],
                         "complications": ["Eye, Kidney, Foot screening"]
                     },
-                    key_indicators=["น้ำตาลสูง", "ปัสสาวะบ่อย", "กระหายน้ำ", "น้ำหนักลด"],
+                    key_indicators=("น้ำตาลสูง", "ปัสสาวะบ่อย", "กระหายน้ำ", "น้ำหนักลด"),
                     differential_diagnosis=[
                         {"name": "Type 1 DM", "icd": "E10.9"},
                         {"name": "MODY", "icd": "E13.9"}
                     ],
-                    red_flags=["DKA", "HHS", "น้ำตาล > 400"],
+                    red_flags=("DKA", "HHS", "น้ำตาล > 400"),
                     confidence_level=0.95,
                     complexity="moderate",
                     learning_notes="3P + น้ำตาลสูง = เบาหวาน"
@@ -581,12 +1112,12 @@ class AdvancedFewShotLearning:
                         "long_term": ["Multiple insulin regimen", "Carb counting", "CGM"],
                         "education": "Insulin technique, Hypoglycemia recognition"
                     },
-                    key_indicators=["น้ำหนักลดเร็ว", "อายุน้อย", "ผอมบาง"],
+                    key_indicators=("น้ำหนักลดเร็ว", "อายุน้อย", "ผอมบาง"),
                     differential_diagnosis=[
                         {"name": "LADA", "icd": "E10.9"},
                         {"name": "Hyperthyroid", "icd": "E05.9"}
                     ],
-                    red_flags=["DKA", "ketones", "อาเจียน"],
+                    red_flags=("DKA", "ketones", "อาเจียน"),
                     confidence_level=0.85,
                     complexity="complex",
                     learning_notes="น้ำหนักลดเร็ว + อายุน้อย = เบาหวาน type 1"
@@ -608,12 +1139,12 @@ class AdvancedFewShotLearning:
                         "medications": ["Methimazole", "Propranolol", "RAI"],
                         "monitoring": "Thyroid function, Liver function"
                     },
-                    key_indicators=["ใจสั่น", "น้ำหนักลด", "ร้อน", "มือสั่น"],
+                    key_indicators=("ใจสั่น", "น้ำหนักลด", "ร้อน", "มือสั่น"),
                     differential_diagnosis=[
                         {"name": "Anxiety disorder", "icd": "F41.9"},
                         {"name": "Pheo", "icd": "E27.5"}
                     ],
-                    red_flags=["thyroid storm", "ไข้สูง", "สับสน"],
+                    red_flags=("thyroid storm", "ไข้สูง", "สับสน"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="ใจสั่น + ลดน้ำหนัก + ร้อน = ไทรอยด์เป็นพิษ"
@@ -621,7 +1152,7 @@ class AdvancedFewShotLearning:
             ],
 
             # INFECTIOUS DISEASE DOMAIN
-            "infectious": [
+            MedicalDomain.INFECTIOUS: lambda: [
                 FewShotExample(
                     id="inf_001",
                     domain=MedicalDomain.INFECTIOUS,
@@ -638,12 +1169,12 @@ class AdvancedFewShotLearning:
                         "medications": ["Empirical antibiotics", "Based on culture sensitivity"],
                         "supportive": "Hydration, Pain control"
                     },
-                    key_indicators=["ไข้", "ปัสสาวะขุ่น", "กลิ่นเน่า", "ปัสสาวะบ่อย"],
+                    key_indicators=("ไข้", "ปัสสาวะขุ่น", "กลิ่นเน่า", "ปัสสาวะบ่อย"),
                     differential_diagnosis=[
                         {"name": "Pyelonephritis", "icd": "N10"},
                         {"name": "Urethritis", "icd": "N34.1"}
                     ],
-                    red_flags=["ไข้สูง", "ปวดข้าง", "คลื่นไส้"],
+                    red_flags=("ไข้สูง", "ปวดข้าง", "คลื่นไส้"),
                     confidence_level=0.90,
                     complexity="simple",
                     learning_notes="ไข้ + ปัสสาวะผิดปกติ = UTI"
@@ -665,12 +1196,12 @@ class AdvancedFewShotLearning:
                         "investigations": ["Lumbar puncture", "Blood culture", "CT brain"],
                         "prophylaxis": "Close contacts"
                     },
-                    key_indicators=["ไข้สูง", "ผื่นไม่หาย", "คอแข็ง"],
+                    key_indicators=("ไข้สูง", "ผื่นไม่หาย", "คอแข็ง"),
                     differential_diagnosis=[
                         {"name": "Viral meningitis", "icd": "A87.9"},
                         {"name": "Sepsis", "icd": "A41.9"}
                     ],
-                    red_flags=["ผื่นไม่หาย", "ชัก", "สติเสื่อม"],
+                    red_flags=("ผื่นไม่หาย", "ชัก", "สติเสื่อม"),
                     confidence_level=0.95,
                     complexity="complex",
                     learning_notes="ไข้ + ผื่นไม่หาย + คอแข็ง = เยื่อหุ้มสมอง"
@@ -678,7 +1209,7 @@ class AdvancedFewShotLearning:
             ],
 
             # PSYCHIATRIC DOMAIN
-            "psychiatric": [
+            MedicalDomain.PSYCHIATRIC: lambda: [
                 FewShotExample(
                     id="psych_001",
                     domain=MedicalDomain.PSYCHIATRIC,
@@ -695,12 +1226,12 @@ class AdvancedFewShotLearning:
                         "medications": ["SSRIs", "SNRIs", "Psychotherapy"],
                         "follow_up": "Close monitoring, Psychiatrist referral"
                     },
-                    key_indicators=["เศร้า", "ไม่มีแรง", "สิ้นหวัง", "คิดทำร้าย"],
+                    key_indicators=("เศร้า", "ไม่มีแรง", "สิ้นหวัง", "คิดทำร้าย"),
                     differential_diagnosis=[
                         {"name": "Bipolar disorder", "icd": "F31.9"},
                         {"name": "Adjustment disorder", "icd": "F43.2"}
                     ],
-                    red_flags=["คิดฆ่าตัวตาย", "แผนการทำร้าย"],
+                    red_flags=("คิดฆ่าตัวตาย", "แผนการทำร้าย"),
                     confidence_level=0.85,
                     complexity="moderate",
                     learning_notes="เศร้า + สิ้นหวัง + คิดทำร้าย = ซึมเศร้าร้ายแรง"
@@ -722,12 +1253,12 @@ class AdvancedFewShotLearning:
                         "long_term": ["CBT", "SSRIs", "Exposure therapy"],
                         "education": "Panic attack education, Trigger identification"
                     },
-                    key_indicators=["วิตกรุนแรง", "ใจเต้นเร็ว", "หายใจเร็ว", "กลัวตาย"],
+                    key_indicators=("วิตกรุนแรง", "ใจเต้นเร็ว", "หายใจเร็ว", "กลัวตาย"),
                     differential_diagnosis=[
                         {"name": "GAD", "icd": "F41.1"},
                         {"name": "Cardiac arrhythmia", "icd": "I49.9"}
                     ],
-                    red_flags=["อาการหัวใจ", "หายใจไม่ออก"],
+                    red_flags=("อาการหัวใจ", "หายใจไม่ออก"),
                     confidence_level=0.80,
                     complexity="moderate",
                     learning_notes="วิตก + ใจเต้น + หายใจเร็ว + กลัวตาย = แพนิค"
@@ -735,121 +1266,44 @@ class AdvancedFewShotLearning:
             ]
         }
 
-    def _create_domain_templates(self) -> Dict[str, str]:
-        """Create specialized templates for each medical domain"""
-
-        return {
-            "cardiovascular": """
-🫀 CARDIOVASCULAR DOMAIN TEMPLATE:
-When analyzing cardiovascular symptoms, consider:
-1. ACUTE CORONARY SYNDROME: Chest pain + radiation + sweating + dyspnea
-2. HEART FAILURE: Edema + orthopnea + fatigue + JVD
-3. HYPERTENSIVE CRISIS: BP >180/120 + end-organ damage
-4. ARRHYTHMIAS: Palpitations + dizziness + syncope
-
-RED FLAGS: Chest pain, severe dyspnea, syncope, severe hypertension
-IMMEDIATE ACTION: ECG, cardiac enzymes, chest X-ray
-""",
-
-            "respiratory": """
-🫁 RESPIRATORY DOMAIN TEMPLATE:
-When analyzing respiratory symptoms, consider:
-1. PNEUMONIA: Fever + cough + sputum + chest pain
-2. ASTHMA: Wheezing + dyspnea + triggers + nocturnal symptoms
-3. PNEUMOTHORAX: Sudden dyspnea + unilateral chest pain
-4. PULMONARY EMBOLISM: Sudden dyspnea + chest pain + risk factors
-
-RED FLAGS: Severe dyspnea, hemoptysis, sudden onset, hypoxia
-IMMEDIATE ACTION: Oxygen saturation, chest X-ray, ABG
-""",
+    def _build_indicator_matrix(self, domain: MedicalDomain) -> None:
+        """Bag-of-indicators matrix (examples x vocab) plus the generated query encoder for one domain"""
 
-            "gastrointestinal": """
-🫃 GASTROINTESTINAL DOMAIN TEMPLATE:
-When analyzing GI symptoms, consider:
-1. APPENDICITIS: RLQ pain + fever + McBurney's point
-2. CHOLECYSTITIS: RUQ pain + Murphy's sign + fever
-3. BOWEL OBSTRUCTION: Crampy pain + vomiting + distension
-4. GI BLEEDING: Hematemesis + melena + anemia
+        domain_examples = self.examples[domain]
+        vocab = tuple(dict.fromkeys(indicator for example in domain_examples for indicator in example._ki_lower))
+        column = {term: j for j, term in enumerate(vocab)}
 
-RED FLAGS: Severe abdominal pain, rigidity, hematemesis, melena
-IMMEDIATE ACTION: Vitals, CBC, amylase/lipase, imaging
-""",
+        matrix = np.zeros((len(domain_examples), len(vocab)), dtype=np.int32)
+        for row, example in enumerate(domain_examples):
+            for indicator in example._ki_lower:
+                matrix[row, column[indicator]] += 1
 
-            "neurological": """
-🧠 NEUROLOGICAL DOMAIN TEMPLATE:
-When analyzing neurological symptoms, consider:
-1. STROKE: FAST positive + sudden onset + focal deficit
-2. MENINGITIS: Fever + headache + neck stiffness + altered mental status
-3. SEIZURE: Convulsion + altered consciousness + post-ictal state
-4. MIGRAINE: Throbbing headache + photophobia + aura
+        # CSR view of the same rows for the Numba kernel
+        term_ids = np.array([column[i] for example in domain_examples for i in example._ki_lower], dtype=np.int32)
+        offsets = np.zeros(len(domain_examples) + 1, dtype=np.int32)
+        np.cumsum([len(example._ki_lower) for example in domain_examples], out=offsets[1:])
 
-RED FLAGS: Sudden severe headache, focal deficit, altered consciousness
-IMMEDIATE ACTION: Neurological exam, glucose, CT brain
-""",
+        self._indicator_vocab[domain] = vocab
+        self._indicator_matrix[domain] = matrix
+        self._indicator_csr[domain] = (offsets, term_ids)
+        self._matchers[domain] = _compile_matcher(domain.value, vocab)
 
-            "musculoskeletal": """
-🦴 MUSCULOSKELETAL DOMAIN TEMPLATE:
-When analyzing MSK symptoms, consider:
-1. OSTEOARTHRITIS: Single joint + morning stiffness + age-related
-2. RHEUMATOID ARTHRITIS: Multiple joints + symmetrical + morning stiffness >1hr
-3. GOUT: Sudden severe joint pain + usually big toe + nocturnal
-4. SEPTIC ARTHRITIS: Hot joint + fever + restricted movement
-
-RED FLAGS: Hot swollen joint + fever, multiple joint involvement
-IMMEDIATE ACTION: Joint examination, ESR/CRP, joint aspiration if indicated
-""",
-
-            "endocrine": """
-🔥 ENDOCRINE DOMAIN TEMPLATE:
-When analyzing endocrine symptoms, consider:
-1. DIABETES: Polyuria + polydipsia + polyphagia + hyperglycemia
-2. HYPERTHYROIDISM: Weight loss + palpitations + heat intolerance + tremor
-3. HYPOTHYROIDISM: Weight gain + fatigue + cold intolerance + bradycardia
-4. ADRENAL CRISIS: Hypotension + electrolyte imbalance + altered mental status
-
-RED FLAGS: DKA, thyroid storm, adrenal crisis, severe electrolyte imbalance
-IMMEDIATE ACTION: Blood glucose, electrolytes, thyroid function
-"""
-        }
-
-    def _initialize_mistake_patterns(self) -> Dict[str, List[str]]:
-        """Common mistake patterns to learn from"""
+    def warmup(self) -> None:
+        """Push a dummy query through the hot paths at startup to hide first-request latency"""
 
-        return {
-            "missed_emergency": [
-                "ไม่สังเกตอาการฉุกเฉิน",
-                "ประเมิน urgency ต่ำเกินไป",
-                "ไม่ส่งโรงพยาบาลเมื่อควรส่ง"
-            ],
-            "wrong_category": [
-                "วินิจฉัยผิดหมวดโรค",
-                "คิดเป็นโรคทั่วไปแต่เป็นโรคเฉพาะทาง",
-                "ไม่คิดถึง differential diagnosis"
-            ],
-            "missed_red_flags": [
-                "ไม่สังเกต red flag symptoms",
-                "ไม่ถามอาการเพิ่มเติม",
-                "ไม่ประเมินความรุนแรง"
-            ],
-            "confidence_issues": [
-                "มั่นใจเกินไปในการวินิจฉัยที่ไม่แน่นอน",
-                "มั่นใจต่ำเกินไปในการวินิจฉัยที่ชัดเจน",
-                "ไม่พิจารณาความน่าจะเป็น"
-            ]
-        }
+        self._find_relevant_examples("ไข้ ไอ")  # Compiles/loads the Numba kernel when present
+        self.create_few_shot_prompt("ไข้ ไอ", n_examples=1)
+        logger.info("🔥 Few-shot retrieval warmed up")
 
     def get_domain_specific_examples(self, domain: MedicalDomain, n_examples: int = 3) -> List[FewShotExample]:
         """Get examples for specific medical domain"""
 
-        domain_key = domain.value
-        if domain_key in self.examples:
-            return self.examples[domain_key][:n_examples]
-        return []
+        return self.examples[domain][:n_examples]
 
     def get_learning_prompt(self, domain: MedicalDomain, mistake_type: Optional[str] = None) -> str:
         """Generate learning prompt for specific domain and mistake type"""
 
-        domain_template = self.domain_templates.get(domain.value, "")
+        domain_template = self.domain_templates.get(domain, "")
 
         if mistake_type and mistake_type in self.mistake_patterns:
             mistake_info = "\n".join(self.mistake_patterns[mistake_type])
@@ -865,7 +1319,12 @@ Remember: Always consider red flags and differential diagnosis!
         return domain_template
 
     def create_few_shot_prompt(self, symptoms: str, n_examples: int = 3) -> str:
-        """Create comprehensive few-shot prompt based on symptoms"""
+        """Create comprehensive few-shot prompt based on symptoms (LRU-cached per symptoms/n_examples)"""
+
+        return self._few_shot_prompt_cache(symptoms, n_examples)
+
+    def _build_few_shot_prompt(self, symptoms: str, n_examples: int) -> str:
+        """Build the few-shot prompt; only called on a cache miss"""
 
         # Determine most relevant domain
         relevant_domain = self._classify_domain(symptoms)
@@ -873,52 +1332,52 @@ Remember: Always consider red flags and differential diagnosis!
         # Get domain-specific examples
         examples = self.get_domain_specific_examples(relevant_domain, n_examples)
 
-        # Build prompt
-        prompt = f"""
+        # Build prompt as a list of blocks, joined once at the end
+        parts: List[str] = [f"""
 Medical AI Diagnostic Assistant - Few-Shot Learning
 
 DOMAIN: {relevant_domain.value.upper()}
 
-{self.domain_templates.get(relevant_domain.value, "")}
+{self.domain_templates.get(relevant_domain, "")}
 
 EXAMPLES TO LEARN FROM:
 
-"""
+"""]
 
         for i, example in enumerate(examples, 1):
-            prompt += f"""
+            parts.append(f"""
 Example {i}:
 Symptoms (Thai): {example.symptoms_thai}
 Symptoms (English): {example.symptoms_english}
 
 ✅ CORRECT DIAGNOSIS:
-- ICD Code: {example.diagnosis['icd_code']}
-- Name: {example.diagnosis['name']}
+- ICD Code: {example.diagnosis.icd_code}
+- Name: {example.diagnosis.name}
 - Confidence: {example.confidence_level:.0%}
-- Urgency: {example.diagnosis.get('urgency', 'moderate')}
+- Urgency: {example.diagnosis.urgency}
 
 🎯 KEY INDICATORS: {', '.join(example.key_indicators)}
 
 💊 TREATMENT:
-{json.dumps(example.treatment, indent=2, ensure_ascii=False)}
+{example._treatment_str}
 
 🚨 RED FLAGS: {', '.join(example.red_flags)}
 
 📝 LEARNING NOTE: {example.learning_notes}
 
 ---
-"""
+""")
 
-        prompt += f"""
+        parts.append(f"""
 NOW ANALYZE THESE SYMPTOMS:
 {symptoms}
 
 Apply the patterns and knowledge from the examples above.
 Consider the key indicators, red flags, and differential diagnoses.
 Provide confidence level and urgency assessment.
-"""
+""")
 
-        return prompt
+        return "".join(parts)
 
     def create_specialized_complex_prompt(self, symptoms: str, complexity_level: str = "complex") -> str:
         """Create specialized prompt for complex diagnostic scenarios"""
@@ -937,184 +1396,31 @@ Provide confidence level and urgency assessment.
     def _create_complex_diagnostic_prompt(self, symptoms: str, domain: MedicalDomain) -> str:
         """Create prompt for complex diagnostic scenarios with multiple possibilities"""
 
-        return f"""
-🧠 COMPLEX DIAGNOSTIC ANALYSIS - {domain.value.upper()} DOMAIN
-
-ADVANCED DIAGNOSTIC FRAMEWORK:
-
-1️⃣ PATTERN RECOGNITION:
-- Primary symptom cluster analysis
-- Timeline and progression assessment
-- Associated symptoms mapping
-- Risk factor evaluation
-
-2️⃣ DIFFERENTIAL DIAGNOSIS TREE:
-- Most likely diagnosis (>70% confidence)
-- Alternative diagnoses (30-70% confidence)
-- Rare but critical diagnoses (<30% but high risk)
-
-3️⃣ RED FLAG ASSESSMENT:
-- Emergency indicators requiring immediate action
-- Concerning patterns needing urgent evaluation
-- Stable presentations for outpatient management
-
-4️⃣ EVIDENCE-BASED REASONING:
-- Clinical probability scoring
-- Supporting evidence strength
-- Contradictory evidence analysis
-- Uncertainty acknowledgment
-
-PATIENT PRESENTATION:
-{symptoms}
-
-DIAGNOSTIC APPROACH:
-1. Systematically analyze each symptom cluster
-2. Consider temporal relationships and triggers
-3. Apply domain-specific diagnostic criteria
-4. Weight differential diagnoses by probability
-5. Identify any red flags requiring immediate action
-6. Provide confidence intervals for each diagnosis
-7. Recommend next steps based on uncertainty level
-
-CRITICAL THINKING REQUIREMENTS:
-- Question initial impressions
-- Consider multiple diagnostic pathways
-- Acknowledge diagnostic uncertainty
-- Prioritize patient safety over diagnostic confidence
-"""
+        head, tail = _SPECIALIZED_PROMPTS[("complex", domain)]
+        return head + symptoms + tail
 
     def _create_emergency_prompt(self, symptoms: str, domain: MedicalDomain) -> str:
         """Create prompt specifically for emergency presentations"""
 
-        return f"""
-🚨 EMERGENCY DIAGNOSTIC PROTOCOL - {domain.value.upper()}
-
-EMERGENCY ASSESSMENT FRAMEWORK:
-
-⚡ IMMEDIATE TRIAGE (First 30 seconds):
-- Life-threatening conditions (ABCs)
-- Time-critical diagnoses
-- Immediate intervention needs
-
-🎯 RAPID DIFFERENTIAL (Next 2 minutes):
-- Most likely emergency diagnosis
-- Critical alternative diagnoses
-- Benign mimics to exclude
-
-⏰ TIME-SENSITIVE ACTIONS:
-- Immediate interventions required
-- Diagnostic tests needed urgently
-- Specialist consultation triggers
-
-🔴 RED FLAG IDENTIFICATION:
-- Cardiovascular: Chest pain + radiation + hemodynamic instability
-- Neurological: Focal deficits + altered consciousness + sudden onset
-- Respiratory: Severe dyspnea + hypoxia + asymmetric findings
-- GI: Severe pain + hematemesis/melena + hemodynamic compromise
-
-PATIENT PRESENTATION:
-{symptoms}
-
-EMERGENCY ANALYSIS PROTOCOL:
-1. IMMEDIATE THREAT ASSESSMENT: Life/limb/organ threatening?
-2. RAPID PATTERN RECOGNITION: Classic emergency presentations?
-3. CRITICAL DECISION POINTS: Admit/discharge/urgent referral?
-4. TIME-SENSITIVE INTERVENTIONS: What cannot wait?
-5. DIFFERENTIAL PRIORITIES: Most dangerous diagnosis first
-6. SAFETY NET: What could we be missing?
-
-RESPONSE FORMAT:
-- Emergency Level: CRITICAL/HIGH/MODERATE/LOW
-- Immediate Actions: [List 3 most urgent steps]
-- Primary Diagnosis: [Most likely with confidence %]
-- Cannot Miss: [Dangerous alternatives to exclude]
-- Timeline: [How quickly must this be addressed?]
-"""
+        head, tail = _SPECIALIZED_PROMPTS[("emergency", domain)]
+        return head + symptoms + tail
 
     def _create_differential_prompt(self, symptoms: str, domain: MedicalDomain) -> str:
         """Create prompt focused on differential diagnosis generation"""
 
-        return f"""
-🎯 DIFFERENTIAL DIAGNOSIS GENERATOR - {domain.value.upper()}
-
-SYSTEMATIC DIFFERENTIAL APPROACH:
-
-📊 SYMPTOM CLUSTER ANALYSIS:
-Primary Symptoms: [Extract key symptoms]
-Secondary Symptoms: [Supporting symptoms]
-Timeline: [Acute/subacute/chronic]
-Context: [Triggers, precipitants, associations]
-
-🔄 DIFFERENTIAL CATEGORIES:
-
-1️⃣ MOST LIKELY (Confidence >70%):
-- Common presentations in this domain
-- Classic symptom patterns
-- Epidemiologically probable
-
-2️⃣ POSSIBLE (Confidence 30-70%):
-- Atypical presentations of common conditions
-- Less common but plausible diagnoses
-- Symptom overlap scenarios
-
-3️⃣ CANNOT MISS (Confidence <30% but critical):
-- Life-threatening conditions
-- Progressive/irreversible conditions
-- Conditions requiring immediate intervention
-
-4️⃣ RARE BUT RELEVANT:
-- Zebra diagnoses worth considering
-- Condition-specific risk factors present
-- Unusual presentations of serious conditions
-
-PATIENT SYMPTOMS:
-{symptoms}
-
-DIFFERENTIAL GENERATION PROCESS:
-1. Identify dominant symptom pattern
-2. List all conditions that could cause this pattern
-3. Rank by probability in this patient population
-4. Separate "common" from "cannot miss" diagnoses
-5. Consider atypical presentations
-6. Factor in patient demographics and risk factors
-7. Acknowledge diagnostic uncertainty
-
-OUTPUT STRUCTURE:
-- Primary Diagnosis: [Most likely with reasoning]
-- Active Differentials: [2-3 strong alternatives]
-- Cannot Miss: [Critical conditions to exclude]
-- Working Diagnosis Confidence: [Percentage]
-- Next Diagnostic Steps: [Tests/examinations needed]
-- Red Flags to Monitor: [Warning signs to watch for]
-"""
+        head, tail = _SPECIALIZED_PROMPTS[("differential", domain)]
+        return head + symptoms + tail
 
     def _classify_domain(self, symptoms: str) -> MedicalDomain:
-        """Classify symptoms into medical domain"""
-
-        symptoms_lower = symptoms.lower()
+        """Classify symptoms into medical domain with one keyword-automaton pass"""
 
-        # Domain classification rules
-        if any(keyword in symptoms_lower for keyword in ['เจ็บหน้าอก', 'ใจเต้น', 'ความดัน', 'ขาบวม']):
-            return MedicalDomain.CARDIOVASCULAR
-        elif any(keyword in symptoms_lower for keyword in ['หายใจ', 'ไอ', 'เสียงหวีด', 'ปอด']):
-            return MedicalDomain.RESPIRATORY
-        elif any(keyword in symptoms_lower for keyword in ['ปวดท้อง', 'อาเจียน', 'ท้องเสีย', 'ถ่าย']):
-            return MedicalDomain.GASTROINTESTINAL
-        elif any(keyword in symptoms_lower for keyword in ['ปวดหัว', 'ชัก', 'เดิน', 'พูด', 'สติ']):
-            return MedicalDomain.NEUROLOGICAL
-        elif any(keyword in symptoms_lower for keyword in ['ปวดข้อ', 'บวม', 'แดง', 'ร้อน']):
-            return MedicalDomain.MUSCULOSKELETAL
-        elif any(keyword in symptoms_lower for keyword in ['เบาหวาน', 'น้ำตาล', 'ปัสสาวะบ่อย', 'กระหาย']):
-            return MedicalDomain.ENDOCRINE
-        elif any(keyword in symptoms_lower for keyword in ['ไข้', 'หนาวสั่น', 'ติดเชื้อ']):
-            return MedicalDomain.INFECTIOUS
-        elif any(keyword in symptoms_lower for keyword in ['เศร้า', 'วิตก', 'กังวล', 'นอนไม่หลับ']):
-            return MedicalDomain.PSYCHIATRIC
-        elif any(keyword in symptoms_lower for keyword in ['ผื่น', 'คัน', 'แสง']):
-            return MedicalDomain.DERMATOLOGICAL
-        else:
+        hits = _DOMAIN_MATCHER.find(symptoms.lower())
+        if not hits:
             return MedicalDomain.EMERGENCY  # Default to emergency for unknown
 
+        # Earliest rule wins, matching the original if/elif priority
+        return _DOMAIN_KEYWORD_RANK[min(hits, key=lambda keyword: _DOMAIN_KEYWORD_RANK[keyword][0])][1]
+
     def update_examples_from_feedback(self,
                                     symptoms: str,
                                     wrong_diagnosis: Dict[str, Any],
@@ -1126,7 +1432,7 @@ OUTPUT STRUCTURE:
 
         # Create new learning example from mistake
         new_example = FewShotExample(
-            id=f"feedback_{len(self.examples.get(domain.value, []))}",
+            id=f"feedback_{len(self.examples[domain])}",
             domain=domain,
             symptoms_thai=symptoms,
             symptoms_english="",  # Would need translation
@@ -1141,76 +1447,81 @@ OUTPUT STRUCTURE:
         )
 
         # Add to examples
-        if domain.value not in self.examples:
-            self.examples[domain.value] = []
+        self.examples[domain].append(new_example)
+        self._build_indicator_matrix(domain)
+        self._few_shot_prompt_cache.cache_clear()
 
-        self.examples[domain.value].append(new_example)
-
-        logger.info(f"🎓 Added new few-shot example for {domain.value} domain")
+        logger.info("🎓 Added new few-shot example for %s domain", domain.value)
 
     def _extract_key_indicators(self, symptoms: str) -> List[str]:
         """Extract key symptom indicators"""
 
         # Simple keyword extraction - could be enhanced with NLP
-        keywords = []
-        symptom_words = symptoms.split()
-
-        medical_terms = [
-            'ปวด', 'เจ็บ', 'บวม', 'แดง', 'ร้อน', 'ไข้', 'ไอ', 'หายใจ',
-            'ใจเต้น', 'เหงื่อ', 'คลื่นไส้', 'อาเจียน', 'ท้องเสีย',
-            'ปัสสาวะ', 'เศร้า', 'วิตก', 'นอนไม่หลับ', 'เมื่อย'
-        ]
-
-        for word in symptom_words:
-            if any(term in word for term in medical_terms):
-                keywords.append(word)
-
-        return keywords[:5]  # Return top 5 key indicators
+        matches = islice(_INDICATOR_WORD_RE.finditer(symptoms), 5)  # Return top 5 key indicators
+        return [match.group() for match in matches]
 
     def get_statistics(self) -> Dict[str, Any]:
         """Get few-shot learning statistics"""
 
-        total_examples = sum(len(examples) for examples in self.examples.values())
-        domain_counts = {domain: len(examples) for domain, examples in self.examples.items()}
+        # Statistics cover every domain, not just the ones queried so far
+        self.examples.load_all()
+        # Lookups on unknown domains may leave empty lists behind - only report populated ones
+        domain_counts = {domain.value: len(examples) for domain, examples in self.examples.items() if examples}
+        total_examples = sum(domain_counts.values())
 
         return {
             "total_examples": total_examples,
             "domain_distribution": domain_counts,
-            "domains_covered": len(self.examples),
-            "average_examples_per_domain": total_examples / len(self.examples) if self.examples else 0
+            "domains_covered": len(domain_counts),
+            "average_examples_per_domain": total_examples / len(domain_counts) if domain_counts else 0
         }
 
     async def enhanced_diagnosis(self, symptoms: str, patient_id: Optional[str] = None, patient_info: Optional[Any] = None) -> Dict[str, Any]:
         """Enhanced diagnosis using comprehensive few-shot examples + RAG knowledge base"""
 
-        # STEP 1: Get traditional few-shot examples
+        # STEP 1: local few-shot scoring - tens of microseconds, so it runs inline on the loop
         relevant_examples = self._find_relevant_examples(symptoms)
-
-        # STEP 2: Enhance with RAG-retrieved examples from knowledge base
-        if RAG_AVAILABLE:
+        use_rag = RAG_AVAILABLE
+        if use_rag and RAG_SKIP_WHEN_CONFIDENT:
+            # A dominant local match makes the RAG round-trip pointless
+            if relevant_examples and self._calculate_confidence(symptoms, relevant_examples[0]) >= RAG_SKIP_CONFIDENCE:
+                logger.debug("⏭️ Local few-shot match is confident, skipping RAG retrieval")
+                use_rag = False
+
+        if use_rag:
+            logger.debug("🔍 Enhancing few-shot with RAG knowledge retrieval...")
+            # Include patient context in RAG retrieval
+            patient_data = {"patient_id": patient_id} if patient_id else {}
+            if patient_info:
+                patient_data["patient_context"] = str(patient_info)
+
+            # STEP 2: knowledge-base lookup
             try:
-                logger.info("🔍 Enhancing few-shot with RAG knowledge retrieval...")
-                # Include patient context in RAG retrieval
-                patient_data = {"patient_id": patient_id} if patient_id else {}
-                if patient_info:
-                    patient_data["patient_context"] = str(patient_info)
-
-                rag_examples = await rag_few_shot_service.get_relevant_examples(
-                    symptoms=symptoms,
-                    patient_data=patient_data if patient_data else None,
-                    max_examples=3
+                rag_examples = await asyncio.wait_for(
+                    rag_few_shot_service.get_relevant_examples(
+                        symptoms=symptoms,
+                        patient_data=patient_data or None,
+                        max_examples=3
+                    ),
+                    timeout=RAG_RETRIEVAL_TIMEOUT
                 )
+            except asyncio.TimeoutError:
+                logger.error("❌ RAG enhancement failed: timed out after %.1fs", RAG_RETRIEVAL_TIMEOUT)
+            except Exception as e:
+                logger.error("❌ RAG enhancement failed: %s", e)
+            else:
+                try:
+                    # Convert RAG examples to FewShotExample format for compatibility
+                    for rag_example in rag_examples:
+                        converted_example = self._convert_rag_to_few_shot(rag_example)
+                        if converted_example:
+                            relevant_examples.insert(0, converted_example)  # Prioritize RAG examples
 
-                # Convert RAG examples to FewShotExample format for compatibility
-                for rag_example in rag_examples:
-                    converted_example = self._convert_rag_to_few_shot(rag_example)
-                    if converted_example:
-                        relevant_examples.insert(0, converted_example)  # Prioritize RAG examples
-
-                logger.info(f"✅ Enhanced with {len(rag_examples)} RAG examples")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("✅ Enhanced with %d RAG examples", len(rag_examples))
 
-            except Exception as e:
-                logger.error(f"❌ RAG enhancement failed: {e}")
+                except Exception as e:
+                    logger.error("❌ RAG enhancement failed: %s", e)
 
         if not relevant_examples:
             return {"confidence": 0, "primary_diagnosis": None}
@@ -1223,31 +1534,32 @@ OUTPUT STRUCTURE:
         enhanced_confidence = self._apply_domain_enhancements(symptoms, best_match, confidence)
 
         # Apply safety adjustments based on source
-        if hasattr(best_match, 'rag_source') and best_match.rag_source:
+        if best_match.rag_source:
             enhanced_confidence = self._apply_rag_safety_adjustment(enhanced_confidence, best_match, symptoms)
         else:
             # Apply static safety check for non-RAG examples
             enhanced_confidence = self._apply_static_safety_check(enhanced_confidence, best_match, symptoms)
 
+        diff_conf = max(50, enhanced_confidence - 20)
         return {
             "confidence": enhanced_confidence,
             "primary_diagnosis": {
-                "icd_code": best_match.diagnosis["icd_code"],
-                "english_name": best_match.diagnosis["name"],
-                "thai_name": best_match.diagnosis["name"],  # Could be enhanced with proper Thai names
+                "icd_code": best_match.diagnosis.icd_code,
+                "english_name": best_match.diagnosis.name,
+                "thai_name": best_match.diagnosis.name,  # Could be enhanced with proper Thai names
                 "confidence": enhanced_confidence,
-                "category": best_match.domain.value,
-                "matched_keywords": best_match.key_indicators[:3],
+                "category": best_match._domain_value,
+                "matched_keywords": list(best_match.key_indicators[:3]),
                 "few_shot_source": True,
                 "pattern_analysis": self._get_pattern_analysis(symptoms, best_match)
             },
             "differential_diagnoses": [
                 {
-                    "icd_code": ex.diagnosis["icd_code"],
-                    "english_name": ex.diagnosis["name"],
-                    "thai_name": ex.diagnosis["name"],
-                    "confidence": max(50, enhanced_confidence - 20),
-                    "category": ex.domain.value
+                    "icd_code": ex.diagnosis.icd_code,
+                    "english_name": ex.diagnosis.name,
+                    "thai_name": ex.diagnosis.name,
+                    "confidence": diff_conf,
+                    "category": ex._domain_value
                 } for ex in relevant_examples[1:3]
             ]
         }
@@ -1257,31 +1569,37 @@ OUTPUT STRUCTURE:
 
         # Classify domain first
         domain = self._classify_domain(symptoms)
-        domain_examples = self.examples.get(domain.value, [])
+        domain_examples = self.examples[domain]
 
-        # Score examples based on symptom similarity
-        scored_examples = []
-        symptoms_lower = symptoms.lower()
+        if not domain_examples:
+            return []
 
-        for example in domain_examples:
-            score = 0
-            # Score based on key indicators match
-            for indicator in example.key_indicators:
-                if indicator.lower() in symptoms_lower:
-                    score += 2
-
-            # Score based on symptoms overlap
-            example_symptoms = example.symptoms_thai.lower()
-            for word in symptoms_lower.split():
-                if len(word) > 3 and word in example_symptoms:
-                    score += 1
+        symptoms_lower = symptoms.lower()
+        n = len(domain_examples)
 
-            if score > 0:
-                scored_examples.append((score, example))
+        # Score based on key indicators match: JIT kernel, or one matrix-vector product over the domain
+        query_vec = np.fromiter(self._matchers[domain](symptoms_lower), dtype=np.int32,
+                                count=len(self._indicator_vocab[domain]))
+        if NUMBA_AVAILABLE:
+            scores = 2 * _indicator_hit_kernel(*self._indicator_csr[domain], query_vec)
+        else:
+            scores = 2 * (self._indicator_matrix[domain] @ query_vec)
+
+        # Score based on symptoms overlap
+        long_words = [word for word in symptoms_lower.split() if len(word) > 3]
+        if long_words:
+            scores += np.fromiter(
+                (sum(1 for word in long_words if word in example._symptoms_thai_lower) for example in domain_examples),
+                dtype=scores.dtype, count=n
+            )
 
-        # Sort by score and return top examples
-        scored_examples.sort(key=lambda x: x[0], reverse=True)
-        return [example for score, example in scored_examples[:5]]
+        # Top 5 by score (ties keep example order) without sorting the whole domain
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > 5:
+            unique_key = scores[candidates] * (n + 1) + (n - candidates)
+            candidates = candidates[np.argpartition(-unique_key, 4)[:5]]
+        ordered = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [domain_examples[i] for i in ordered]
 
     def _calculate_confidence(self, symptoms: str, example: FewShotExample) -> float:
         """Calculate confidence based on symptom pattern matching"""
@@ -1291,8 +1609,8 @@ OUTPUT STRUCTURE:
 
         # Count matching key indicators
         matching_indicators = 0
-        for indicator in example.key_indicators:
-            if indicator.lower() in symptoms_lower:
+        for indicator in example._ki_lower:
+            if indicator in symptoms_lower:
                 matching_indicators += 1
 
         # Adjust confidence based on matches
@@ -1300,8 +1618,8 @@ OUTPUT STRUCTURE:
 
         # Check for red flags
         red_flag_penalty = 0
-        for red_flag in example.red_flags:
-            if red_flag.lower() in symptoms_lower:
+        for red_flag in example._red_flags_lower:
+            if red_flag in symptoms_lower:
                 red_flag_penalty = 0.1  # Increase confidence if red flags present
                 break
 
@@ -1312,43 +1630,27 @@ OUTPUT STRUCTURE:
         """Apply domain-specific confidence enhancements"""
 
         enhanced_confidence = base_confidence
-        domain = example.domain
-
-        # Domain-specific enhancement rules
-        if domain == MedicalDomain.CARDIOVASCULAR:
-            # Higher confidence for classic presentations
-            if all(keyword in symptoms.lower() for keyword in ['เจ็บหน้าอก', 'ปวดร้าว']):
-                enhanced_confidence += 0.1
-
-        elif domain == MedicalDomain.MUSCULOSKELETAL:
-            # Arthritis pattern enhancement
-            if 'ปวดข้อ' in symptoms.lower() and any(word in symptoms.lower() for word in ['บวม', 'แดง', 'ร้อน']):
-                enhanced_confidence += 0.15
-
-        elif domain == MedicalDomain.ENDOCRINE:
-            # Diabetes pattern enhancement
-            diabetes_keywords = ['ปัสสาวะบ่อย', 'กระหายน้ำ', 'น้ำหนักลด']
-            if sum(1 for keyword in diabetes_keywords if keyword in symptoms.lower()) >= 2:
-                enhanced_confidence += 0.2
 
-        elif domain == MedicalDomain.EMERGENCY:
-            # Emergency presentations should have high confidence
-            enhanced_confidence += 0.1
+        # Domain-specific enhancement rules: O(1) dispatch, one keyword scan of the symptoms
+        enhancer = _DOMAIN_ENHANCERS.get(example.domain)
+        if enhancer is not None:
+            enhanced_confidence += enhancer(_DOMAIN_BOOST_MATCHER.find(symptoms.lower()))
 
         return min(0.98, enhanced_confidence)
 
     def _get_pattern_analysis(self, symptoms: str, example: FewShotExample) -> Dict[str, Any]:
         """Get detailed pattern analysis for the diagnosis"""
 
+        symptoms_lower = symptoms.lower()
         return {
-            "matched_patterns": [indicator for indicator in example.key_indicators
-                               if indicator.lower() in symptoms.lower()],
-            "domain_classification": example.domain.value,
+            "matched_patterns": [indicator for indicator, lowered in zip(example.key_indicators, example._ki_lower)
+                               if lowered in symptoms_lower],
+            "domain_classification": example._domain_value,
             "complexity_level": example.complexity,
-            "urgency_assessment": example.diagnosis.get("urgency", "moderate"),
+            "urgency_assessment": example.diagnosis.urgency,
             "learning_source": "few_shot_examples",
-            "red_flags_detected": [flag for flag in example.red_flags
-                                 if flag.lower() in symptoms.lower()]
+            "red_flags_detected": [flag for flag, lowered in zip(example.red_flags, example._red_flags_lower)
+                                 if lowered in symptoms_lower]
         }
 
     def _convert_rag_to_few_shot(self, rag_example) -> Optional[FewShotExample]:
@@ -1369,42 +1671,31 @@ OUTPUT STRUCTURE:
                 red_flags=rag_example.safety_notes,
                 confidence_level=rag_example.confidence_level,
                 complexity="dynamic",  # Mark as RAG-generated
-                learning_notes=f"RAG-retrieved from knowledge base (score: {rag_example.retrieval_score:.2f})"
+                learning_notes=f"RAG-retrieved from knowledge base (score: {rag_example.retrieval_score:.2f})",
+                # Mark as RAG source for special handling
+                rag_source=True,
+                rag_retrieval_score=rag_example.retrieval_score
             )
 
-            # Mark as RAG source for special handling
-            few_shot_example.rag_source = True
-            few_shot_example.rag_retrieval_score = rag_example.retrieval_score
-
             return few_shot_example
 
         except Exception as e:
-            logger.error(f"Failed to convert RAG example: {e}")
+            logger.error("Failed to convert RAG example: %s", e)
             return None
 
     def _determine_domain_from_rag(self, rag_example) -> MedicalDomain:
         """Determine medical domain from RAG example"""
-        diagnosis_name = rag_example.diagnosis.get('name', '').lower()
-        symptoms = (rag_example.symptoms_english + " " + rag_example.symptoms_thai).lower()
-
-        # Domain classification based on diagnosis and symptoms
-        if any(term in diagnosis_name or term in symptoms for term in ['heart', 'cardiac', 'หัวใจ', 'หน้าอก']):
-            return MedicalDomain.CARDIOVASCULAR
-        elif any(term in diagnosis_name or term in symptoms for term in ['lung', 'respiratory', 'ปอด', 'หายใจ', 'ไอ']):
-            return MedicalDomain.RESPIRATORY
-        elif any(term in diagnosis_name or term in symptoms for term in ['stomach', 'ท้อง', 'อาหาร', 'gastro']):
-            return MedicalDomain.GASTROINTESTINAL
-        elif any(term in diagnosis_name or term in symptoms for term in ['brain', 'neuro', 'สมอง', 'ประสาท']):
-            return MedicalDomain.NEUROLOGICAL
-        elif any(term in diagnosis_name or term in symptoms for term in ['bone', 'joint', 'กระดูก', 'ข้อ']):
-            return MedicalDomain.MUSCULOSKELETAL
-        elif any(term in diagnosis_name or term in symptoms for term in ['diabetes', 'thyroid', 'เบาหวาน', 'ไทรอยด์']):
-            return MedicalDomain.ENDOCRINE
-        elif any(term in diagnosis_name or term in symptoms for term in ['infection', 'fever', 'ติดเชื้อ', 'ไข้']):
-            return MedicalDomain.INFECTIOUS
-        else:
+
+        # Domain classification based on diagnosis and symptoms: lowercase once, one keyword pass
+        text = " ".join((rag_example.diagnosis.get('name', ''),
+                         rag_example.symptoms_english, rag_example.symptoms_thai)).lower()
+        hits = _RAG_DOMAIN_MATCHER.find(text)
+        if not hits:
             return MedicalDomain.RESPIRATORY  # Default fallback
 
+        # Earliest rule wins, matching the original if/elif priority
+        return _RAG_DOMAIN_RANK[min(hits, key=lambda keyword: _RAG_DOMAIN_RANK[keyword][0])][1]
+
     def _apply_rag_safety_adjustment(self, confidence: float, rag_example, symptoms: str) -> float:
         """Apply safety adjustments for RAG-retrieved examples"""
 
@@ -1414,21 +1705,17 @@ OUTPUT STRUCTURE:
         adjusted_confidence *= 0.9  # Slight reduction for dynamic examples
 
         # Check retrieval score quality
-        if hasattr(rag_example, 'rag_retrieval_score'):
-            if rag_example.rag_retrieval_score < 0.7:
-                adjusted_confidence *= 0.8  # Reduce confidence for low retrieval scores
+        if rag_example.rag_retrieval_score < 0.7:
+            adjusted_confidence *= 0.8  # Reduce confidence for low retrieval scores
 
         # Apply symptom-diagnosis safety check
-        diagnosis_name = rag_example.diagnosis.get('name', '').lower()
-        symptoms_lower = symptoms.lower()
+        diagnosis_name = rag_example.diagnosis.name.lower()
+        mask = _safety_mask(diagnosis_name, symptoms.lower())
 
         # Safety check: Don't allow serious diagnoses for mild symptoms
-        serious_indicators = ['วัณโรค', 'tuberculosis', 'cancer', 'มะเร็ง', 'stroke', 'heart attack']
-        mild_indicators = ['เล็กน้อย', 'mild', '38 องศา', 'สองสามวัน', 'น้ำมูกเขียว']
-
-        if any(serious in diagnosis_name for serious in serious_indicators):
-            if any(mild in symptoms_lower for mild in mild_indicators):
-                logger.warning(f"🚫 RAG safety: Reducing confidence for serious diagnosis {diagnosis_name} with mild symptoms")
+        if mask & _SAFE_RAG_SERIOUS:
+            if mask & _SAFE_RAG_MILD:
+                logger.warning("🚫 RAG safety: Reducing confidence for serious diagnosis %s with mild symptoms", diagnosis_name)
                 adjusted_confidence *= 0.3  # Significant reduction
 
         # Ensure confidence stays within bounds
@@ -1437,29 +1724,18 @@ OUTPUT STRUCTURE:
     def _apply_static_safety_check(self, confidence: float, example: FewShotExample, symptoms: str) -> float:
         """Apply safety checks for static few-shot examples"""
 
-        diagnosis_name = example.diagnosis.get('name', '').lower()
-        symptoms_lower = symptoms.lower()
+        diagnosis_name = example.diagnosis.name.lower()
+        mask = _safety_mask(diagnosis_name, symptoms.lower())
 
         # Block dangerous static examples for mild symptoms
-        serious_indicators = [
-            'วัณโรค', 'tuberculosis', 'cancer', 'มะเร็ง', 'stroke', 'heart attack',
-            'meningitis', 'เยื่อหุ้มสมอง', 'sepsis', 'brain tumor'
-        ]
-        mild_indicators = ['เล็กน้อย', 'mild', '38 องศา', 'สองสามวัน', 'น้ำมูกเขียว', 'เมื่อย', 'วันเดียว']
-
-        has_mild_symptoms = any(mild in symptoms_lower for mild in mild_indicators)
-        has_serious_diagnosis = any(serious in diagnosis_name for serious in serious_indicators)
-
-        if has_mild_symptoms and has_serious_diagnosis:
-            logger.warning(f"🚫 STATIC safety: Blocking serious diagnosis {diagnosis_name} for mild symptoms")
+        if mask & _SAFE_STATIC_MILD and mask & _SAFE_STATIC_SERIOUS:
+            logger.warning("🚫 STATIC safety: Blocking serious diagnosis %s for mild symptoms", diagnosis_name)
             return 0.1  # Minimal confidence to effectively block
 
         # Special case: meningitis requires specific symptoms
-        if 'meningitis' in diagnosis_name or 'เยื่อหุ้มสมอง' in diagnosis_name:
-            required_symptoms = ['ชัก', 'seizure', 'แข็งทื่อ', 'stiff neck', 'ไข้สูงมาก', 'severe fever']
-            has_required = any(req in symptoms_lower for req in required_symptoms)
-            if not has_required:
-                logger.warning(f"🚫 STATIC safety: Blocking meningitis diagnosis without required symptoms")
+        if mask & _SAFE_MENINGITIS:
+            if not mask & _SAFE_MENINGITIS_REQUIRED:
+                logger.warning("🚫 STATIC safety: Blocking meningitis diagnosis without required symptoms")
                 return 0.1
 
         return confidence
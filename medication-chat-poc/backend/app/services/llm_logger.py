@@ -4,15 +4,162 @@ LLM Response Logger
 Comprehensive logging system for tracking LLM model interactions, responses, and performance
 """
 
+import atexit
+import io
 import json
 import logging
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass
 import uuid
+from collections import Counter, deque
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    def _json_line(data: Dict[str, Any]) -> bytes:
+        """One UTF-8 JSON line (orjson never escapes non-ASCII, so Thai text stays cheap)"""
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+
+    _json_loads = orjson.loads
+else:
+    def _json_line(data: Dict[str, Any]) -> bytes:
+        """One UTF-8 JSON line"""
+        return (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+
+    _json_loads = json.loads
+
+# Any character from the Thai Unicode block; search() stops at the first hit
+_THAI_RE = re.compile("[\u0e00-\u0e7f]")
+
+def _truncate(text: str, limit: int) -> str:
+    """text cut to limit characters with a trailing '...' marker; untouched (no copy) when short"""
+    return text if len(text) <= limit else f"{text[:limit]}..."
+
+def _tail_lines(path: str, n: int, chunk_size: int = 8192) -> List[bytes]:
+    """Last n lines of a file, reading backwards in doubling chunks instead of the whole file"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        # More than n newlines guarantees n complete lines even if the first one read is partial
+        while pos > 0 and data.count(b'\n') <= n:
+            read_size = min(chunk_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+            chunk_size *= 2
+
+    lines = io.BytesIO(data).readlines()  # Split on b'\n' only, exactly like the file would
+    if pos > 0:
+        lines = lines[1:]  # Starts mid-line
+    return lines[-n:]
+
+class _RollingStats:
+    """Statistics over the last `window` JSONL entries, updated as each entry is logged"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._entries: Deque[Tuple[bool, Optional[float], Optional[str]]] = deque()
+        self._lock = threading.Lock()
+        self._success = 0
+        self._rt_sum = 0.0
+        self._rt_count = 0
+        self._models: Counter = Counter()
+
+    @staticmethod
+    def _summarize(entry: Dict[str, Any]) -> Tuple[bool, Optional[float], Optional[str]]:
+        """(success, response time, model); time and model only count for complete interactions"""
+        response_time = model = None
+        if entry.get('type') == 'complete_interaction':
+            data = entry.get('data', {})
+            response_time = data.get('response', {}).get('response_time_ms') or None
+            model = data.get('request', {}).get('model_name') or None
+        return bool(entry.get('success', True)), response_time, model
+
+    def _apply(self, summary: Tuple[bool, Optional[float], Optional[str]], sign: int) -> None:
+        success, response_time, model = summary
+        self._success += sign * success
+        if response_time is not None:
+            self._rt_sum += sign * response_time
+            self._rt_count += sign
+        if model is not None:
+            self._models[model] += sign
+            if not self._models[model]:
+                del self._models[model]
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        summary = self._summarize(entry)
+        with self._lock:
+            self._entries.append(summary)
+            self._apply(summary, 1)
+            if len(self._entries) > self.window:
+                self._apply(self._entries.popleft(), -1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = len(self._entries)
+            return {
+                "total_interactions": total,
+                "successful_interactions": self._success,
+                "success_rate": self._success / total if total > 0 else 0,
+                "average_response_time_ms": self._rt_sum / self._rt_count if self._rt_count else 0,
+                "model_usage": dict(self._models),
+                "recent_interactions_analyzed": total
+            }
 
-@dataclass
+class _UuidPool:
+    """Random UUID4 strings carved from one os.urandom() read per block of 256"""
+
+    def __init__(self, block: int = 256):
+        self._block = block
+        self._buf = b""
+        self._pos = 0
+        self._lock = threading.Lock()
+        # A forked worker must not replay the parent's buffered randomness
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._buf = b""
+        self._pos = 0
+
+    def next(self) -> str:
+        with self._lock:
+            if self._pos >= len(self._buf):
+                self._buf = os.urandom(16 * self._block)
+                self._pos = 0
+            raw = self._buf[self._pos:self._pos + 16]
+            self._pos += 16
+        return str(uuid.UUID(bytes=raw, version=4))
+
+class _IsoTimestamp:
+    """Local-time ISO timestamps; the date/time prefix is formatted once per second"""
+
+    def __init__(self):
+        self._cached: Tuple[int, str] = (-1, "")
+
+    def now(self) -> str:
+        now = time.time()
+        second = int(now)
+        cached_second, prefix = self._cached
+        if second != cached_second:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+            self._cached = (second, prefix)
+        return f"{prefix}.{int((now - second) * 1_000_000):06d}"
+
+_request_ids = _UuidPool()
+_timestamps = _IsoTimestamp()
+
+@dataclass(slots=True)
 class LLMRequest:
     """Structure for LLM request logging"""
     request_id: str
@@ -22,7 +169,7 @@ class LLMRequest:
     parameters: Dict[str, Any]
     context: Dict[str, Any]
 
-@dataclass
+@dataclass(slots=True)
 class LLMResponse:
     """Structure for LLM response logging"""
     request_id: str
@@ -33,7 +180,7 @@ class LLMResponse:
     confidence_score: Optional[float]
     error: Optional[str]
 
-@dataclass
+@dataclass(slots=True)
 class LLMInteraction:
     """Complete LLM interaction log"""
     request: LLMRequest
@@ -41,6 +188,37 @@ class LLMInteraction:
     success: bool
     metadata: Dict[str, Any]
 
+# Hand-written serializers: dataclasses.asdict() recurses and deep-copies every field.
+# The caller-supplied dicts are copied one level so later mutation cannot race the writer thread.
+def _request_to_dict(request: LLMRequest) -> Dict[str, Any]:
+    return {
+        "request_id": request.request_id,
+        "timestamp": request.timestamp,
+        "model_name": request.model_name,
+        "prompt": request.prompt,
+        "parameters": dict(request.parameters),
+        "context": dict(request.context),
+    }
+
+def _response_to_dict(response: LLMResponse) -> Dict[str, Any]:
+    return {
+        "request_id": response.request_id,
+        "response_timestamp": response.response_timestamp,
+        "response_text": response.response_text,
+        "tokens_used": response.tokens_used,
+        "response_time_ms": response.response_time_ms,
+        "confidence_score": response.confidence_score,
+        "error": response.error,
+    }
+
+def _interaction_to_dict(interaction: LLMInteraction) -> Dict[str, Any]:
+    return {
+        "request": _request_to_dict(interaction.request),
+        "response": _response_to_dict(interaction.response),
+        "success": interaction.success,
+        "metadata": dict(interaction.metadata),
+    }
+
 class LLMLogger:
     """Specialized logger for LLM interactions"""
 
@@ -51,10 +229,12 @@ class LLMLogger:
         # Setup structured logging
         self.logger = logging.getLogger("llm_interactions")
         self.logger.setLevel(logging.INFO)
+        # LLM records go to their own file only, not through the root logger's handlers as well
+        self.logger.propagate = False
 
-        # Create file handler for LLM logs
+        # Create file handler for LLM logs (opened on the first record)
         log_file = os.path.join(log_dir, "llm_interactions.log")
-        file_handler = logging.FileHandler(log_file)
+        file_handler = logging.FileHandler(log_file, delay=True)
         file_handler.setLevel(logging.INFO)
 
         # Create JSON formatter for structured logging
@@ -63,18 +243,34 @@ class LLMLogger:
         )
         file_handler.setFormatter(formatter)
 
+        # Records are handed to a listener thread, so request handlers never wait on the file write
+        self._log_listener: Optional[QueueListener] = None
         if not self.logger.handlers:
-            self.logger.addHandler(file_handler)
+            record_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            self._log_listener = QueueListener(record_queue, file_handler, respect_handler_level=True)
+            self._log_listener.start()
+            self.logger.addHandler(QueueHandler(record_queue))
+            atexit.register(self._log_listener.stop)
 
-        # Separate detailed JSON logs
+        # Separate detailed JSON logs, appended by a background writer off the request path
         self.json_log_file = os.path.join(log_dir, "llm_detailed.jsonl")
+        self._json_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+        self._json_lock = threading.Lock()
+        self._json_fh = open(self.json_log_file, 'ab', buffering=64 * 1024)
+        self._json_writer = threading.Thread(target=self._drain_json_queue, name="llm-jsonl-writer", daemon=True)
+        self._json_writer.start()
+        atexit.register(self.flush)
+
+        # Rolling statistics over the last 1000 entries, seeded once from the existing log
+        self._stats = _RollingStats(window=1000)
+        for entry in self.get_recent_interactions(limit=self._stats.window):
+            self._stats.add(entry)
 
         self.logger.info("LLM Logger initialized")
 
     def ensure_log_directory(self):
         """Ensure log directory exists"""
-        if not os.path.exists(self.log_dir):
-            os.makedirs(self.log_dir)
+        os.makedirs(self.log_dir, exist_ok=True)
 
     def log_request(self,
                    model_name: str,
@@ -83,23 +279,24 @@ class LLMLogger:
                    context: Dict[str, Any] = None) -> str:
         """Log LLM request and return request ID"""
 
-        request_id = str(uuid.uuid4())
+        request_id = _request_ids.next()
 
         request = LLMRequest(
             request_id=request_id,
-            timestamp=datetime.now().isoformat(),
-            model_name=model_name,
-            prompt=prompt[:1000] + "..." if len(prompt) > 1000 else prompt,  # Truncate long prompts
+            timestamp=_timestamps.now(),
+            model_name=sys.intern(model_name),  # Only a handful of distinct models
+            prompt=_truncate(prompt, 1000),  # Truncate long prompts
             parameters=parameters or {},
             context=context or {}
         )
 
-        self.logger.info(f"LLM Request - ID: {request_id}, Model: {model_name}, Prompt Length: {len(prompt)}")
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(f"LLM Request - ID: {request_id}, Model: {model_name}, Prompt Length: {len(prompt)}")
 
         # Log detailed request to JSON
         self._log_to_json({
             "type": "request",
-            "data": asdict(request)
+            "data": _request_to_dict(request)
         })
 
         return request_id
@@ -115,8 +312,8 @@ class LLMLogger:
 
         response = LLMResponse(
             request_id=request_id,
-            response_timestamp=datetime.now().isoformat(),
-            response_text=response_text[:2000] + "..." if len(response_text) > 2000 else response_text,
+            response_timestamp=_timestamps.now(),
+            response_text=_truncate(response_text, 2000),
             tokens_used=tokens_used,
             response_time_ms=response_time_ms,
             confidence_score=confidence_score,
@@ -125,11 +322,12 @@ class LLMLogger:
 
         success = error is None
 
-        self.logger.info(
-            f"LLM Response - ID: {request_id}, Success: {success}, "
-            f"Time: {response_time_ms:.0f}ms, Tokens: {tokens_used or 'N/A'}, "
-            f"Response Length: {len(response_text)}"
-        )
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                f"LLM Response - ID: {request_id}, Success: {success}, "
+                f"Time: {response_time_ms:.0f}ms, Tokens: {tokens_used or 'N/A'}, "
+                f"Response Length: {len(response_text)}"
+            )
 
         if error:
             self.logger.error(f"LLM Error - ID: {request_id}, Error: {error}")
@@ -137,7 +335,7 @@ class LLMLogger:
         # Log detailed response to JSON
         self._log_to_json({
             "type": "response",
-            "data": asdict(response),
+            "data": _response_to_dict(response),
             "success": success
         })
 
@@ -154,21 +352,21 @@ class LLMLogger:
                        metadata: Dict[str, Any] = None) -> str:
         """Log complete LLM interaction in one call"""
 
-        request_id = str(uuid.uuid4())
+        request_id = _request_ids.next()
 
         request = LLMRequest(
             request_id=request_id,
-            timestamp=datetime.now().isoformat(),
-            model_name=model_name,
-            prompt=prompt[:1000] + "..." if len(prompt) > 1000 else prompt,
+            timestamp=_timestamps.now(),
+            model_name=sys.intern(model_name),  # Only a handful of distinct models
+            prompt=_truncate(prompt, 1000),
             parameters=parameters or {},
             context=context or {}
         )
 
         response = LLMResponse(
             request_id=request_id,
-            response_timestamp=datetime.now().isoformat(),
-            response_text=response_text[:2000] + "..." if len(response_text) > 2000 else response_text,
+            response_timestamp=_timestamps.now(),
+            response_text=_truncate(response_text, 2000),
             tokens_used=tokens_used,
             response_time_ms=response_time_ms,
             confidence_score=confidence_score,
@@ -185,11 +383,12 @@ class LLMLogger:
         )
 
         # Log summary
-        self.logger.info(
-            f"LLM Interaction - ID: {request_id}, Model: {model_name}, "
-            f"Success: {success}, Time: {response_time_ms:.0f}ms, "
-            f"Prompt: {len(prompt)} chars, Response: {len(response_text)} chars"
-        )
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                f"LLM Interaction - ID: {request_id}, Model: {model_name}, "
+                f"Success: {success}, Time: {response_time_ms:.0f}ms, "
+                f"Prompt: {len(prompt)} chars, Response: {len(response_text)} chars"
+            )
 
         if error:
             self.logger.error(f"LLM Interaction Error - ID: {request_id}, Error: {error}")
@@ -197,19 +396,59 @@ class LLMLogger:
         # Log complete interaction to JSON
         self._log_to_json({
             "type": "complete_interaction",
-            "data": asdict(interaction)
+            "data": _interaction_to_dict(interaction)
         })
 
         return request_id
 
     def _log_to_json(self, data: Dict[str, Any]) -> None:
-        """Log structured data to JSON lines file"""
+        """Queue structured data for the JSON lines file (never blocks the caller)"""
+        self._stats.add(data)
         try:
-            with open(self.json_log_file, 'a', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False)
-                f.write('\n')
-        except Exception as e:
-            self.logger.error(f"Failed to write JSON log: {e}")
+            self._json_queue.put_nowait(data)
+        except queue.Full:
+            # Drop the oldest entry rather than stall a request on disk I/O
+            try:
+                self._json_queue.get_nowait()
+                self._json_queue.task_done()
+            except queue.Empty:
+                pass
+            try:
+                self._json_queue.put_nowait(data)
+            except queue.Full:
+                self.logger.error("Failed to write JSON log: queue full")
+
+    def _drain_json_queue(self) -> None:
+        """Writer thread: append queued entries, flushing every 100 lines or at least once a second"""
+        unflushed = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                data = self._json_queue.get(timeout=1.0)
+            except queue.Empty:
+                data = None
+
+            with self._json_lock:
+                if data is not None:
+                    try:
+                        self._json_fh.write(_json_line(data))
+                        unflushed += 1
+                    except Exception as e:
+                        self.logger.error(f"Failed to write JSON log: {e}")
+                if unflushed and (unflushed >= 100 or time.monotonic() - last_flush >= 1.0):
+                    self._json_fh.flush()
+                    unflushed = 0
+                    last_flush = time.monotonic()
+
+            if data is not None:
+                self._json_queue.task_done()
+
+    def flush(self) -> None:
+        """Wait for queued JSON entries to be written and flush them to disk"""
+        if self._json_writer.is_alive():
+            self._json_queue.join()
+        with self._json_lock:
+            self._json_fh.flush()
 
     def log_medical_diagnosis(self,
                             patient_symptoms: str,
@@ -237,7 +476,7 @@ class LLMLogger:
             metadata={
                 "domain": "medical",
                 "task": "diagnosis",
-                "language": "thai" if any('\u0e00' <= c <= '\u0e7f' for c in patient_symptoms) else "english"
+                "language": "thai" if _THAI_RE.search(patient_symptoms) else "english"
             }
         )
 
@@ -275,15 +514,14 @@ class LLMLogger:
     def get_recent_interactions(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent LLM interactions from JSON log"""
         try:
+            self.flush()
             interactions = []
             if os.path.exists(self.json_log_file):
-                with open(self.json_log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    for line in lines[-limit:]:
-                        try:
-                            interactions.append(json.loads(line.strip()))
-                        except json.JSONDecodeError:
-                            continue
+                for line in _tail_lines(self.json_log_file, limit):
+                    try:
+                        interactions.append(_json_loads(line))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        continue
             return interactions
         except Exception as e:
             self.logger.error(f"Failed to read recent interactions: {e}")
@@ -292,37 +530,8 @@ class LLMLogger:
     def get_statistics(self) -> Dict[str, Any]:
         """Get LLM interaction statistics"""
         try:
-            interactions = self.get_recent_interactions(limit=1000)  # Last 1000
-
-            total_interactions = len(interactions)
-            successful_interactions = sum(1 for i in interactions if i.get('success', True))
-
-            # Calculate average response times
-            response_times = []
-            for interaction in interactions:
-                if interaction.get('type') == 'complete_interaction':
-                    response_time = interaction.get('data', {}).get('response', {}).get('response_time_ms')
-                    if response_time:
-                        response_times.append(response_time)
-
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-
-            # Model usage statistics
-            model_usage = {}
-            for interaction in interactions:
-                if interaction.get('type') == 'complete_interaction':
-                    model = interaction.get('data', {}).get('request', {}).get('model_name')
-                    if model:
-                        model_usage[model] = model_usage.get(model, 0) + 1
-
-            return {
-                "total_interactions": total_interactions,
-                "successful_interactions": successful_interactions,
-                "success_rate": successful_interactions / total_interactions if total_interactions > 0 else 0,
-                "average_response_time_ms": avg_response_time,
-                "model_usage": model_usage,
-                "recent_interactions_analyzed": len(interactions)
-            }
+            # Maintained incrementally as entries are logged - no log re-read or JSON parsing here
+            return self._stats.snapshot()
 
         except Exception as e:
             self.logger.error(f"Failed to calculate statistics: {e}")
@@ -6,11 +6,23 @@ import asyncio
 import json
 import csv
 import os
+import re
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, IO, List, Mapping, Optional, Any, Tuple
+from dataclasses import dataclass, field
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
 
 from app.util.config import get_settings, MedicalConstants
+from app.util.keyword_matcher import KeywordMatcher
+from app.util.substring_index import SubstringIndex
 from app.schemas.medical_chat import (
     PatientInfo, ConversationMessage,
     UrgencyLevel, TriageLevel, DiagnosisConfidence
@@ -18,12 +30,526 @@ from app.schemas.medical_chat import (
 from app.services.memory_agent import memory_agent, AdaptiveMemoryAgent
 from app.services.advanced_few_shot import AdvancedFewShotLearning
 from app.services.llm_logger import llm_logger
-from app.services.ollama_client import ollama_client
+from app.services.ollama_client import estimate_tokens, ollama_client
 from app.services.rag_few_shot_service import rag_few_shot_service
+from app.services.semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Any character in the Thai block
+_THAI_RE = re.compile("[\u0e00-\u0e7f]")
+
+
+def _mentions_male(message: str) -> bool:
+    """ผู้ชาย, or ชาย anywhere except as the start of ชายหญิง (plain substring search, no regex)"""
+    if "ผู้ชาย" in message:
+        return True
+    start = message.find("ชาย")
+    while start != -1:
+        if not message.startswith("หญิง", start + 3):
+            return True
+        start = message.find("ชาย", start + 3)
+    return False
+
+
+# Patient details volunteered in a free-text Thai message. Age, height and weight mentions
+# are found in one scan; each named group maps to (field, priority), lower priority wins.
+# The zero-width lookahead tests every position, so one mention cannot hide another that
+# overlaps it (e.g. "ความดันสูง 65 ขวบ"). "ความสูง"/"น้ำหนัก" are covered by "สูง"/"หนัก".
+_DEMOGRAPHICS_RE = re.compile(
+    r'(?='
+    r'อายุ\s*(?P<age_stated>\d+)'
+    r'|วัย\s*(?P<age_span>\d+)'
+    r'|ขวบ\s*(?P<age_child_prefix>\d+)'
+    r'|สูง\s*(?P<height_stated>\d+)'
+    r'|หนัก\s*(?P<weight_stated>\d+)'
+    r'|(?<!\d)(?P<age_years>\d+)\s*ปี(?!\s*กิโลกรัม)'  # Avoid matching weight
+    r'|(?<!\d)(?P<age_child>\d+)\s*ขวบ'
+    r'|(?<!\d)(?P<height_cm>\d+)\s*เซนติเมตร'
+    r'|(?<!\d)(?P<weight_kg>\d+)\s*กิโลกรัม'
+    r')'
+)
+_DEMOGRAPHIC_GROUPS = {
+    "age_stated": ("age", 0),
+    "age_years": ("age", 1),
+    "age_span": ("age", 2),
+    "age_child_prefix": ("age", 3),
+    "age_child": ("age", 4),
+    "height_stated": ("height", 0),
+    "height_cm": ("height", 1),
+    "weight_stated": ("weight", 0),
+    "weight_kg": ("weight", 1),
+}
+# Plausible values for a medical consultation
+_DEMOGRAPHIC_RANGES = {"age": (1, 120), "height": (50, 250), "weight": (10, 300)}
+# Every extractable detail needs one of these (digits for demographics, gender words, history
+# and allergy phrases), so messages without any skip the individual patterns entirely
+_PATIENT_INFO_HINT_RE = re.compile(r'\d|ชาย|หญิง|แพ้|ประวัติ|ไม่เป็นโรค|เบาหวาน|ความดัน|โรคหัวใจ|ไตเสื่อม')
+# Shortest message that yields any detail ("ชาย", "5ปี")
+_PATIENT_INFO_MIN_CHARS = 3
+_NO_HISTORY_RE = re.compile(r'ไม่มีประวัติโรคประจำตัว|ไม่เป็นโรคอะไร')
+_HISTORY_RE = re.compile(r'(?:เป็น|ประวัติ|มี)(เบาหวาน|ความดัน(?:โลหิต)?สูง|โรคหัวใจ|ไตเสื่อม)')
+_NO_ALLERGY_RE = re.compile(r'ไม่แพ้(?:อะไร|ยา|อาหาร)|ไม่มีการแพ้')
+_ALLERGY_RE = re.compile(r'(?:การ)?แพ้([^ก-ไ\s]+)')  # Non-Thai characters after (การ)แพ้
+
+# Dosage strings in knowledge-base descriptions, one alternative per unit in order of preference
+_RAG_DOSAGE_RE = re.compile(
+    r'(?P<mg>\d+(?:\.\d+)?\s*mg)'
+    r'|(?P<ml>\d+(?:\.\d+)?\s*ml)'
+    r'|(?P<tablet>\d+\s*tablets?)'
+    r'|(?P<capsule>\d+\s*capsules?)',
+    re.IGNORECASE
+)
+_RAG_DOSAGE_PRIORITY = {"mg": 0, "ml": 1, "tablet": 2, "capsule": 3}
+_MEDICINE_STRENGTH_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(\d+(?:\.\d+)?)\s*mg',
+    r'(\d+(?:\.\d+)?)\s*ml',
+    r'(\d+)\s*units?/ml',
+    r'(\d+)\s*mcg'
+))
+
+# Medications suggested per consultation (each one costs an LLM instruction call)
+_MAX_RAG_MEDICATIONS = 3
+
+# Fields of the LLM medication-instruction answer, all labels in one scan. The zero-width
+# lookahead tests every position, so a label inside another label's value is still seen.
+_MEDICATION_FIELD_RE = re.compile(r'(?=(?P<label>Duration|Frequency|Instructions|Warnings):\s*(?P<value>.+))')
+_MEDICATION_FIELD_COUNT = 4
+
+# Fallback medication instructions when the LLM is unavailable
+_SAFE_MEDICATION_DEFAULTS = {
+    "duration": "5-7 วัน",
+    "frequency": "ตามคำแนะนำของแพทย์",
+    "instructions": "รับประทานหลังอาหาร",
+}
+_SAFE_MEDICATION_WARNINGS = ("ปรึกษาแพทย์หากอาการไม่ดีขึ้น", "อ่านคำแนะนำบนฉลากยา")
+
+
+# Simulated MedLlama topics, first matching rule wins
+_SIMULATED_TOPIC_RULES = (
+    ("chest_pain", ('เจ็บหน้าอก', 'chest pain', 'ปวดหน้าอก')),
+    ("joint_pain", ('ปวดข้อ', 'joint pain', 'arthritis')),
+    ("diabetes", ('ปัสสาวะบ่อย', 'diabetes', 'เบาหวาน')),
+)
+_SIMULATED_TOPIC_MATCHER = KeywordMatcher(keyword for _, keywords in _SIMULATED_TOPIC_RULES for keyword in keywords)
+# Keyword -> index of its rule, so the winning topic is the smallest index among the hits
+_SIMULATED_KEYWORD_RANK = {
+    keyword: rank for rank, (_, keywords) in enumerate(_SIMULATED_TOPIC_RULES) for keyword in keywords
+}
+_SIMULATED_TOPIC_RESPONSES = {
+    "chest_pain": """Based on the symptoms of chest pain, this could indicate several conditions:
+
+Primary Assessment: Possible angina or myocardial infarction
+Confidence: 75%
+Recommendations:
+- Immediate medical evaluation
+- ECG monitoring
+- Cardiac enzymes
+- Call emergency services if severe
+
+Differential Diagnoses:
+1. Acute coronary syndrome
+2. Gastroesophageal reflux
+3. Costochondritis
+4. Pulmonary embolism
+
+Emergency signs: Severe pain, radiation to arm/jaw, shortness of breath, sweating""",
+    "joint_pain": """Joint pain assessment indicates possible inflammatory arthritis.
+
+Primary Assessment: Osteoarthritis or Rheumatoid Arthritis
+Confidence: 85%
+Key findings: Joint swelling, morning stiffness, pain with movement
+
+Treatment recommendations:
+- NSAIDs for pain relief
+- Physical therapy
+- Joint protection techniques
+- Weight management if applicable
+
+Monitor for: Fever, multiple joint involvement, systemic symptoms""",
+    "diabetes": """Polyuria and associated symptoms suggest diabetes mellitus.
+
+Primary Assessment: Type 2 Diabetes Mellitus
+Confidence: 90%
+Classical triad: Polyuria, polydipsia, polyphagia
+
+Immediate actions:
+- Blood glucose testing
+- HbA1c measurement
+- Urinalysis
+- Blood pressure monitoring
+
+Management plan:
+- Lifestyle modifications
+- Metformin consideration
+- Regular monitoring
+- Diabetes education""",
+}
+_SIMULATED_GENERIC_RESPONSE = """Medical assessment based on presented symptoms: {symptoms}...
+
+General medical evaluation indicates need for further assessment.
+Confidence: 65%
+
+Recommendations:
+- Complete history and physical examination
+- Appropriate diagnostic testing
+- Follow-up as clinically indicated
+- Seek medical attention if symptoms worsen"""
+
+# Red flag symptoms that require immediate medical attention: (category, urgency, keywords)
+_RED_FLAG_CATEGORIES = (
+    ("cardiovascular", "critical",
+     ("เจ็บหน้าอก", "ปวดหน้าอก", "แน่นหน้าอก", "หายใจไม่ออก", "หายใจลำบาก",
+      "เหงื่อออก", "หน้าซีด", "ใจเต้นผิดปกติ", "chest pain", "shortness of breath")),
+    ("neurological", "critical",
+     ("หมดสติ", "ชัก", "อัมพาต", "พูดไม่ได้", "มึนงง", "โรคหลอดเลือดสมอง",
+      "ปวดหัวรุนแรง", "มองไม่เห็น", "unconscious", "seizure", "stroke", "paralysis")),
+    ("severe_allergic", "critical",
+     ("หายใจไม่ออก", "บวมรุนแรง", "ลิ้นบวม", "คอบวม", "เป็นลม", "วิงเวียนมาก",
+      "anaphylaxis", "severe swelling", "throat swelling")),
+    ("severe_bleeding", "high",
+     ("เลือดออกมาก", "อาเจียนเป็นเลือด", "ถ่ายเป็นเลือด", "ถ่ายดำ", "เลือดกำเดา",
+      "severe bleeding", "blood vomiting", "bloody stool")),
+    ("high_fever_complications", "high",
+     ("ไข้สูงมาก", "ไข้เกิน 40", "ชัก", "ซึมมาก", "ปวดคอแข็ง", "ผื่นแดงไม่หาย",
+      "very high fever", "febrile seizure", "neck stiffness", "persistent rash")),
+)
+# (keyword as written, lowercased, category, urgency) in reporting order
+_RED_FLAG_KEYWORDS = tuple(
+    (keyword, keyword.lower(), category, urgency)
+    for category, urgency, keywords in _RED_FLAG_CATEGORIES
+    for keyword in keywords
+)
+_RED_FLAG_MATCHER = KeywordMatcher(keyword_lower for _, keyword_lower, _, _ in _RED_FLAG_KEYWORDS)
+
+# Comprehensive symptom-to-diagnosis mapping with variations (DiagnosticAgent's rule-based fallback)
+_SYMPTOM_DIAGNOSIS_MAP = {
+    "common_cold": {
+        "keywords": [
+            # Thai variations - expanded for better matching
+            "ไข้", "ไข้เล็กน้อย", "ไข้ต่ำ", "ไข้ 38", "ไข้สูง", "เป็นไข้", "มีไข้",
+            "ตัวร้อน", "ตัวรุ่ม", "ตัวร้อนๆ", "ไม่สบาย", "ไม่สบายตัว",
+            "คัดจมูก", "จมูกแน่น", "น้ำมูกใส", "น้ำมูกเหลว", "น้ำมูกเขียว", "น้ำมูกข้น",
+            "ไอ", "ไอแห้ง", "ไอเล็กน้อย", "ไอบ่อย", "ไอมีเสียง",
+            "เจ็บคอ", "คอแห้ง", "คอแสบ", "คอบวม", "กลืนลำบาก",
+            "ปวดเมื่อย", "เมื่อยตัว", "อ่อนเพลีย", "เหนื่อย", "นอนไม่หลับ",
+            "ปวดหัว", "ปวดหัวเล็กน้อย", "ศีรษะปวด",
+            "จาม", "จามบ่อย", "ตาแดง", "ตาคัน",
+            # Common cold specific phrases
+            "หวัด", "เป็นหวัด", "หัดตัว", "วัน", "สองสามวัน", "มาสองสามวัน",
+            # English
+            "fever", "low fever", "runny nose", "stuffy nose", "cough", "dry cough",
+            "sore throat", "body aches", "fatigue", "sneezing", "nasal congestion",
+            "green mucus", "yellow mucus", "cold", "common cold", "headache", "feel hot"
+        ],
+        "icd_code": "J00", "thai_name": "ไข้หวัด", "english_name": "Common Cold", "confidence_base": 85,
+        "severity_indicators": ["ไข้สูง", "หายใจลำบาก", "เจ็บคอมาก"],
+        "typical_combination": ["ไข้", "ไอ", "น้ำมูก"]  # If all 3 present, very likely cold
+    },
+    "flu": {
+        "keywords": [
+            "ไข้สูง", "ไข้มาก", "ปวดหัว", "ปวดตัว", "หนาวสั่น", "เหนื่อยมาก", "ไอมาก",
+            "high fever", "body aches", "chills", "headache", "severe fatigue", "muscle pain"
+        ],
+        "icd_code": "J11.1", "thai_name": "ไข้หวัดใหญ่", "english_name": "Influenza", "confidence_base": 75
+    },
+    "diabetes": {
+        "keywords": [
+            # Thai comprehensive
+            "ปัสสาวะบ่อย", "ปัสสาวะมาก", "ปัสสาวะตลอดเวลา", "กระหายน้ำ", "กระหายน้ำมาก",
+            "ดื่มน้ำมาก", "น้ำหนักลด", "ผอมลง", "อ่อนเพลีย", "เหนื่อยง่าย", "ตาพร่ามัว",
+            "มองไม่ชัด", "แผลหายช้า", "ติดเชื้อง่าย", "หิวบ่อย", "กินมากแต่ผอม",
+            # English
+            "frequent urination", "excessive thirst", "weight loss", "fatigue", "blurred vision",
+            "slow healing", "frequent infections", "increased hunger"
+        ],
+        "icd_code": "E11", "thai_name": "เบาหวาน", "english_name": "Diabetes Mellitus", "confidence_base": 75,
+        "severity_indicators": ["น้ำหนักลดมาก", "ตาพร่ามัวรุนแรง", "หายใจเหม็นผลไม้"]
+    },
+    "gastritis": {
+        "keywords": [
+            # Thai comprehensive - เฉพาะเจาะจงมากขึ้น
+            "ปวดท้องส่วนบน", "ปวดลิ้นปี่", "แสบร้อน", "แสบกลางอก", "แสบกระเพาะ",
+            "คลื่นไส้", "อาเจียน", "ท้องอืด", "ท้องเฟ้อ", "เรอบ่อย", "กรดไหลย้อน",
+            "กินไม่ได้", "หิวแต่กินไม่ลง", "อาหารไม่ย่อย", "ปวดหลังอาหาร", "ปวดท้องว่าง",
+            "กระเพาะอักเสบ", "แสบร้อนกระเพาะ",
+            # English
+            "stomach pain", "gastric pain", "heartburn", "nausea", "vomiting", "bloating",
+            "acid reflux", "indigestion", "loss of appetite", "epigastric pain", "gastritis"
+        ],
+        "icd_code": "K29", "thai_name": "กระเพาะอักเสบ", "english_name": "Gastritis", "confidence_base": 80,
+        "severity_indicators": ["อาเจียนเป็นเลือด", "ถ่ายดำ", "ปวดมาก"],
+        "specific_location": "ท้องส่วนบน"
+    },
+    "appendicitis": {
+        "keywords": [
+            # Thai comprehensive - เฉพาะเจาะจงสำหรับไส้ติ่ง
+            "ปวดท้องขวาล่าง", "ปวดท้องขวา", "ปวดตำแหน่งไส้ติ่ง", "ไส้ติ่งอักเสบ",
+            "ปวดท้องลิง", "ปวดท้องอักเสบ", "ไข้สูง", "คลื่นไส้อาเจียน",
+            "ไม่สามารถเดินได้", "ปวดเมื่อกด", "ปวดเมื่อไอ",
+            # English
+            "appendicitis", "right lower abdomen pain", "lower right abdominal pain",
+            "appendix pain", "mcburney point", "right iliac fossa pain"
+        ],
+        "icd_code": "K37", "thai_name": "ไส้ติ่งอักเสบ", "english_name": "Appendicitis", "confidence_base": 85,
+        "severity_indicators": ["ไข้สูง", "ปวดรุนแรง", "อาเจียนมาก", "เดินไม่ได้"],
+        "specific_location": "ท้องขวาล่าง",
+        "emergency": True
+    },
+    "migraine": {
+        "keywords": [
+            # Thai comprehensive
+            "ปวดศีรษะ", "ปวดหัว", "ไมเกรน", "ปวดข้างเดียว", "ปวดแบบตุบๆ", "ปวดแรง",
+            "คลื่นไส้", "อาเจียน", "กลัวแสง", "กลัวเสียง", "ตาเจ็บ", "มองเห็นแสงแวบ",
+            "เครียด", "นอนไม่หลับ", "อารมณ์เปลี่ยน",
+            # English
+            "headache", "migraine", "severe headache", "throbbing pain", "pulsating pain",
+            "photophobia", "phonophobia", "nausea", "vomiting", "aura", "visual disturbance"
+        ],
+        "icd_code": "G43.909", "thai_name": "ไมเกรน", "english_name": "Migraine", "confidence_base": 75,
+        "severity_indicators": ["ปวดรุนแรง", "อาเจียนมาก", "มองไม่เห็น"]
+    },
+    "uti": {
+        "keywords": [
+            # Thai comprehensive
+            "ปัสสาวะแสบ", "ปัสสาวะเจ็บ", "ปัสสาวะบ่อย", "ปัสสาวะไม่สุด", "ปัสสาวะขุ่น",
+            "ปัสสาวะเหม็น", "ปัสสาวะมีเลือด", "ปวดท้องน้อย", "ปวดหลัง", "ไข้ต่ำ",
+            "ปวดเมื่อปัสสาวะ", "รู้สึกไม่สบาย",
+            # English
+            "painful urination", "burning urination", "frequent urination", "urgency",
+            "cloudy urine", "bloody urine", "pelvic pain", "back pain", "dysuria"
+        ],
+        "icd_code": "N39.0", "thai_name": "ติดเชื้อทางเดินปัสสาวะ", "english_name": "Urinary Tract Infection", "confidence_base": 70,
+        "severity_indicators": ["ปัสสาวะมีเลือด", "ไข้สูง", "ปวดหลังรุนแรง"]
+    },
+    "allergic_reaction": {
+        "keywords": [
+            # Thai comprehensive
+            "ผื่น", "ผื่นแดง", "ผื่นลมพิษ", "คัน", "คันมาก", "คันทั่วตัว", "บวม", "หน้าบวม",
+            "ตาบวม", "ริมฝีปากบวม", "ลิ้นบวม", "หายใจลำบาก", "หายใจไม่ออก", "เหงื่อออก",
+            "วิงเวียน", "แพ้", "กินแล้วแพ้", "แพ้ยา", "แพ้อาหาร",
+            # English
+            "rash", "hives", "itching", "swelling", "facial swelling", "lip swelling",
+            "tongue swelling", "difficulty breathing", "wheezing", "allergic", "allergy"
+        ],
+        "icd_code": "T78.40", "thai_name": "ปฏิกิริยาแพ้", "english_name": "Allergic Reaction", "confidence_base": 80,
+        "severity_indicators": ["หายใจลำบาก", "บวมรุนแรง", "เป็นลม"]
+    },
+    "hypertension": {
+        "keywords": [
+            "ความดันสูง", "ปวดหัว", "วิงเวียน", "หูอื้อ", "ใจสั่น", "เจ็บหน้าอก", "หายใจไม่อิ่ม",
+            "high blood pressure", "hypertension", "headache", "dizziness", "chest pain"
+        ],
+        "icd_code": "I10", "thai_name": "ความดันโลหิตสูง", "english_name": "Hypertension", "confidence_base": 70
+    },
+    "depression_anxiety": {
+        "keywords": [
+            "เครียด", "กังวล", "เศร้า", "นอนไม่หลับ", "ไม่อยากทำอะไร", "เหนื่อยใจ", "ห่วงมาก",
+            "กลัว", "ตื่นตระหนก", "ใจเต้นแรง", "มือสั่น", "เหงื่อออก",
+            "stress", "anxiety", "depression", "insomnia", "panic", "worry", "fear"
+        ],
+        "icd_code": "F43.9", "thai_name": "ความเครียดและความวิตกกังวล", "english_name": "Stress and Anxiety", "confidence_base": 65
+    },
+    "fever": {
+        "keywords": [
+            # Thai comprehensive
+            "ไข้", "ไข้สูง", "ไข้ต่ำ", "ตัวร้อน", "ร่างกายร้อน", "หนาวสั่น", "หนาว", "สั่น",
+            "ซึม", "อ่อนเพลีย", "เด็กไข้", "ลูกไข้", "ไข้ขึ้นลง", "ตัวเป็นไข้",
+            # English
+            "fever", "high fever", "temperature", "hot", "chills", "shivering", "feverish"
+        ],
+        "icd_code": "R50.9", "thai_name": "ไข้", "english_name": "Fever", "confidence_base": 70,
+        "severity_indicators": ["ไข้สูงมาก", "ชัก", "ซึมมาก"]
+    }
+}
+# Condition-specific wording (frequency, pain pattern, timing) worth a score bonus
+_SYMPTOM_PATTERN_WORDS = {
+    "diabetes": ("บ่อย", "มาก", "ลด"),
+    "migraine": ("ข้างเดียว", "ตุบ", "แรง"),
+    "gastritis": ("หลัง", "ว่าง", "กิน"),
+}
+
+
+def _keyword_weight(keyword: str) -> int:
+    """Score for a matched keyword - longer, more specific symptoms weigh more"""
+    if len(keyword) > 8:
+        return 20
+    if len(keyword) > 4:
+        return 15
+    return 10
+
+
+@dataclass(slots=True, frozen=True)
+class _SymptomCondition:
+    """A _SYMPTOM_DIAGNOSIS_MAP entry prepared once for scoring (read-only, lowercased)"""
+    icd_code: str
+    thai_name: str
+    english_name: str
+    confidence_base: int
+    keywords: Tuple[Tuple[str, str, int], ...]  # (keyword as written, lowercased, weight) in table order
+    severity_indicators: Tuple[str, ...]
+    pattern_words: Tuple[str, ...]
+
+
+_SYMPTOM_CONDITIONS: Mapping[str, _SymptomCondition] = MappingProxyType({
+    condition: _SymptomCondition(
+        icd_code=data["icd_code"],
+        thai_name=data["thai_name"],
+        english_name=data["english_name"],
+        confidence_base=data["confidence_base"],
+        keywords=tuple((keyword, keyword.lower(), _keyword_weight(keyword)) for keyword in data["keywords"]),
+        severity_indicators=tuple(indicator.lower() for indicator in data.get("severity_indicators", ())),
+        pattern_words=_SYMPTOM_PATTERN_WORDS.get(condition, ())
+    )
+    for condition, data in _SYMPTOM_DIAGNOSIS_MAP.items()
+})
+
+# Every keyword and severity indicator, lowercased, so one scan of the symptoms finds them all
+_SYMPTOM_KEYWORD_MATCHER = KeywordMatcher(
+    keyword
+    for spec in _SYMPTOM_CONDITIONS.values()
+    for keyword in (*(keyword_lower for _, keyword_lower, _ in spec.keywords), *spec.severity_indicators)
+)
+
+# Quick emergency screen for the doctor-approval workflow, in reporting priority order
+_EMERGENCY_KEYWORDS = (
+    "หายใจลำบาก", "เจ็บหน้าอก", "ปวดหัวรุนแรง",
+    "เป็นลม", "ไม่รู้สึกตัว", "เลือดออก"
+)
+_EMERGENCY_MATCHER = KeywordMatcher(_EMERGENCY_KEYWORDS)
+
+# Triage risk factors, matched case-insensitively against the lowercased message
+_TRIAGE_EMERGENCY_MATCHER = KeywordMatcher(keyword.lower() for keyword in (
+    # Thai emergency keywords
+    "ฉุกเฉิน", "เร่งด่วน", "หัวใจวาย", "หัวใจหยุดเต้น", "หายใจไม่ได้", "หายใจลำบากมาก",
+    "เจ็บหน้าอกมาก", "ปวดหน้าอกแปลบ", "หมดสติ", "ชัก", "เลือดออกมาก", "อุบัติเหตุ",
+    # English emergency keywords
+    "emergency", "cardiac arrest", "can't breathe", "severe chest pain",
+    "unconscious", "seizure", "severe bleeding", "stroke"
+))
+_SEVERITY_INDICATOR_MATCHER = KeywordMatcher(indicator.lower() for indicator in (
+    "มาก", "รุนแรง", "แย่", "ทนไม่ได้", "ปวดมาก", "เจ็บมาก",
+    "severe", "intense", "unbearable", "worst", "acute"
+))
+
+# ICD-10 prefixes the safety check decides without the LLM: self-limiting common conditions
+# are never "too aggressive"; these serious ones always are for a common-illness consultation
+_SELF_LIMITING_ICD_PREFIXES = (
+    "J00", "J06", "J11", "J30", "K29.7", "K30", "K59", "A09",
+    "R05", "R50", "R51", "G44.2", "L30"
+)
+_SERIOUS_ICD_PREFIXES = ("A15", "A39", "C", "G00", "G03", "I21", "I6")
+
+# Fixed instruction blocks for the LLM safety prompts. The per-call symptoms/diagnosis are
+# appended after them, so every request shares a byte-identical prefix that Ollama can
+# reuse from the KV cache of the loaded model instead of re-evaluating it.
+_AGGRESSIVE_CHECK_PREFIX = """
+You are a medical AI safety checker. Analyze if the proposed diagnosis is appropriate for the given symptoms.
+
+TASK: Determine if this diagnosis is overly aggressive or inappropriate given the symptoms.
+
+GUIDELINES:
+- Common symptoms like fever, headache, fatigue should NOT lead to serious diagnoses like meningitis, stroke, heart attack
+- Serious diagnoses require specific, characteristic symptoms
+- Be conservative and favor common conditions over rare ones
+
+RESPOND: "AGGRESSIVE" if the diagnosis is too serious for the symptoms, "APPROPRIATE" if reasonable.
+
+"""
+_AGGRESSIVE_CHECK_PROMPT = _AGGRESSIVE_CHECK_PREFIX + """SYMPTOMS: {symptoms}
+PROPOSED DIAGNOSIS: {diagnosis}
+
+RESPONSE:"""
+
+_CONSERVATIVE_DIAGNOSIS_PREFIX = """
+You are a conservative medical AI. Analyze the symptoms below and provide the MOST LIKELY COMMON diagnosis.
+
+INSTRUCTIONS:
+1. Consider the MOST COMMON causes first (viral illness, common cold, tension headache, etc.)
+2. Avoid serious diagnoses unless symptoms are very specific
+3. Provide 1 primary diagnosis and 2 differential diagnoses
+4. Use appropriate ICD-10 codes
+
+FORMAT YOUR RESPONSE EXACTLY AS:
+PRIMARY: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
+DIFFERENTIAL1: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
+DIFFERENTIAL2: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
+
+EXAMPLE:
+PRIMARY: J00 Common cold | ไข้หวัด | Confidence: 75
+DIFFERENTIAL1: J11.1 Influenza | ไข้หวัดใหญ่ | Confidence: 60
+DIFFERENTIAL2: R50.9 Viral fever | ไข้จากไวรัส | Confidence: 55
+
+"""
+_CONSERVATIVE_DIAGNOSIS_PROMPT = _CONSERVATIVE_DIAGNOSIS_PREFIX + """SYMPTOMS: {symptoms}
+
+RESPONSE:"""
+
+# Oversized prompts (settings.max_prompt_chars) are condensed by SeaLLM before dispatch;
+# the condensing call itself only sees this many multiples of the limit
+_CONDENSE_INPUT_FACTOR = 4
+_PROMPT_CONDENSE_PROMPT = """Condense the following text to its essential medical content.
+Keep every symptom, duration, medication, patient detail and question. Use the same language as the text.
+
+TEXT:
+{text}
+
+CONDENSED:"""
+
+# One diagnosis per line: "<label>: <ICD> <English name> | <Thai name> | Confidence: <n>"
+_DIAGNOSIS_LINE_RE = re.compile(
+    r'^[^:\n]*:(?P<diagnosis>[^|\n]*)\|(?P<thai>[^|\n]*)\|(?P<confidence>[^|\n]*)',
+    re.MULTILINE
+)
+
+# Medical category by ICD-10 chapter letter
+_ICD_CATEGORIES = {
+    'A': 'infectious', 'B': 'infectious',
+    'C': 'neoplasm', 'D': 'blood',
+    'E': 'endocrine', 'F': 'mental',
+    'G': 'neurological', 'H': 'sensory',
+    'I': 'cardiovascular', 'J': 'respiratory',
+    'K': 'digestive', 'L': 'dermatological',
+    'M': 'musculoskeletal', 'N': 'genitourinary',
+    'O': 'pregnancy', 'P': 'perinatal',
+    'Q': 'congenital', 'R': 'symptoms',
+    'S': 'injury', 'T': 'injury',
+    'V': 'external', 'W': 'external',
+    'X': 'external', 'Y': 'external',
+    'Z': 'factors'
+}
+
+# Seconds a successful Ollama health check is trusted before the next LLM call re-pings the server
+_OLLAMA_READY_TTL_SECONDS = 30.0
+
+# Conversation memory: raw turns kept per session (same window as the Redis backend)
+_MAX_SESSION_TURNS = 50
+
+# Patient-facing status while the AI response waits for doctor approval
+_APPROVAL_STATUS_TEMPLATE = """📋 การวิเคราะห์อาการของคุณเสร็จสิ้นแล้ว
+
+🤖 **ระบบ AI ได้วิเคราะห์อาการแล้ว**:
+• การวินิจฉัยเบื้องต้น: {diagnosis}
+• ยาที่แนะนำ: {medication_count} รายการ
+• ระดับความเร่งด่วน: {urgency}
+
+⏳ **สถานะ**: รอแพทย์ตรวจสอบและอนุมัติ
+
+🩺 **ขั้นตอนต่อไป**:
+• แพทย์จะตรวจสอบคำแนะนำของ AI
+• อนุมัติ แก้ไข หรือให้คำแนะนำใหม่
+• คุณจะได้รับคำตอบสุดท้ายภายใน 15-30 นาที
+
+⚠️ **หากมีอาการฉุกเฉิน**: โทร 1669 ทันที
+
+💬 **หมายเหตุ**: ระบบจะแจ้งเตือนเมื่อแพทย์ตอบกลับแล้ว"""
+
+
+def _conversation_key(session_id: str) -> str:
+    """Redis list holding one session's conversation entries"""
+    return f"conv:{session_id}"
+
 
 @dataclass
 class AgentThought:
@@ -35,7 +561,7 @@ class AgentThought:
     confidence: float
 
 
-@dataclass
+@dataclass(slots=True)
 class MedicalKnowledgeItem:
     id: str
     name_en: str
@@ -43,6 +569,125 @@ class MedicalKnowledgeItem:
     category: str
     description: str
     icd_code: Optional[str] = None
+    # Lowercased copies for case-insensitive search, computed once per item instead of per query
+    name_en_lower: str = field(init=False, repr=False, compare=False)
+    name_th_lower: str = field(init=False, repr=False, compare=False)
+    description_lower: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.name_en_lower = self.name_en.lower()
+        self.name_th_lower = self.name_th.lower()
+        self.description_lower = self.description.lower()
+
+
+def _column_index(header: List[str], *names: str) -> Optional[int]:
+    """Position of the first of names present in a CSV header (None if absent)"""
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def _cell(row: List[str], index: Optional[int]) -> str:
+    """Value at a resolved column position ('' when the column or cell is missing)"""
+    return row[index] if index is not None and index < len(row) else ''
+
+
+def _parse_medicines(f: IO[str]) -> List[MedicalKnowledgeItem]:
+    """Medicine items from an open medicines CSV"""
+    medicines = []
+    # Positional rows: column positions are resolved once from the header
+    reader = csv.reader(f)
+    header = next(reader, [])
+    id_col = _column_index(header, 'No', 'no')
+    name_col = _column_index(header, 'Prescription', 'prescription')
+    last_col = len(header) - 1 if len(header) > 1 else None
+    for row in reader:
+        if not row:
+            continue  # Blank line
+        # Handle the actual CSV format: No,Prescription,[Thai_name]
+        english_name = _cell(row, name_col)
+        thai_name = _cell(row, last_col)  # Last column
+        medicines.append(MedicalKnowledgeItem(
+            id=_cell(row, id_col),
+            name_en=english_name,
+            name_th=thai_name,
+            category='medication',
+            description=f"{english_name} ({thai_name})"
+        ))
+    return medicines
+
+
+def _parse_diagnoses(f: IO[str]) -> List[MedicalKnowledgeItem]:
+    """Diagnosis items from an open diagnoses CSV"""
+    diagnoses = []
+    reader = csv.reader(f)
+    header = next(reader, [])
+    id_col = _column_index(header, 'No', 'no')
+    name_col = _column_index(header, 'Diagnosis Code and Name', 'diagnosis code and name')
+    last_col = len(header) - 1 if len(header) > 1 else None
+    for row in reader:
+        if not row:
+            continue  # Blank line
+        # Handle the actual CSV format: No,Diagnosis Code and Name,[Thai_name]
+        diagnosis_code_name = _cell(row, name_col)
+        thai_name = _cell(row, last_col)  # Last column
+
+        # Extract ICD code from diagnosis_code_name
+        icd_code = ''
+        english_name = diagnosis_code_name
+        if diagnosis_code_name:
+            parts = diagnosis_code_name.split(' ', 1)
+            if parts and len(parts[0]) <= 6:  # ICD codes are typically short
+                icd_code = parts[0]
+                english_name = ' '.join(parts[1:]) if len(parts) > 1 else parts[0]
+
+        diagnoses.append(MedicalKnowledgeItem(
+            id=_cell(row, id_col),
+            name_en=english_name,
+            name_th=thai_name,
+            category='diagnosis',
+            description=f"{english_name} ({thai_name})",
+            icd_code=icd_code
+        ))
+    return diagnoses
+
+
+def _parse_treatments(f: IO[str]) -> List[MedicalKnowledgeItem]:
+    """Treatment items (rows with a prescription) from an open treatments CSV"""
+    treatments = []
+    reader = csv.reader(f)
+    header = next(reader, [])
+    id_col = _column_index(header, 'treatment_id')
+    condition_col = _column_index(header, 'condition_name')
+    medications_col = _column_index(header, 'medications')
+    thai_col = _column_index(header, 'thai_condition')
+    for row in reader:
+        if not row:
+            continue  # Blank line
+        # Handle the treatment CSV format: treatment_id,condition_name,thai_condition,icd_code,medications
+        diagnosis_code_name = _cell(row, condition_col)
+        prescription_en = _cell(row, medications_col)
+
+        # Get Thai condition name
+        prescription_th = _cell(row, thai_col)
+
+        if prescription_en:  # Only add if we have a prescription
+            treatments.append(MedicalKnowledgeItem(
+                id=_cell(row, id_col),
+                name_en=prescription_en,
+                name_th=prescription_th,
+                category='treatment',
+                description=f"{diagnosis_code_name} -> {prescription_en} ({prescription_th})"
+            ))
+    return treatments
+
+
+def _load_knowledge_csv(path: str,
+                        parse: Callable[[IO[str]], List[MedicalKnowledgeItem]]) -> List[MedicalKnowledgeItem]:
+    """Parse one knowledge CSV with its row parser"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return parse(f)
 
 
 class MedicalAIService:
@@ -57,15 +702,26 @@ class MedicalAIService:
         self.medicines: List[MedicalKnowledgeItem] = []
         self.diagnoses: List[MedicalKnowledgeItem] = []
         self.treatments: List[MedicalKnowledgeItem] = []
-
-        # Conversation storage
-        self.conversation_history: Dict[str, List[Dict]] = {}
+        # Bigram indexes over the lowercased names/descriptions, rebuilt with the lists
+        self.treatment_index = SubstringIndex(())
+        self.medicine_name_index = SubstringIndex(())
+
+        # Conversation storage: least recently active session first
+        self.conversation_history: OrderedDict[str, List[Dict]] = OrderedDict()
+        self._conversation_last_active: Dict[str, float] = {}
+        # Redis list per session when settings.redis_url is set (shared across workers, survives restarts)
+        self._redis = None
+        # Ollama health-check result is trusted until this time.monotonic() deadline
+        self._ollama_ready_until = 0.0
         self.system_stats = {
             "total_consultations": 0,
             "avg_response_time": 0,
             "languages_detected": {}
         }
 
+        # LLM safety-check answers reused across re-phrased symptoms (cleared on knowledge reload)
+        self._llm_answer_cache = SemanticCache(maxsize=512, ttl_seconds=24 * 3600, threshold=0.8)
+
         # Simple agent system
         self.agents = {
             "diagnostic": DiagnosticAgent(),
@@ -89,6 +745,10 @@ class MedicalAIService:
             except Exception as e:
                 logger.error(f"❌ Failed to initialize RAG service: {e}")
 
+            # Shared conversation store
+            if settings.redis_url:
+                await self._connect_redis()
+
             # Initialize agents
             for agent_name, agent in self.agents.items():
                 await agent.initialize(self)
@@ -98,6 +758,7 @@ class MedicalAIService:
             try:
                 await ollama_client.initialize()
                 if await ollama_client.check_connection():
+                    self._ollama_ready_until = time.monotonic() + _OLLAMA_READY_TTL_SECONDS
                     logger.info("✅ Ollama client connected successfully")
                     models = await ollama_client.list_models()
                     logger.info(f"📋 Available models: {models}")
@@ -119,6 +780,13 @@ class MedicalAIService:
             if hasattr(agent, 'cleanup'):
                 await agent.cleanup()
 
+        if self._redis is not None:
+            try:
+                await self._redis.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Redis cleanup failed: {e}")
+            self._redis = None
+
         # Cleanup Ollama client
         try:
             await ollama_client.cleanup()
@@ -126,13 +794,62 @@ class MedicalAIService:
         except Exception as e:
             logger.warning(f"⚠️ Ollama cleanup failed: {e}")
 
+    async def _condense_prompt(self, prompt: str) -> str:
+        """Summarise an oversized prompt with SeaLLM, truncating if that fails"""
+
+        limit = settings.max_prompt_chars
+        start_ns = time.perf_counter_ns()
+        condensed = ""
+        error = None
+
+        try:
+            result = await ollama_client.generate(
+                model=self.seallm_model,
+                prompt=_PROMPT_CONDENSE_PROMPT.format(text=prompt[:limit * _CONDENSE_INPUT_FACTOR]),
+                temperature=0.2,
+                max_tokens=300
+            )
+            if result.get("success"):
+                condensed = result["response"].strip()
+            else:
+                error = result.get("error", "Unknown Ollama error")
+        except Exception as e:
+            error = str(e)
+
+        if not condensed or len(condensed) > limit:
+            condensed = prompt[:limit]
+
+        logger.warning(f"✂️ Prompt of {len(prompt)} chars condensed to {len(condensed)} chars")
+        llm_logger.log_interaction(
+            model_name=self.seallm_model,
+            prompt=prompt,
+            response_text=condensed,
+            response_time_ms=(time.perf_counter_ns() - start_ns) / 1e6,
+            context={
+                "interaction_type": "prompt_condensation",
+                "original_length": len(prompt),
+                "condensed_length": len(condensed)
+            },
+            error=error,
+            metadata={
+                "domain": "preprocessing",
+                "task": "condense_prompt"
+            }
+        )
+
+        return condensed
+
     async def _call_llm_model(self,
                              model_name: str,
                              prompt: str,
                              context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Call real Ollama LLM model with comprehensive logging"""
 
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
+
+        # Bound prefill cost: a giant prompt would also hold up every request queued behind it
+        if len(prompt) > settings.max_prompt_chars:
+            prompt = await self._condense_prompt(prompt)
 
         # Log the request
         request_id = llm_logger.log_request(
@@ -143,12 +860,12 @@ class MedicalAIService:
         )
 
         try:
-            # Initialize Ollama client
-            await ollama_client.initialize()
-
-            # Check Ollama connection
-            if not await ollama_client.check_connection():
-                raise Exception("Cannot connect to Ollama server")
+            # Re-check the Ollama connection only once the last successful check has gone stale
+            if time.monotonic() >= self._ollama_ready_until:
+                await ollama_client.initialize()
+                if not await ollama_client.check_connection():
+                    raise Exception("Cannot connect to Ollama server")
+                self._ollama_ready_until = time.monotonic() + _OLLAMA_READY_TTL_SECONDS
 
             # Call real Ollama model
             if context and context.get("consultation_type") == "common_illness":
@@ -196,8 +913,10 @@ class MedicalAIService:
                 raise Exception(result.get("error", "Unknown Ollama error"))
 
         except Exception as e:
-            processing_time = (datetime.now() - start_time).total_seconds() * 1000
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e6
             error_msg = str(e)
+            # Force a fresh health check on the next call
+            self._ollama_ready_until = 0.0
 
             logger.error(f"❌ LLM call failed: {error_msg}")
 
@@ -218,7 +937,7 @@ class MedicalAIService:
                 request_id=request_id,
                 response_text=fallback_response,
                 response_time_ms=processing_time,
-                tokens_used=len(fallback_response.split()),
+                tokens_used=estimate_tokens(fallback_response),
                 error=f"Ollama failed, used fallback: {error_msg}"
             )
 
@@ -244,79 +963,18 @@ class MedicalAIService:
     def _simulate_medllama_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Simulate MedLlama2 response for medical diagnosis"""
 
-        symptoms = prompt.lower()
-
-        # Simple keyword-based simulation
-        if any(word in symptoms for word in ['เจ็บหน้าอก', 'chest pain', 'ปวดหน้าอก']):
-            return """Based on the symptoms of chest pain, this could indicate several conditions:
-
-Primary Assessment: Possible angina or myocardial infarction
-Confidence: 75%
-Recommendations:
-- Immediate medical evaluation
-- ECG monitoring
-- Cardiac enzymes
-- Call emergency services if severe
-
-Differential Diagnoses:
-1. Acute coronary syndrome
-2. Gastroesophageal reflux
-3. Costochondritis
-4. Pulmonary embolism
-
-Emergency signs: Severe pain, radiation to arm/jaw, shortness of breath, sweating"""
-
-        elif any(word in symptoms for word in ['ปวดข้อ', 'joint pain', 'arthritis']):
-            return """Joint pain assessment indicates possible inflammatory arthritis.
-
-Primary Assessment: Osteoarthritis or Rheumatoid Arthritis
-Confidence: 85%
-Key findings: Joint swelling, morning stiffness, pain with movement
-
-Treatment recommendations:
-- NSAIDs for pain relief
-- Physical therapy
-- Joint protection techniques
-- Weight management if applicable
-
-Monitor for: Fever, multiple joint involvement, systemic symptoms"""
-
-        elif any(word in symptoms for word in ['ปัสสาวะบ่อย', 'diabetes', 'เบาหวาน']):
-            return """Polyuria and associated symptoms suggest diabetes mellitus.
-
-Primary Assessment: Type 2 Diabetes Mellitus
-Confidence: 90%
-Classical triad: Polyuria, polydipsia, polyphagia
-
-Immediate actions:
-- Blood glucose testing
-- HbA1c measurement
-- Urinalysis
-- Blood pressure monitoring
-
-Management plan:
-- Lifestyle modifications
-- Metformin consideration
-- Regular monitoring
-- Diabetes education"""
-
-        else:
-            return f"""Medical assessment based on presented symptoms: {prompt[:100]}...
-
-General medical evaluation indicates need for further assessment.
-Confidence: 65%
-
-Recommendations:
-- Complete history and physical examination
-- Appropriate diagnostic testing
-- Follow-up as clinically indicated
-- Seek medical attention if symptoms worsen"""
+        # Simple keyword-based simulation: one keyword pass, earliest matching topic wins
+        hits = _SIMULATED_TOPIC_MATCHER.find(prompt.lower())
+        if hits:
+            rank = min(_SIMULATED_KEYWORD_RANK[keyword] for keyword in hits)
+            return _SIMULATED_TOPIC_RESPONSES[_SIMULATED_TOPIC_RULES[rank][0]]
+        return _SIMULATED_GENERIC_RESPONSE.format(symptoms=prompt[:100])
 
     def _simulate_seallm_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Simulate SeaLLM translation response"""
 
         # Simple translation simulation
-        if any('\u0e00' <= c <= '\u0e7f' for c in prompt):  # Thai text
+        if _THAI_RE.search(prompt):  # Thai text
             return "Translated to English: " + prompt.replace('ปวด', 'pain').replace('เจ็บ', 'ache').replace('บวม', 'swelling')
         else:
             return "แปลเป็นไทย: " + prompt.replace('pain', 'ปวด').replace('ache', 'เจ็บ').replace('swelling', 'บวม')
@@ -333,7 +991,7 @@ Recommendations:
         """Process medical consultation for common illnesses"""
 
         logger.info(f"🩺 Processing medical consultation: {message[:100]}...")
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
 
         # AUTO-EXTRACT: For elderly users, extract patient info from Thai message
         if not patient_info:
@@ -350,8 +1008,16 @@ Recommendations:
                     preferred_language, session_id, include_reasoning
                 )
 
-            # Detect language and translate if needed
-            language_info = await self._detect_and_translate(message)
+            # Language detection, the emergency scan and triage only need the raw message,
+            # so they run together before the diagnosis LLM call is dispatched
+            language_info, emergency_result, triage_result = await asyncio.gather(
+                self._detect_and_translate(message),
+                self.check_emergency_keywords(message),
+                self.agents["triage"].assess_urgency({
+                    "message": message,
+                    "patient_info": patient_info
+                })
+            )
             processed_message = language_info.get("translated_message", message)
 
             # Log translation if needed
@@ -367,36 +1033,45 @@ Recommendations:
 
             # Call LLM for medical diagnosis
             llm_context = {
-                "patient_info": patient_info.dict() if patient_info else None,
+                "patient_info": patient_info.model_dump() if patient_info else None,
                 "session_id": session_id,
                 "language": language_info.get("detected_language"),
                 "consultation_type": "common_illness"
             }
 
-            llm_result = await self._call_llm_model(
-                model_name=self.medllama_model,
-                prompt=f"Medical consultation for symptoms: {processed_message}",
-                context=llm_context
+            # Process common illness consultation; the agents do not read the LLM response,
+            # so the diagnosis LLM call and the agent pipeline run concurrently
+            coordinator = self.agents["coordinator"]
+            llm_result, result = await asyncio.gather(
+                self._call_llm_model(
+                    model_name=self.medllama_model,
+                    prompt=f"Medical consultation for symptoms: {processed_message}",
+                    context=llm_context
+                ),
+                coordinator.process_common_illness_consultation({
+                    "message": processed_message,
+                    "original_message": message,
+                    "conversation_history": conversation_history or [],
+                    "patient_info": patient_info,
+                    "language_info": language_info,
+                    "session_id": session_id
+                })
             )
 
-            # Process common illness consultation
-            coordinator = self.agents["coordinator"]
-            result = await coordinator.process_common_illness_consultation({
-                "message": processed_message,
-                "original_message": message,
-                "conversation_history": conversation_history or [],
-                "patient_info": patient_info,
-                "language_info": language_info,
-                "session_id": session_id,
-                "llm_result": llm_result  # Include LLM response
-            })
+            result["triage"] = {
+                "urgency": triage_result["urgency"],
+                "triage_level": triage_result["triage_level"],
+                "emergency_detected": emergency_result["is_emergency"],
+                "emergency_keywords": emergency_result["keywords"],
+                "recommendation": emergency_result["recommendation"] or triage_result["recommendations"][0]
+            }
 
             # Translate response back if needed
             if language_info.get("detected_language") == "thai":
                 result["message"] = await self._translate_to_thai(result["message"])
 
             # Update statistics
-            processing_time = (datetime.now() - start_time).total_seconds() * 1000
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e6
             self._update_stats(processing_time, language_info.get("detected_language"))
 
             # Store conversation
@@ -417,7 +1092,7 @@ Recommendations:
         """Enhanced emergency detection with severity levels and specific actions"""
 
         # Use the enhanced red flag detection
-        red_flags = self._check_red_flags(message)
+        red_flags = self.agents["diagnostic"]._check_red_flags(message)
 
         if red_flags:
             return {
@@ -480,6 +1155,14 @@ Recommendations:
     async def get_conversation_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get conversation history for a session"""
 
+        if self._redis is not None:
+            try:
+                start = -limit if limit > 0 else 0
+                return [json.loads(entry) for entry in await self._redis.lrange(_conversation_key(session_id), start, -1)]
+            except Exception as e:
+                logger.warning(f"⚠️ Redis conversation read failed, using in-process history: {e}")
+
+        self._expire_conversations(time.monotonic())
         if session_id not in self.conversation_history:
             return []
 
@@ -489,8 +1172,14 @@ Recommendations:
     async def clear_conversation_history(self, session_id: str):
         """Clear conversation history for a session"""
 
+        if self._redis is not None:
+            try:
+                await self._redis.delete(_conversation_key(session_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Redis conversation clear failed: {e}")
+
         if session_id in self.conversation_history:
-            del self.conversation_history[session_id]
+            self._drop_conversation(session_id)
             logger.info(f"🗑️ Cleared conversation history for session {session_id}")
 
     async def get_system_statistics(self) -> Dict[str, Any]:
@@ -524,86 +1213,39 @@ Recommendations:
     async def _load_medical_data(self):
         """Load medical knowledge from CSV files"""
 
+        self._llm_answer_cache.clear()
         try:
             # Load medicines
             if os.path.exists(settings.medicine_data_path):
-                with open(settings.medicine_data_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        # Handle the actual CSV format: No,Prescription,[Thai_name]
-                        english_name = row.get('Prescription', '') or row.get('prescription', '')
-                        thai_name = list(row.values())[-1] if len(row) > 1 else ''  # Last column
-                        medicine = MedicalKnowledgeItem(
-                            id=row.get('No', '') or row.get('no', ''),
-                            name_en=english_name,
-                            name_th=thai_name,
-                            category='medication',
-                            description=f"{english_name} ({thai_name})"
-                        )
-                        self.medicines.append(medicine)
+                self.medicines = _load_knowledge_csv(settings.medicine_data_path, _parse_medicines)
                 logger.info(f"📊 Loaded {len(self.medicines)} medicines")
 
             # Load diagnoses
             if os.path.exists(settings.diagnosis_data_path):
-                with open(settings.diagnosis_data_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        # Handle the actual CSV format: No,Diagnosis Code and Name,[Thai_name]
-                        diagnosis_code_name = row.get('Diagnosis Code and Name', '') or row.get('diagnosis code and name', '')
-                        thai_name = list(row.values())[-1] if len(row) > 1 else ''  # Last column
-
-                        # Extract ICD code from diagnosis_code_name
-                        icd_code = ''
-                        english_name = diagnosis_code_name
-                        if diagnosis_code_name:
-                            parts = diagnosis_code_name.split(' ', 1)
-                            if parts and len(parts[0]) <= 6:  # ICD codes are typically short
-                                icd_code = parts[0]
-                                english_name = ' '.join(parts[1:]) if len(parts) > 1 else parts[0]
-
-                        diagnosis = MedicalKnowledgeItem(
-                            id=row.get('No', '') or row.get('no', ''),
-                            name_en=english_name,
-                            name_th=thai_name,
-                            category='diagnosis',
-                            description=f"{english_name} ({thai_name})",
-                            icd_code=icd_code
-                        )
-                        self.diagnoses.append(diagnosis)
+                self.diagnoses = _load_knowledge_csv(settings.diagnosis_data_path, _parse_diagnoses)
                 logger.info(f"📊 Loaded {len(self.diagnoses)} diagnoses")
 
             # Load treatments
             if os.path.exists(settings.treatment_data_path):
-                with open(settings.treatment_data_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        # Handle the treatment CSV format: treatment_id,condition_name,thai_condition,icd_code,medications
-                        diagnosis_code_name = row.get('condition_name', '')
-                        prescription_en = row.get('medications', '')
-
-                        # Get Thai condition name
-                        prescription_th = row.get('thai_condition', '')
-
-                        if prescription_en:  # Only add if we have a prescription
-                            treatment = MedicalKnowledgeItem(
-                                id=row.get('treatment_id', ''),
-                                name_en=prescription_en,
-                                name_th=prescription_th,
-                                category='treatment',
-                                description=f"{diagnosis_code_name} -> {prescription_en} ({prescription_th})"
-                            )
-                            self.treatments.append(treatment)
+                self.treatments = _load_knowledge_csv(settings.treatment_data_path, _parse_treatments)
                 logger.info(f"📊 Loaded {len(self.treatments)} treatments")
 
         except Exception as e:
             logger.warning(f"⚠️ Could not load some medical data: {e}")
 
+        self.treatment_index = SubstringIndex(
+            (t.description_lower, t.name_en_lower, t.name_th_lower) for t in self.treatments
+        )
+        self.medicine_name_index = SubstringIndex(
+            (m.name_th_lower, m.name_en_lower) for m in self.medicines
+        )
+
     async def _detect_and_translate(self, message: str) -> Dict[str, Any]:
         """Detect language and translate if needed"""
 
         # Simple Thai detection
         thai_chars = sum(1 for char in message if '\u0e00' <= char <= '\u0e7f')
-        total_chars = len([c for c in message if c.isalpha()])
+        total_chars = sum(1 for char in message if char.isalpha())
 
         if total_chars > 0 and thai_chars / total_chars > 0.3:
             detected_language = "thai"
@@ -625,10 +1267,7 @@ Recommendations:
         return english_text
 
     async def _store_conversation(self, session_id: str, message: str, response: Dict):
-        """Store conversation in memory"""
-
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
+        """Store conversation in Redis when configured, otherwise in memory"""
 
         conversation_entry = {
             "timestamp": datetime.now().isoformat(),
@@ -640,11 +1279,64 @@ Recommendations:
             }
         }
 
-        self.conversation_history[session_id].append(conversation_entry)
+        if self._redis is not None:
+            # Sliding window of the last 50 turns; the whole session expires after the idle TTL
+            key = _conversation_key(session_id)
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.rpush(key, json.dumps(conversation_entry, ensure_ascii=False))
+                    pipe.ltrim(key, -_MAX_SESSION_TURNS, -1)
+                    pipe.expire(key, int(settings.conversation_ttl_hours * 3600))
+                    await pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Redis conversation store failed, keeping it in memory: {e}")
+
+        history = self.conversation_history.get(session_id)
+        if history is None:
+            history = self.conversation_history[session_id] = []
+        self.conversation_history.move_to_end(session_id)
+        now = time.monotonic()
+        self._conversation_last_active[session_id] = now
+        self._expire_conversations(now)
+
+        history.append(conversation_entry)
 
         # Keep only last 50 messages per session
-        if len(self.conversation_history[session_id]) > 50:
-            self.conversation_history[session_id] = self.conversation_history[session_id][-50:]
+        if len(history) > _MAX_SESSION_TURNS:
+            del history[:-_MAX_SESSION_TURNS]
+
+    async def _connect_redis(self):
+        """Use Redis for conversation history if it is installed and reachable"""
+
+        if not REDIS_AVAILABLE:
+            logger.warning("⚠️ REDIS_URL is set but the redis package is not installed, keeping conversations in memory")
+            return
+        try:
+            client = aioredis.from_url(settings.redis_url, decode_responses=True)
+            await client.ping()
+            self._redis = client
+            logger.info("✅ Conversation history stored in Redis")
+        except Exception as e:
+            logger.warning(f"⚠️ Redis unavailable, keeping conversations in memory: {e}")
+
+    def _expire_conversations(self, now: float):
+        """Drop sessions idle longer than the TTL, then least recently active ones above the session cap"""
+
+        ttl_seconds = settings.conversation_ttl_hours * 3600
+        # Sessions are kept in activity order, so candidates are always at the front
+        while self.conversation_history:
+            session_id = next(iter(self.conversation_history))
+            idle = now - self._conversation_last_active.get(session_id, now)
+            if idle <= ttl_seconds and len(self.conversation_history) <= settings.max_conversation_sessions:
+                break
+            self._drop_conversation(session_id)
+
+    def _drop_conversation(self, session_id: str):
+        """Forget a session's stored turns"""
+
+        self.conversation_history.pop(session_id, None)
+        self._conversation_last_active.pop(session_id, None)
 
     def _update_stats(self, processing_time: float, language: str):
         """Update system statistics"""
@@ -672,22 +1364,20 @@ Recommendations:
         else:
             diagnosis_text = str(diagnosis)
 
-        prompt = f"""
-You are a medical AI safety checker. Analyze if the proposed diagnosis is appropriate for the given symptoms.
-
-SYMPTOMS: {symptoms}
-PROPOSED DIAGNOSIS: {diagnosis_text}
+        # Clear-cut ICD codes are decided locally; only the uncertain middle goes to the LLM
+        icd_code = (diagnosis.get('icd_code') or '').upper() if isinstance(diagnosis, dict) else ''
+        if icd_code.startswith(_SELF_LIMITING_ICD_PREFIXES):
+            return False
+        if icd_code.startswith(_SERIOUS_ICD_PREFIXES):
+            logger.warning(f"⚠️ Serious diagnosis flagged without LLM: {diagnosis_text} for symptoms: {symptoms}")
+            return True
 
-TASK: Determine if this diagnosis is overly aggressive or inappropriate given the symptoms.
-
-GUIDELINES:
-- Common symptoms like fever, headache, fatigue should NOT lead to serious diagnoses like meningitis, stroke, heart attack
-- Serious diagnoses require specific, characteristic symptoms
-- Be conservative and favor common conditions over rare ones
-
-RESPOND: "AGGRESSIVE" if the diagnosis is too serious for the symptoms, "APPROPRIATE" if reasonable.
+        cached = self._llm_answer_cache.get(symptoms, context="aggressive:" + diagnosis_text)
+        if cached is not None:
+            return cached
 
-RESPONSE:"""
+        # Static instructions first, variable tail last (prefix-cache friendly)
+        prompt = _AGGRESSIVE_CHECK_PROMPT.format(symptoms=symptoms, diagnosis=diagnosis_text)
 
         try:
             result = await ollama_client.generate(
@@ -704,6 +1394,7 @@ RESPONSE:"""
                 if is_aggressive:
                     logger.warning(f"🤖 LLM detected aggressive diagnosis: {diagnosis_text} for symptoms: {symptoms}")
 
+                self._llm_answer_cache.set(symptoms, is_aggressive, context="aggressive:" + diagnosis_text)
                 return is_aggressive
             else:
                 logger.warning("LLM safety check failed, defaulting to conservative")
@@ -716,28 +1407,14 @@ RESPONSE:"""
     async def _get_llm_conservative_diagnosis(self, symptoms: str) -> List[Dict]:
         """Use LLM to get conservative diagnosis for symptoms"""
 
-        prompt = f"""
-You are a conservative medical AI. Analyze these symptoms and provide the MOST LIKELY COMMON diagnosis.
-
-SYMPTOMS: {symptoms}
-
-INSTRUCTIONS:
-1. Consider the MOST COMMON causes first (viral illness, common cold, tension headache, etc.)
-2. Avoid serious diagnoses unless symptoms are very specific
-3. Provide 1 primary diagnosis and 2 differential diagnoses
-4. Use appropriate ICD-10 codes
-
-FORMAT YOUR RESPONSE EXACTLY AS:
-PRIMARY: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
-DIFFERENTIAL1: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
-DIFFERENTIAL2: [ICD Code] [English Name] | [Thai Name] | Confidence: [0-100]
-
-EXAMPLE:
-PRIMARY: J00 Common cold | ไข้หวัด | Confidence: 75
-DIFFERENTIAL1: J11.1 Influenza | ไข้หวัดใหญ่ | Confidence: 60
-DIFFERENTIAL2: R50.9 Viral fever | ไข้จากไวรัส | Confidence: 55
+        # Diagnoses are not grounded against the knowledge base (its ICD codes are not loaded),
+        # so only the same symptom words - re-ordered, re-cased or re-spelled - reuse an answer
+        cached = self._llm_answer_cache.get(symptoms, context="conservative", exact=True)
+        if cached is not None:
+            return [dict(diagnosis) for diagnosis in cached]  # Callers may annotate the dicts
 
-RESPONSE:"""
+        # Static instructions first, variable tail last (prefix-cache friendly)
+        prompt = _CONSERVATIVE_DIAGNOSIS_PROMPT.format(symptoms=symptoms)
 
         try:
             result = await ollama_client.generate(
@@ -749,7 +1426,11 @@ RESPONSE:"""
 
             if result.get('success'):
                 response = result['response'].strip()
-                return self._parse_llm_diagnosis_response(response)
+                diagnoses = self._parse_llm_diagnosis_response(response)
+                if diagnoses:
+                    self._llm_answer_cache.set(symptoms, [dict(diagnosis) for diagnosis in diagnoses],
+                                               context="conservative")
+                return diagnoses
             else:
                 logger.warning("LLM conservative diagnosis failed")
                 return None
@@ -760,97 +1441,42 @@ RESPONSE:"""
 
     def _extract_patient_info_from_message(self, message: str) -> Optional[PatientInfo]:
         """Extract patient demographic info from Thai message for elderly users"""
-        import re
-
-        # Extract age (อายุ 65 ปี, อายุ65ปี, 65 ปี, etc.)
-        age_patterns = [
-            r'อายุ\s*(\d+)\s*ปี',
-            r'อายุ\s*(\d+)',
-            r'(\d+)\s*ปี(?!\s*กิโลกรัม)',  # Avoid matching weight
-            r'วัย\s*(\d+)',
-            r'ขวบ\s*(\d+)',
-            r'(\d+)\s*ขวบ'
-        ]
-
-        age = None
-        for pattern in age_patterns:
-            match = re.search(pattern, message)
-            if match:
-                candidate_age = int(match.group(1))
-                # Reasonable age range for medical consultation
-                if 1 <= candidate_age <= 120:
-                    age = candidate_age
-                    break
 
-        # Extract height (สูง 160, สูง160เซนติเมตร, etc.)
-        height_patterns = [
-            r'สูง\s*(\d+)(?:\s*(?:เซนติเมตร|ซม\.?|cm))?',
-            r'ความสูง\s*(\d+)',
-            r'(\d+)\s*เซนติเมตร'
-        ]
+        if len(message) < _PATIENT_INFO_MIN_CHARS or not _PATIENT_INFO_HINT_RE.search(message):
+            return None
 
-        height = None
-        for pattern in height_patterns:
-            match = re.search(pattern, message)
-            if match:
-                candidate_height = int(match.group(1))
-                # Reasonable height range
-                if 50 <= candidate_height <= 250:
-                    height = candidate_height
-                    break
+        # Extract age, height and weight (อายุ 65 ปี, สูง160เซนติเมตร, น้ำหนัก 65 กิโลกรัม, etc.)
+        # in one pass: per field, the highest-priority mention within its plausible range wins
+        demographics: Dict[str, Tuple[int, int]] = {}
+        for match in _DEMOGRAPHICS_RE.finditer(message):
+            field, priority = _DEMOGRAPHIC_GROUPS[match.lastgroup]
+            value = int(match.group(match.lastgroup))
+            low, high = _DEMOGRAPHIC_RANGES[field]
+            if low <= value <= high and (field not in demographics or priority < demographics[field][0]):
+                demographics[field] = (priority, value)
 
-        # Extract weight (หนัก 65, น้ำหนัก 65 กิโลกรัม, etc.)
-        weight_patterns = [
-            r'หนัก\s*(\d+)(?:\s*(?:กิโลกรัม|กก\.?|kg))?',
-            r'น้ำหนัก\s*(\d+)',
-            r'(\d+)\s*กิโลกรัม'
-        ]
-
-        weight = None
-        for pattern in weight_patterns:
-            match = re.search(pattern, message)
-            if match:
-                candidate_weight = int(match.group(1))
-                # Reasonable weight range
-                if 10 <= candidate_weight <= 300:
-                    weight = candidate_weight
-                    break
+        age = demographics["age"][1] if "age" in demographics else None
 
         # Extract gender (เป็นผู้ชาย, เป็นผู้หญิง, ชาย, หญิง)
         gender = None
-        if re.search(r'ผู้ชาย|ชาย(?!หญิง)', message):
+        if _mentions_male(message):
             gender = "male"
-        elif re.search(r'ผู้หญิง|หญิง', message):
+        elif "หญิง" in message:  # Also covers ผู้หญิง
             gender = "female"
 
         # Extract medical history
         medical_history = []
-        if re.search(r'ไม่มีประวัติโรคประจำตัว|ไม่เป็นโรคอะไร', message):
+        if _NO_HISTORY_RE.search(message):
             medical_history.append("ไม่มีประวัติโรคประจำตัว")
         else:
-            history_patterns = [
-                r'เป็น(เบาหวาน|ความดันสูง|ความดันโลหิตสูง|โรคหัวใจ|ไตเสื่อม)',
-                r'ประวัติ(เบาหวาน|ความดันสูง|โรคหัวใจ)',
-                r'มี(เบาหวาน|ความดันสูง|โรคหัวใจ)'
-            ]
-
-            for pattern in history_patterns:
-                matches = re.findall(pattern, message)
-                medical_history.extend(matches)
+            medical_history.extend(_HISTORY_RE.findall(message))
 
         # Extract allergies
         allergies = []
-        if re.search(r'ไม่แพ้(?:อะไร|ยา|อาหาร)|ไม่มีการแพ้', message):
+        if _NO_ALLERGY_RE.search(message):
             allergies.append("ไม่แพ้อะไร")
         else:
-            allergy_patterns = [
-                r'แพ้([^ก-ไ\s]+)',  # Match non-Thai characters after แพ้
-                r'การแพ้([^ก-ไ\s]+)'
-            ]
-
-            for pattern in allergy_patterns:
-                matches = re.findall(pattern, message)
-                allergies.extend([m.strip() for m in matches if m.strip()])
+            allergies.extend(m.strip() for m in _ALLERGY_RE.findall(message) if m.strip())
 
         # Only create PatientInfo if we have meaningful data
         if age or gender or medical_history or allergies:
@@ -866,14 +1492,9 @@ RESPONSE:"""
 
     def _detect_emergency_keywords(self, message: str) -> Optional[Dict[str, Any]]:
         """Quick emergency keyword detection for safety"""
-        emergency_keywords = [
-            "หายใจลำบาก", "เจ็บหน้าอก", "ปวดหัวรุนแรง",
-            "เป็นลม", "ไม่รู้สึกตัว", "เลือดออก"
-        ]
-
-        message_lower = message.lower()
-        for keyword in emergency_keywords:
-            if keyword in message_lower:
+        hits = _EMERGENCY_MATCHER.find(message.lower())
+        for keyword in _EMERGENCY_KEYWORDS:
+            if keyword in hits:
                 return {
                     "message": f"⚠️ ตรวจพบอาการฉุกเฉิน: {keyword}\n\n🚨 กรุณาโทร 1669 ทันทีหรือไปโรงพยาบาลใกล้บ้าน",
                     "urgency": "CRITICAL",
@@ -1033,13 +1654,16 @@ RESPONSE:"""
                 diagnosis_display = diagnosis_data.get('thai_name') or diagnosis_data.get('english_name') or diagnosis_data.get('name') or str(diagnosis_data)
             else:
                 diagnosis_display = str(diagnosis_data)
+        medication_count = len(ai_response.get('medications', ()))
+        urgency = ai_response.get('urgency', 'ปกติ')
 
         # Create approval queue entry
         approval_entry = {
             "session_id": session_id,
             "timestamp": datetime.now().isoformat(),
             "patient_message": original_message,
-            "patient_info": patient_info.dict() if patient_info else None,
+            # Kept as the model; serialise with model_dump() once the entry is actually persisted
+            "patient_info": patient_info,
             "ai_response": ai_response,
             "status": "pending_doctor_review",
             "doctor_actions": {
@@ -1051,28 +1675,17 @@ RESPONSE:"""
 
         # TODO: Store in database/queue for doctor review
         # For now, log the approval entry
-        logger.info(f"📋 AI Response queued for doctor approval: {session_id}")
-        logger.info(f"Diagnosis: {ai_response.get('diagnosis', {}).get('english_name', 'Unknown')}")
-        logger.info(f"Medications: {len(ai_response.get('medications', []))} items")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"📋 AI Response queued for doctor approval: {session_id}")
+            logger.info(f"Diagnosis: {diagnosis_display}")
+            logger.info(f"Medications: {medication_count} items")
 
         # Return status message to patient
-        thai_message = f"""📋 การวิเคราะห์อาการของคุณเสร็จสิ้นแล้ว
-
-🤖 **ระบบ AI ได้วิเคราะห์อาการแล้ว**:
-• การวินิจฉัยเบื้องต้น: {diagnosis_display}
-• ยาที่แนะนำ: {len(ai_response.get('medications', []))} รายการ
-• ระดับความเร่งด่วน: {ai_response.get('urgency', 'ปกติ')}
-
-⏳ **สถานะ**: รอแพทย์ตรวจสอบและอนุมัติ
-
-🩺 **ขั้นตอนต่อไป**:
-• แพทย์จะตรวจสอบคำแนะนำของ AI
-• อนุมัติ แก้ไข หรือให้คำแนะนำใหม่
-• คุณจะได้รับคำตอบสุดท้ายภายใน 15-30 นาที
-
-⚠️ **หากมีอาการฉุกเฉิน**: โทร 1669 ทันที
-
-💬 **หมายเหตุ**: ระบบจะแจ้งเตือนเมื่อแพทย์ตอบกลับแล้ว"""
+        thai_message = _APPROVAL_STATUS_TEMPLATE.format(
+            diagnosis=diagnosis_display,
+            medication_count=medication_count,
+            urgency=urgency
+        )
 
         return {
             "type": "pending_doctor_approval",
@@ -1080,8 +1693,8 @@ RESPONSE:"""
             "status": "pending_doctor_review",
             "ai_preview": {
                 "diagnosis": diagnosis_display,
-                "medication_count": len(ai_response.get('medications', [])),
-                "urgency": ai_response.get('urgency', 'ปกติ')
+                "medication_count": medication_count,
+                "urgency": urgency
             },
             "session_id": session_id,
             "timestamp": approval_entry["timestamp"]
@@ -1094,15 +1707,19 @@ RESPONSE:"""
 
         # Search treatments by condition
         logger.info(f"🔍 Searching {len(self.medical_service.treatments)} treatments for condition: '{condition}'")
+        condition_lower = condition.lower()
+        symptoms_lower = [symptom.lower() for symptom in symptoms]
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         for treatment in self.medical_service.treatments:
-            treatment_desc = treatment.description.lower()
-            treatment_name = treatment.name_en.lower()
+            treatment_desc = treatment.description_lower
+            treatment_name = treatment.name_en_lower
 
-            logger.info(f"🔍 Checking treatment: {treatment.name_en} -> {treatment_desc}")
+            if debug_enabled:
+                logger.debug("🔍 Checking treatment: %s -> %s", treatment.name_en, treatment_desc)
 
             # Search in both treatment name and description
-            condition_found = condition.lower() in treatment_desc or condition.lower() in treatment_name
-            symptom_found = any(symptom.lower() in treatment_desc or symptom.lower() in treatment_name for symptom in symptoms)
+            condition_found = condition_lower in treatment_desc or condition_lower in treatment_name
+            symptom_found = any(symptom in treatment_desc or symptom in treatment_name for symptom in symptoms_lower)
 
             if condition_found or symptom_found:
                 # Extract medicine info from RAG
@@ -1117,8 +1734,8 @@ RESPONSE:"""
 
         # Search medicines directly
         for medicine in self.medical_service.medicines:
-            medicine_desc = medicine.description.lower()
-            if condition in medicine_desc or any(symptom.lower() in medicine_desc for symptom in symptoms):
+            medicine_desc = medicine.description_lower
+            if condition in medicine_desc or any(symptom in medicine_desc for symptom in symptoms_lower):
                 medicine_data = {
                     "english_name": medicine.name_en,
                     "thai_name": medicine.name_th,
@@ -1132,22 +1749,17 @@ RESPONSE:"""
 
     def _extract_dosage_from_rag(self, description: str) -> str:
         """Extract dosage information from RAG description"""
-        import re
-
-        # Common dosage patterns
-        dosage_patterns = [
-            r'(\d+(?:\.\d+)?)\s*mg',
-            r'(\d+(?:\.\d+)?)\s*ml',
-            r'(\d+)\s*tablets?',
-            r'(\d+)\s*capsules?'
-        ]
 
-        for pattern in dosage_patterns:
-            match = re.search(pattern, description, re.IGNORECASE)
-            if match:
-                return match.group(0)
+        # Common dosage patterns: first hit of the most preferred unit, in one scan
+        best_dosage, best_priority = None, len(_RAG_DOSAGE_PRIORITY)
+        for match in _RAG_DOSAGE_RE.finditer(description):
+            priority = _RAG_DOSAGE_PRIORITY[match.lastgroup]
+            if priority < best_priority:
+                best_dosage, best_priority = match.group(0), priority
+                if priority == 0:
+                    break
 
-        return "ตามคำแนะนำของแพทย์"  # Default if no dosage found
+        return best_dosage or "ตามคำแนะนำของแพทย์"  # Default if no dosage found
 
     async def _generate_llm_medication_instructions(self, medicine: Dict, patient_info: Optional[PatientInfo],
                                             condition: str, symptoms: List[str]) -> Dict:
@@ -1217,28 +1829,27 @@ Warnings: ปรึกษาแพทย์หากอาการไม่ด
 
     def _parse_llm_medication_response(self, llm_response: str, medicine_name: str, contraindications: Dict) -> Dict:
         """Parse LLM response into structured medication instructions"""
-        import re
 
-        duration_match = re.search(r'Duration:\s*(.+)', llm_response)
-        frequency_match = re.search(r'Frequency:\s*(.+)', llm_response)
-        instructions_match = re.search(r'Instructions:\s*(.+)', llm_response)
-        warnings_match = re.search(r'Warnings:\s*(.+)', llm_response)
+        # First value given for each label
+        fields: Dict[str, str] = {}
+        for match in _MEDICATION_FIELD_RE.finditer(llm_response):
+            fields.setdefault(match.group("label"), match.group("value").strip())
+            if len(fields) == _MEDICATION_FIELD_COUNT:
+                break
 
         return {
-            "duration": duration_match.group(1).strip() if duration_match else "5-7 วัน",
-            "frequency": frequency_match.group(1).strip() if frequency_match else "ทุก 6-8 ชั่วโมง",
-            "instructions": instructions_match.group(1).strip() if instructions_match else "รับประทานหลังอาหาร",
-            "warnings": [warnings_match.group(1).strip()] if warnings_match else ["ใช้ตามคำแนะนำของแพทย์"],
+            "duration": fields.get("Duration", "5-7 วัน"),
+            "frequency": fields.get("Frequency", "ทุก 6-8 ชั่วโมง"),
+            "instructions": fields.get("Instructions", "รับประทานหลังอาหาร"),
+            "warnings": [fields["Warnings"]] if "Warnings" in fields else ["ใช้ตามคำแนะนำของแพทย์"],
             "contraindications": contraindications.get(medicine_name.lower(), [])
         }
 
     def _get_safe_medication_defaults(self, medicine_name: str, patient_age: int, contraindications: Dict) -> Dict:
         """Safe fallback medication instructions when LLM fails"""
         return {
-            "duration": "5-7 วัน",
-            "frequency": "ตามคำแนะนำของแพทย์",
-            "instructions": "รับประทานหลังอาหาร",
-            "warnings": ["ปรึกษาแพทย์หากอาการไม่ดีขึ้น", "อ่านคำแนะนำบนฉลากยา"],
+            **_SAFE_MEDICATION_DEFAULTS,
+            "warnings": list(_SAFE_MEDICATION_WARNINGS),  # Callers get their own list
             "contraindications": contraindications.get(medicine_name.lower(), [])
         }
 
@@ -1246,59 +1857,31 @@ Warnings: ปรึกษาแพทย์หากอาการไม่ด
         """Parse LLM diagnosis response into structured format"""
 
         diagnoses = []
-        lines = response.split('\n')
-
-        for line in lines:
-            line = line.strip()
-            if not line or ':' not in line:
-                continue
-
-            try:
-                # Parse format: "PRIMARY: J00 Common cold | ไข้หวัด | Confidence: 75"
-                parts = line.split(':', 1)
-                if len(parts) != 2:
-                    continue
-
-                diagnosis_part = parts[1].strip()
-
-                # Split by pipe
-                diagnosis_components = diagnosis_part.split('|')
-                if len(diagnosis_components) >= 3:
-                    # Extract ICD code and English name
-                    icd_and_english = diagnosis_components[0].strip()
-                    thai_name = diagnosis_components[1].strip()
-                    confidence_part = diagnosis_components[2].strip()
-
-                    # Extract ICD code
-                    icd_parts = icd_and_english.split(' ', 1)
-                    icd_code = icd_parts[0] if icd_parts else ""
-                    english_name = icd_parts[1] if len(icd_parts) > 1 else icd_and_english
-
-                    # Extract confidence
-                    confidence = 60.0  # Default
-                    if 'confidence:' in confidence_part.lower():
-                        try:
-                            conf_str = confidence_part.lower().replace('confidence:', '').strip()
-                            confidence = float(conf_str)
-                        except:
-                            pass
-
-                    # Determine category
-                    category = self._get_category_from_icd(icd_code)
-
-                    diagnosis = {
-                        "icd_code": icd_code,
-                        "english_name": english_name,
-                        "thai_name": thai_name,
-                        "confidence": confidence,
-                        "category": category
-                    }
-
-                    diagnoses.append(diagnosis)
 
-            except Exception as e:
-                logger.warning(f"Failed to parse diagnosis line: {line} - {e}")
-                continue
+        # Parse format: "PRIMARY: J00 Common cold | ไข้หวัด | Confidence: 75"
+        for match in _DIAGNOSIS_LINE_RE.finditer(response):
+            # Extract ICD code and English name
+            icd_and_english = match.group("diagnosis").strip()
+            icd_code, separator, english_name = icd_and_english.partition(' ')
+            if not separator:
+                english_name = icd_and_english
+
+            # Extract confidence
+            confidence = 60.0  # Default
+            confidence_part = match.group("confidence").strip().lower()
+            if 'confidence:' in confidence_part:
+                try:
+                    confidence = float(confidence_part.replace('confidence:', '').strip())
+                except ValueError:
+                    pass
+
+            diagnoses.append({
+                "icd_code": icd_code,
+                "english_name": english_name,
+                "thai_name": match.group("thai").strip(),
+                "confidence": confidence,
+                "category": self._get_category_from_icd(icd_code)
+            })
 
         return diagnoses if diagnoses else None
 
@@ -1308,25 +1891,7 @@ Warnings: ปรึกษาแพทย์หากอาการไม่ด
         if not icd_code:
             return "general"
 
-        first_char = icd_code[0].upper()
-
-        categories = {
-            'A': 'infectious', 'B': 'infectious',
-            'C': 'neoplasm', 'D': 'blood',
-            'E': 'endocrine', 'F': 'mental',
-            'G': 'neurological', 'H': 'sensory',
-            'I': 'cardiovascular', 'J': 'respiratory',
-            'K': 'digestive', 'L': 'dermatological',
-            'M': 'musculoskeletal', 'N': 'genitourinary',
-            'O': 'pregnancy', 'P': 'perinatal',
-            'Q': 'congenital', 'R': 'symptoms',
-            'S': 'injury', 'T': 'injury',
-            'V': 'external', 'W': 'external',
-            'X': 'external', 'Y': 'external',
-            'Z': 'factors'
-        }
-
-        return categories.get(first_char, "general")
+        return _ICD_CATEGORIES.get(icd_code[0].upper(), "general")
 
 
 # Agent Classes
@@ -1435,9 +2000,10 @@ class DiagnosticAgent(BaseAgent):
             if any(condition in diagnosis_name for condition in serious_conditions):
                 logger.warning(f"⚠️ Blocking serious diagnosis from few-shot: {diagnosis_name} for symptoms: {symptoms}")
                 # Skip few-shot for serious conditions, use conservative diagnosis instead
-            else:
+            elif few_shot_result['confidence'] > 0.75:  # Increased threshold
+                # Safety check only for results confident enough to be used at all
                 is_aggressive_diagnosis = await self.medical_service._is_aggressive_diagnosis_llm(diagnosis, symptoms)
-                if not is_aggressive_diagnosis and few_shot_result['confidence'] > 0.75:  # Increased threshold
+                if not is_aggressive_diagnosis:
                     logger.info(f"🎯 Using few-shot learning diagnosis: {diagnosis}")
                     return [diagnosis] + few_shot_result.get('differential_diagnoses', [])
 
@@ -1462,198 +2028,50 @@ class DiagnosticAgent(BaseAgent):
                 "severity_score": 50
             }]
 
-        # Comprehensive symptom-to-diagnosis mapping with variations
-        symptom_diagnosis_map = {
-            "common_cold": {
-                "keywords": [
-                    # Thai variations - expanded for better matching
-                    "ไข้", "ไข้เล็กน้อย", "ไข้ต่ำ", "ไข้ 38", "ไข้สูง", "เป็นไข้", "มีไข้",
-                    "ตัวร้อน", "ตัวรุ่ม", "ตัวร้อนๆ", "ไม่สบาย", "ไม่สบายตัว",
-                    "คัดจมูก", "จมูกแน่น", "น้ำมูกใส", "น้ำมูกเหลว", "น้ำมูกเขียว", "น้ำมูกข้น",
-                    "ไอ", "ไอแห้ง", "ไอเล็กน้อย", "ไอบ่อย", "ไอมีเสียง",
-                    "เจ็บคอ", "คอแห้ง", "คอแสบ", "คอบวม", "กลืนลำบาก",
-                    "ปวดเมื่อย", "เมื่อยตัว", "อ่อนเพลีย", "เหนื่อย", "นอนไม่หลับ",
-                    "ปวดหัว", "ปวดหัวเล็กน้อย", "ศีรษะปวด",
-                    "จาม", "จามบ่อย", "ตาแดง", "ตาคัน",
-                    # Common cold specific phrases
-                    "หวัด", "เป็นหวัด", "หัดตัว", "วัน", "สองสามวัน", "มาสองสามวัน",
-                    # English
-                    "fever", "low fever", "runny nose", "stuffy nose", "cough", "dry cough",
-                    "sore throat", "body aches", "fatigue", "sneezing", "nasal congestion",
-                    "green mucus", "yellow mucus", "cold", "common cold", "headache", "feel hot"
-                ],
-                "icd_code": "J00", "thai_name": "ไข้หวัด", "english_name": "Common Cold", "confidence_base": 85,
-                "severity_indicators": ["ไข้สูง", "หายใจลำบาก", "เจ็บคอมาก"],
-                "typical_combination": ["ไข้", "ไอ", "น้ำมูก"]  # If all 3 present, very likely cold
-            },
-            "flu": {
-                "keywords": [
-                    "ไข้สูง", "ไข้มาก", "ปวดหัว", "ปวดตัว", "หนาวสั่น", "เหนื่อยมาก", "ไอมาก",
-                    "high fever", "body aches", "chills", "headache", "severe fatigue", "muscle pain"
-                ],
-                "icd_code": "J11.1", "thai_name": "ไข้หวัดใหญ่", "english_name": "Influenza", "confidence_base": 75
-            },
-            "diabetes": {
-                "keywords": [
-                    # Thai comprehensive
-                    "ปัสสาวะบ่อย", "ปัสสาวะมาก", "ปัสสาวะตลอดเวลา", "กระหายน้ำ", "กระหายน้ำมาก",
-                    "ดื่มน้ำมาก", "น้ำหนักลด", "ผอมลง", "อ่อนเพลีย", "เหนื่อยง่าย", "ตาพร่ามัว",
-                    "มองไม่ชัด", "แผลหายช้า", "ติดเชื้อง่าย", "หิวบ่อย", "กินมากแต่ผอม",
-                    # English
-                    "frequent urination", "excessive thirst", "weight loss", "fatigue", "blurred vision",
-                    "slow healing", "frequent infections", "increased hunger"
-                ],
-                "icd_code": "E11", "thai_name": "เบาหวาน", "english_name": "Diabetes Mellitus", "confidence_base": 75,
-                "severity_indicators": ["น้ำหนักลดมาก", "ตาพร่ามัวรุนแรง", "หายใจเหม็นผลไม้"]
-            },
-            "gastritis": {
-                "keywords": [
-                    # Thai comprehensive - เฉพาะเจาะจงมากขึ้น
-                    "ปวดท้องส่วนบน", "ปวดลิ้นปี่", "แสบร้อน", "แสบกลางอก", "แสบกระเพาะ",
-                    "คลื่นไส้", "อาเจียน", "ท้องอืด", "ท้องเฟ้อ", "เรอบ่อย", "กรดไหลย้อน",
-                    "กินไม่ได้", "หิวแต่กินไม่ลง", "อาหารไม่ย่อย", "ปวดหลังอาหาร", "ปวดท้องว่าง",
-                    "กระเพาะอักเสบ", "แสบร้อนกระเพาะ",
-                    # English
-                    "stomach pain", "gastric pain", "heartburn", "nausea", "vomiting", "bloating",
-                    "acid reflux", "indigestion", "loss of appetite", "epigastric pain", "gastritis"
-                ],
-                "icd_code": "K29", "thai_name": "กระเพาะอักเสบ", "english_name": "Gastritis", "confidence_base": 80,
-                "severity_indicators": ["อาเจียนเป็นเลือด", "ถ่ายดำ", "ปวดมาก"],
-                "specific_location": "ท้องส่วนบน"
-            },
-            "appendicitis": {
-                "keywords": [
-                    # Thai comprehensive - เฉพาะเจาะจงสำหรับไส้ติ่ง
-                    "ปวดท้องขวาล่าง", "ปวดท้องขวา", "ปวดตำแหน่งไส้ติ่ง", "ไส้ติ่งอักเสบ",
-                    "ปวดท้องลิง", "ปวดท้องอักเสบ", "ไข้สูง", "คลื่นไส้อาเจียน",
-                    "ไม่สามารถเดินได้", "ปวดเมื่อกด", "ปวดเมื่อไอ",
-                    # English
-                    "appendicitis", "right lower abdomen pain", "lower right abdominal pain",
-                    "appendix pain", "mcburney point", "right iliac fossa pain"
-                ],
-                "icd_code": "K37", "thai_name": "ไส้ติ่งอักเสบ", "english_name": "Appendicitis", "confidence_base": 85,
-                "severity_indicators": ["ไข้สูง", "ปวดรุนแรง", "อาเจียนมาก", "เดินไม่ได้"],
-                "specific_location": "ท้องขวาล่าง",
-                "emergency": True
-            },
-            "migraine": {
-                "keywords": [
-                    # Thai comprehensive
-                    "ปวดศีรษะ", "ปวดหัว", "ไมเกรน", "ปวดข้างเดียว", "ปวดแบบตุบๆ", "ปวดแรง",
-                    "คลื่นไส้", "อาเจียน", "กลัวแสง", "กลัวเสียง", "ตาเจ็บ", "มองเห็นแสงแวบ",
-                    "เครียด", "นอนไม่หลับ", "อารมณ์เปลี่ยน",
-                    # English
-                    "headache", "migraine", "severe headache", "throbbing pain", "pulsating pain",
-                    "photophobia", "phonophobia", "nausea", "vomiting", "aura", "visual disturbance"
-                ],
-                "icd_code": "G43.909", "thai_name": "ไมเกรน", "english_name": "Migraine", "confidence_base": 75,
-                "severity_indicators": ["ปวดรุนแรง", "อาเจียนมาก", "มองไม่เห็น"]
-            },
-            "uti": {
-                "keywords": [
-                    # Thai comprehensive
-                    "ปัสสาวะแสบ", "ปัสสาวะเจ็บ", "ปัสสาวะบ่อย", "ปัสสาวะไม่สุด", "ปัสสาวะขุ่น",
-                    "ปัสสาวะเหม็น", "ปัสสาวะมีเลือด", "ปวดท้องน้อย", "ปวดหลัง", "ไข้ต่ำ",
-                    "ปวดเมื่อปัสสาวะ", "รู้สึกไม่สบาย",
-                    # English
-                    "painful urination", "burning urination", "frequent urination", "urgency",
-                    "cloudy urine", "bloody urine", "pelvic pain", "back pain", "dysuria"
-                ],
-                "icd_code": "N39.0", "thai_name": "ติดเชื้อทางเดินปัสสาวะ", "english_name": "Urinary Tract Infection", "confidence_base": 70,
-                "severity_indicators": ["ปัสสาวะมีเลือด", "ไข้สูง", "ปวดหลังรุนแรง"]
-            },
-            "allergic_reaction": {
-                "keywords": [
-                    # Thai comprehensive
-                    "ผื่น", "ผื่นแดง", "ผื่นลมพิษ", "คัน", "คันมาก", "คันทั่วตัว", "บวม", "หน้าบวม",
-                    "ตาบวม", "ริมฝีปากบวม", "ลิ้นบวม", "หายใจลำบาก", "หายใจไม่ออก", "เหงื่อออก",
-                    "วิงเวียน", "แพ้", "กินแล้วแพ้", "แพ้ยา", "แพ้อาหาร",
-                    # English
-                    "rash", "hives", "itching", "swelling", "facial swelling", "lip swelling",
-                    "tongue swelling", "difficulty breathing", "wheezing", "allergic", "allergy"
-                ],
-                "icd_code": "T78.40", "thai_name": "ปฏิกิริยาแพ้", "english_name": "Allergic Reaction", "confidence_base": 80,
-                "severity_indicators": ["หายใจลำบาก", "บวมรุนแรง", "เป็นลม"]
-            },
-            "hypertension": {
-                "keywords": [
-                    "ความดันสูง", "ปวดหัว", "วิงเวียน", "หูอื้อ", "ใจสั่น", "เจ็บหน้าอก", "หายใจไม่อิ่ม",
-                    "high blood pressure", "hypertension", "headache", "dizziness", "chest pain"
-                ],
-                "icd_code": "I10", "thai_name": "ความดันโลหิตสูง", "english_name": "Hypertension", "confidence_base": 70
-            },
-            "depression_anxiety": {
-                "keywords": [
-                    "เครียด", "กังวล", "เศร้า", "นอนไม่หลับ", "ไม่อยากทำอะไร", "เหนื่อยใจ", "ห่วงมาก",
-                    "กลัว", "ตื่นตระหนก", "ใจเต้นแรง", "มือสั่น", "เหงื่อออก",
-                    "stress", "anxiety", "depression", "insomnia", "panic", "worry", "fear"
-                ],
-                "icd_code": "F43.9", "thai_name": "ความเครียดและความวิตกกังวล", "english_name": "Stress and Anxiety", "confidence_base": 65
-            },
-            "fever": {
-                "keywords": [
-                    # Thai comprehensive
-                    "ไข้", "ไข้สูง", "ไข้ต่ำ", "ตัวร้อน", "ร่างกายร้อน", "หนาวสั่น", "หนาว", "สั่น",
-                    "ซึม", "อ่อนเพลีย", "เด็กไข้", "ลูกไข้", "ไข้ขึ้นลง", "ตัวเป็นไข้",
-                    # English
-                    "fever", "high fever", "temperature", "hot", "chills", "shivering", "feverish"
-                ],
-                "icd_code": "R50.9", "thai_name": "ไข้", "english_name": "Fever", "confidence_base": 70,
-                "severity_indicators": ["ไข้สูงมาก", "ชัก", "ซึมมาก"]
-            }
-        }
-
         matches = []
         symptoms_lower = symptoms.lower()
 
+        # Keywords are matched case-insensitively; without any hit no condition can reach
+        # its threshold (pattern bonuses alone stay below it), so the scoring is skipped
+        hits = _SYMPTOM_KEYWORD_MATCHER.find(symptoms_lower)
+
         # Enhanced scoring with context and patterns
-        for condition, data in symptom_diagnosis_map.items():
+        for spec in (_SYMPTOM_CONDITIONS.values() if hits else ()):
             score = 0
             matched_keywords = []
             severity_score = 0
 
-            # Main keyword matching with weighted scoring
-            for keyword in data["keywords"]:
-                if keyword.lower() in symptoms_lower or keyword in symptoms:
-                    # Weight scoring based on keyword specificity
-                    if len(keyword) > 8:  # Specific symptoms get higher weight
-                        score += 20
-                    elif len(keyword) > 4:
-                        score += 15
-                    else:
-                        score += 10
+            # Main keyword matching, weighted by keyword specificity
+            for keyword, keyword_lower, weight in spec.keywords:
+                if keyword_lower in hits:
+                    score += weight
                     matched_keywords.append(keyword)
 
             # Check for severity indicators
-            severity_indicators = data.get("severity_indicators", [])
-            for indicator in severity_indicators:
-                if indicator.lower() in symptoms_lower or indicator in symptoms:
+            for indicator in spec.severity_indicators:
+                if indicator in hits:
                     severity_score += 25
                     score += 10  # Bonus for severity matching
 
             # Adjust score based on condition-specific patterns
-            if condition == "diabetes" and any(word in symptoms_lower for word in ["บ่อย", "มาก", "ลด"]):
-                score += 15  # Frequency/quantity patterns
-            elif condition == "migraine" and any(word in symptoms_lower for word in ["ข้างเดียว", "ตุบ", "แรง"]):
-                score += 15  # Pain pattern descriptions
-            elif condition == "gastritis" and any(word in symptoms_lower for word in ["หลัง", "ว่าง", "กิน"]):
-                score += 15  # Timing patterns
+            if any(word in symptoms_lower for word in spec.pattern_words):
+                score += 15
 
             # Minimum threshold: at least 2 keywords or 1 specific keyword
             threshold = 25 if len(matched_keywords) >= 2 else 40
 
             if score >= threshold:
                 # Calculate final confidence with severity adjustment
-                base_confidence = data["confidence_base"]
+                base_confidence = spec.confidence_base
                 bonus = min((score - threshold), 20)
                 severity_bonus = min(severity_score, 15)
 
                 final_confidence = min(base_confidence + bonus + severity_bonus, 98)
 
                 matches.append({
-                    "icd_code": data["icd_code"],
-                    "english_name": data["english_name"],
-                    "thai_name": data["thai_name"],
+                    "icd_code": spec.icd_code,
+                    "english_name": spec.english_name,
+                    "thai_name": spec.thai_name,
                     "confidence": final_confidence,
                     "category": "Common Illness",
                     "matched_keywords": matched_keywords,
@@ -1680,46 +2098,18 @@ class DiagnosticAgent(BaseAgent):
     def _check_red_flags(self, symptoms: str) -> Dict[str, Any]:
         """Check for red flag symptoms that require immediate medical attention"""
 
-        red_flag_symptoms = {
-            "cardiovascular": {
-                "keywords": ["เจ็บหน้าอก", "ปวดหน้าอก", "แน่นหน้าอก", "หายใจไม่ออก", "หายใจลำบาก",
-                           "เหงื่อออก", "หน้าซีด", "ใจเต้นผิดปกติ", "chest pain", "shortness of breath"],
-                "urgency": "critical"
-            },
-            "neurological": {
-                "keywords": ["หมดสติ", "ชัก", "อัมพาต", "พูดไม่ได้", "มึนงง", "โรคหลอดเลือดสมอง",
-                           "ปวดหัวรุนแรง", "มองไม่เห็น", "unconscious", "seizure", "stroke", "paralysis"],
-                "urgency": "critical"
-            },
-            "severe_allergic": {
-                "keywords": ["หายใจไม่ออก", "บวมรุนแรง", "ลิ้นบวม", "คอบวม", "เป็นลม", "วิงเวียนมาก",
-                           "anaphylaxis", "severe swelling", "throat swelling"],
-                "urgency": "critical"
-            },
-            "severe_bleeding": {
-                "keywords": ["เลือดออกมาก", "อาเจียนเป็นเลือด", "ถ่ายเป็นเลือด", "ถ่ายดำ", "เลือดกำเดา",
-                           "severe bleeding", "blood vomiting", "bloody stool"],
-                "urgency": "high"
-            },
-            "high_fever_complications": {
-                "keywords": ["ไข้สูงมาก", "ไข้เกิน 40", "ชัก", "ซึมมาก", "ปวดคอแข็ง", "ผื่นแดงไม่หาย",
-                           "very high fever", "febrile seizure", "neck stiffness", "persistent rash"],
-                "urgency": "high"
-            }
-        }
-
         detected_flags = []
         max_urgency = "none"
 
-        symptoms_lower = symptoms.lower()
-
-        for category, data in red_flag_symptoms.items():
-            for keyword in data["keywords"]:
-                if keyword.lower() in symptoms_lower or keyword in symptoms:
-                    detected_flags.append({"keyword": keyword, "category": category, "urgency": data["urgency"]})
-                    if data["urgency"] == "critical":
+        # One keyword pass over the text; most messages have no red flags at all
+        hits = _RED_FLAG_MATCHER.find(symptoms.lower())
+        if hits:
+            for keyword, keyword_lower, category, urgency in _RED_FLAG_KEYWORDS:
+                if keyword_lower in hits:
+                    detected_flags.append({"keyword": keyword, "category": category, "urgency": urgency})
+                    if urgency == "critical":
                         max_urgency = "critical"
-                    elif data["urgency"] == "high" and max_urgency != "critical":
+                    elif urgency == "high" and max_urgency != "critical":
                         max_urgency = "high"
 
         if detected_flags:
@@ -1888,33 +2278,52 @@ class TreatmentAgent(BaseAgent):
         logger.info(f"🔍 RAG search for condition: '{condition}', symptoms: {symptoms}")
         logger.info(f"📊 Knowledge base: {len(self.medical_service.treatments)} treatments, {len(self.medical_service.medicines)} medicines")
 
-        relevant_medicines = []
+        # Keyed by the resolved medicine so a drug listed under several treatments is only
+        # enhanced once; insertion order keeps the original ranking
+        relevant_medicines: Dict[str, Dict] = {}
+        condition_lower = condition.lower()
+        symptoms_lower = [symptom.lower() for symptom in symptoms]
+        treatments = self.medical_service.treatments
+        medicines = self.medical_service.medicines
+        medicine_name_index = self.medical_service.medicine_name_index
+        # Per-treatment tracing is DEBUG only; the INFO summary is logged once at the end
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+        # Only treatments sharing every bigram with the condition or a symptom can match
+        treatment_index = self.medical_service.treatment_index
+        candidates = treatment_index.candidates(condition_lower)
+        for symptom in symptoms_lower:
+            candidates |= treatment_index.candidates(symptom)
 
         # ค้นหาในฐานข้อมูล treatments.csv ตาม condition
-        for treatment in self.medical_service.treatments:
-            treatment_desc = treatment.description.lower()
-            treatment_name_en = treatment.name_en.lower()
-            treatment_name_th = treatment.name_th.lower()
+        for position in sorted(candidates):
+            treatment = treatments[position]
+            treatment_desc = treatment.description_lower
+            treatment_name_en = treatment.name_en_lower
+            treatment_name_th = treatment.name_th_lower
 
-            logger.info(f"🔍 Checking treatment: {treatment.name_en} | {treatment.name_th} | {treatment.description}")
+            if debug_enabled:
+                logger.debug("🔍 Checking treatment: %s | %s | %s",
+                             treatment.name_en, treatment.name_th, treatment.description)
 
             # ตรวจสอบว่า condition ตรงกับการรักษาหรือไม่
             condition_found = (
-                condition.lower() in treatment_desc or
-                condition.lower() in treatment_name_en or
-                condition.lower() in treatment_name_th
+                condition_lower in treatment_desc or
+                condition_lower in treatment_name_en or
+                condition_lower in treatment_name_th
             )
 
             # ตรวจสอบ symptoms
             symptom_found = any(
-                symptom.lower() in treatment_desc or
-                symptom.lower() in treatment_name_en or
-                symptom.lower() in treatment_name_th
-                for symptom in symptoms
+                symptom in treatment_desc or
+                symptom in treatment_name_en or
+                symptom in treatment_name_th
+                for symptom in symptoms_lower
             )
 
             if condition_found or symptom_found:
-                logger.info(f"✅ Found matching treatment: {treatment.name_en}")
+                if debug_enabled:
+                    logger.debug("✅ Found matching treatment: %s", treatment.name_en)
 
                 # ดึงข้อมูลยาจาก treatments.csv
                 # treatment.name_en คือ medications field จาก CSV
@@ -1929,12 +2338,18 @@ class TreatmentAgent(BaseAgent):
 
                         # หาข้อมูลเพิ่มเติมจาก medicines.csv
                         detailed_medicine = None
-                        for medicine in self.medical_service.medicines:
-                            if (med_name.lower() in medicine.name_th.lower() or
-                                med_name.lower() in medicine.name_en.lower()):
+                        med_name_lower = med_name.lower()
+                        for position in sorted(medicine_name_index.candidates(med_name_lower)):
+                            medicine = medicines[position]
+                            if (med_name_lower in medicine.name_th_lower or
+                                med_name_lower in medicine.name_en_lower):
                                 detailed_medicine = medicine
                                 break
 
+                        medicine_key = detailed_medicine.id if detailed_medicine else med_name_lower
+                        if medicine_key in relevant_medicines:
+                            continue
+
                         medicine_data = {
                             "english_name": detailed_medicine.name_en if detailed_medicine else med_name,
                             "thai_name": detailed_medicine.name_th if detailed_medicine else med_name,
@@ -1947,11 +2362,17 @@ class TreatmentAgent(BaseAgent):
                             "from_treatments_csv": True,
                             "original_treatment": medications_text
                         }
-                        relevant_medicines.append(medicine_data)
-                        logger.info(f"💊 Added medication: {medicine_data['thai_name']}")
+                        relevant_medicines[medicine_key] = medicine_data
+                        if debug_enabled:
+                            logger.debug("💊 Added medication: %s", medicine_data['thai_name'])
+
+                        # Limit to top 3 relevant medications - no need to scan further
+                        if len(relevant_medicines) >= _MAX_RAG_MEDICATIONS:
+                            logger.info(f"📋 Total medications found: {len(relevant_medicines)}")
+                            return list(relevant_medicines.values())
 
         logger.info(f"📋 Total medications found: {len(relevant_medicines)}")
-        return relevant_medicines[:3]  # Limit to top 3 relevant medications
+        return list(relevant_medicines.values())
 
     def _extract_dosage_from_medicine(self, medicine) -> str:
         """Extract dosage from medicines.csv data"""
@@ -1959,19 +2380,11 @@ class TreatmentAgent(BaseAgent):
             return "ตามคำแนะนำแพทย์"
 
         # Try to get strength from description
-        description = medicine.description.lower()
+        description = medicine.description_lower
 
         # Extract dosage from the description which contains full medicine info
-        import re
-        dosage_patterns = [
-            r'(\d+(?:\.\d+)?)\s*mg',
-            r'(\d+(?:\.\d+)?)\s*ml',
-            r'(\d+)\s*units?/ml',
-            r'(\d+)\s*mcg'
-        ]
-
-        for pattern in dosage_patterns:
-            match = re.search(pattern, description, re.IGNORECASE)
+        for pattern in _MEDICINE_STRENGTH_PATTERNS:
+            match = pattern.search(description)
             if match:
                 return match.group(0)
 
@@ -1979,22 +2392,17 @@ class TreatmentAgent(BaseAgent):
 
     def _extract_dosage_from_rag(self, description: str) -> str:
         """Extract dosage information from RAG description"""
-        import re
-
-        # Common dosage patterns
-        dosage_patterns = [
-            r'(\d+(?:\.\d+)?)\s*mg',
-            r'(\d+(?:\.\d+)?)\s*ml',
-            r'(\d+)\s*tablets?',
-            r'(\d+)\s*capsules?'
-        ]
 
-        for pattern in dosage_patterns:
-            match = re.search(pattern, description, re.IGNORECASE)
-            if match:
-                return match.group(0)
+        # Common dosage patterns: first hit of the most preferred unit, in one scan
+        best_dosage, best_priority = None, len(_RAG_DOSAGE_PRIORITY)
+        for match in _RAG_DOSAGE_RE.finditer(description):
+            priority = _RAG_DOSAGE_PRIORITY[match.lastgroup]
+            if priority < best_priority:
+                best_dosage, best_priority = match.group(0), priority
+                if priority == 0:
+                    break
 
-        return "ตามคำแนะนำของแพทย์"  # Default if no dosage found
+        return best_dosage or "ตามคำแนะนำของแพทย์"  # Default if no dosage found
 
     async def _generate_llm_medication_instructions(self, medicine: Dict, patient_info: Optional[PatientInfo],
                                             condition: str, symptoms: List[str]) -> Dict:
@@ -2064,28 +2472,27 @@ Warnings: ปรึกษาแพทย์หากอาการไม่ด
 
     def _parse_llm_medication_response(self, llm_response: str, medicine_name: str, contraindications: Dict) -> Dict:
         """Parse LLM response into structured medication instructions"""
-        import re
 
-        duration_match = re.search(r'Duration:\s*(.+)', llm_response)
-        frequency_match = re.search(r'Frequency:\s*(.+)', llm_response)
-        instructions_match = re.search(r'Instructions:\s*(.+)', llm_response)
-        warnings_match = re.search(r'Warnings:\s*(.+)', llm_response)
+        # First value given for each label
+        fields: Dict[str, str] = {}
+        for match in _MEDICATION_FIELD_RE.finditer(llm_response):
+            fields.setdefault(match.group("label"), match.group("value").strip())
+            if len(fields) == _MEDICATION_FIELD_COUNT:
+                break
 
         return {
-            "duration": duration_match.group(1).strip() if duration_match else "5-7 วัน",
-            "frequency": frequency_match.group(1).strip() if frequency_match else "ทุก 6-8 ชั่วโมง",
-            "instructions": instructions_match.group(1).strip() if instructions_match else "รับประทานหลังอาหาร",
-            "warnings": [warnings_match.group(1).strip()] if warnings_match else ["ใช้ตามคำแนะนำของแพทย์"],
+            "duration": fields.get("Duration", "5-7 วัน"),
+            "frequency": fields.get("Frequency", "ทุก 6-8 ชั่วโมง"),
+            "instructions": fields.get("Instructions", "รับประทานหลังอาหาร"),
+            "warnings": [fields["Warnings"]] if "Warnings" in fields else ["ใช้ตามคำแนะนำของแพทย์"],
             "contraindications": contraindications.get(medicine_name.lower(), [])
         }
 
     def _get_safe_medication_defaults(self, medicine_name: str, patient_age: int, contraindications: Dict) -> Dict:
         """Safe fallback medication instructions when LLM fails"""
         return {
-            "duration": "5-7 วัน",
-            "frequency": "ตามคำแนะนำของแพทย์",
-            "instructions": "รับประทานหลังอาหาร",
-            "warnings": ["ปรึกษาแพทย์หากอาการไม่ดีขึ้น", "อ่านคำแนะนำบนฉลากยา"],
+            **_SAFE_MEDICATION_DEFAULTS,
+            "warnings": list(_SAFE_MEDICATION_WARNINGS),  # Callers get their own list
             "contraindications": contraindications.get(medicine_name.lower(), [])
         }
 
@@ -2250,28 +2657,17 @@ class TriageAgent(BaseAgent):
         patient_info = case_data.get("patient_info")
         # Note: Vital signs assessment removed - inappropriate for consultation scope
 
-        # Check for emergency keywords
-        emergency_keywords = [
-            # Thai emergency keywords
-            "ฉุกเฉิน", "เร่งด่วน", "หัวใจวาย", "หัวใจหยุดเต้น", "หายใจไม่ได้", "หายใจลำบากมาก",
-            "เจ็บหน้าอกมาก", "ปวดหน้าอกแปลบ", "หมดสติ", "ชัก", "เลือดออกมาก", "อุบัติเหตุ",
-            # English emergency keywords
-            "emergency", "cardiac arrest", "can't breathe", "severe chest pain",
-            "unconscious", "seizure", "severe bleeding", "stroke"
-        ]
-
         # Calculate risk score based on symptoms
         risk_score = 0
         urgency = "low"
         triage_level = 5
+        message_lower = message.lower()
 
-        # Check for emergency keywords
-        for keyword in emergency_keywords:
-            if keyword.lower() in message.lower():
-                risk_score += 50
-                urgency = "critical"
-                triage_level = 1
-                break
+        # Check for emergency keywords (one scan over the message for the whole list)
+        if _TRIAGE_EMERGENCY_MATCHER.search(message_lower):
+            risk_score += 50
+            urgency = "critical"
+            triage_level = 1
 
         # Note: Vital signs assessment removed - inappropriate for consultation scope
 
@@ -2281,15 +2677,8 @@ class TriageAgent(BaseAgent):
                 risk_score += 10
 
         # Symptom severity indicators
-        severity_indicators = [
-            "มาก", "รุนแรง", "แย่", "ทนไม่ได้", "ปวดมาก", "เจ็บมาก",
-            "severe", "intense", "unbearable", "worst", "acute"
-        ]
-
-        for indicator in severity_indicators:
-            if indicator.lower() in message.lower():
-                risk_score += 15
-                break
+        if _SEVERITY_INDICATOR_MATCHER.search(message_lower):
+            risk_score += 15
 
         # Determine urgency level based on risk score
         if risk_score >= 50:
@@ -8,17 +8,25 @@ import aiohttp
 import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime
+import time
+from typing import Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) without splitting the text"""
+    return max(1, len(text) >> 2) if text else 0
+
+
 class OllamaClient:
     """Real Ollama API client for LLM interactions"""
 
     def __init__(self, base_url: str = "http://localhost:11434"):
         self.base_url = base_url.rstrip('/')
         self.session = None
+        # Generation requests currently awaiting Ollama, keyed by model, prompt and options
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
 
     async def __aenter__(self):
         """Async context manager entry"""
@@ -88,9 +96,33 @@ class OllamaClient:
                       system_prompt: Optional[str] = None,
                       temperature: float = 0.7,
                       max_tokens: int = 1000) -> Dict[str, Any]:
-        """Generate response from Ollama model"""
+        """Generate response from Ollama model
+
+        Concurrent calls with the same model, prompt and options share a single
+        Ollama request instead of queueing duplicates behind each other.
+        """
+
+        key = (model, prompt, system_prompt, temperature, max_tokens)
+        pending = self._in_flight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                self._generate(model, prompt, system_prompt, temperature, max_tokens)
+            )
+            self._in_flight[key] = pending
+            pending.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shielded so one caller being cancelled does not cancel the request for the others
+        return dict(await asyncio.shield(pending))
+
+    async def _generate(self,
+                        model: str,
+                        prompt: str,
+                        system_prompt: Optional[str],
+                        temperature: float,
+                        max_tokens: int) -> Dict[str, Any]:
+        """Send one generation request to Ollama"""
 
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
 
         try:
             if not self.session:
@@ -135,11 +167,11 @@ class OllamaClient:
                     response_text = data.get('response', '')
 
                     # Calculate metrics
-                    processing_time = (datetime.now() - start_time).total_seconds() * 1000
+                    processing_time = (time.perf_counter_ns() - start_ns) / 1e6
 
-                    # Estimate token usage (rough approximation)
-                    prompt_tokens = len(prompt.split())
-                    response_tokens = len(response_text.split())
+                    # Ollama reports real token counts; estimate only when they are missing
+                    prompt_tokens = data.get('prompt_eval_count') or estimate_tokens(prompt)
+                    response_tokens = data.get('eval_count') or estimate_tokens(response_text)
                     total_tokens = prompt_tokens + response_tokens
 
                     logger.info(f"✅ Ollama response received. Length: {len(response_text)}, Time: {processing_time:.0f}ms")
@@ -160,7 +192,7 @@ class OllamaClient:
                     raise Exception(f"Ollama API returned {response.status}: {error_text}")
 
         except Exception as e:
-            processing_time = (datetime.now() - start_time).total_seconds() * 1000
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e6
             logger.error(f"❌ Ollama generation failed: {e}")
 
             return {
@@ -13,6 +13,7 @@ Key Features:
 """
 
 import asyncio
+import heapq
 import json
 import logging
 import numpy as np
@@ -391,19 +392,16 @@ class RAGFewShotService:
                 item.confidence_score = score
                 scored_items.append((score, item))
 
-        # Sort by score and apply safety boost/penalty
-        scored_items.sort(key=lambda x: x[0], reverse=True)
-
-        # Apply safety adjustments
+        # Apply safety boost/penalty
         adjusted_items = []
         for score, item in scored_items:
             adjusted_score = self._apply_safety_adjustment(score, item)
-            adjusted_items.append((adjusted_score, item))
+            adjusted_items.append((adjusted_score, score, item))
 
-        # Re-sort with safety adjustments
-        adjusted_items.sort(key=lambda x: x[0], reverse=True)
+        # Keep only the top max_items by adjusted score, ties by raw score - no full sort of the knowledge base
+        top_items = heapq.nlargest(max_items, adjusted_items, key=lambda x: (x[0], x[1]))
 
-        return [item for score, item in adjusted_items[:max_items]]
+        return [item for adjusted_score, score, item in top_items]
 
     async def _calculate_relevance_score(self,
                                        item: KnowledgeItem,
@@ -0,0 +1,114 @@
+"""
+Semantic LLM Answer Cache
+=========================
+Reuses LLM answers for near-identical symptom descriptions (normalised token-set Jaccard)
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Any, FrozenSet, Optional, Tuple
+
+# Thai tone marks and the thanthakhat are dropped so spelling variants share tokens
+_THAI_TONE_MARKS = str.maketrans("", "", "\u0e48\u0e49\u0e4a\u0e4b\u0e4c")
+# \w alone splits Thai words at their vowel signs, so the whole Thai block is included
+_TOKEN_RE = re.compile(r"[\w\u0e00-\u0e7f]+")
+# Words that flip a symptom's meaning; "don't" etc. tokenise to these stems
+_NEGATION_WORDS = frozenset((
+    "no", "not", "non", "none", "nor", "neither", "never", "without", "absent", "negative",
+    "deny", "denies", "denied", "don", "doesn", "didn", "isn", "aren", "wasn", "haven", "hasn",
+))
+# Thai is written without spaces, so negations usually sit inside a longer token ("ไม่มีไข้")
+_THAI_NEGATIONS = ("ไม่", "ปฏิเสธ", "ปราศจาก", "ไร้")
+# (context, negation markers, symptom tokens)
+_Key = Tuple[str, FrozenSet[str], FrozenSet[str]]
+
+
+def normalize_symptoms(text: str) -> FrozenSet[str]:
+    """Lowercased, tone-mark-free word tokens of a symptom description"""
+    return frozenset(_TOKEN_RE.findall(text.lower().translate(_THAI_TONE_MARKS)))
+
+
+def negation_markers(text: str) -> FrozenSet[str]:
+    """Negating tokens of a symptom description (taken before tone marks are stripped)"""
+    return frozenset(
+        token for token in _TOKEN_RE.findall(text.lower())
+        if token in _NEGATION_WORDS or any(negation in token for negation in _THAI_NEGATIONS)
+    )
+
+
+class SemanticCache:
+    """LRU cache of LLM answers keyed by symptom token sets
+
+    A lookup hits when a stored entry for the same exact context (e.g. the diagnosis
+    being checked) has symptom tokens with Jaccard similarity >= threshold, so only
+    re-phrasings that share nearly all their words reuse an answer. Negations ("no
+    fever", "ไม่มีไข้") must match exactly, since one extra word can invert the answer;
+    exact=True lookups skip the similarity match altogether. Entries expire after
+    ttl_seconds.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl_seconds: float = 24 * 3600, threshold: float = 0.8):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: OrderedDict[_Key, Tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symptoms: str, context: str = "", exact: bool = False) -> Optional[Any]:
+        """Return the cached answer for similar (or, with exact=True, the same) symptoms, or None"""
+        tokens = normalize_symptoms(symptoms)
+        if not tokens:
+            return None
+        now = time.monotonic()
+
+        key = (context, negation_markers(symptoms), tokens)
+        entry = self._entries.get(key)
+        if entry is None and not exact:
+            key = self._nearest(key)
+            entry = self._entries.get(key) if key is not None else None
+
+        if entry is None or entry[0] < now:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, symptoms: str, value: Any, context: str = "") -> None:
+        """Store an answer for these symptoms (evicting the least recently used entry when full)"""
+        tokens = normalize_symptoms(symptoms)
+        if not tokens:
+            return
+        key = (context, negation_markers(symptoms), tokens)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached answer"""
+        self._entries.clear()
+
+    def _nearest(self, key: _Key) -> Optional[_Key]:
+        """Most similar stored key with this context and negations, if it clears the Jaccard threshold"""
+        context, negations, tokens = key
+        threshold = self.threshold
+        size = len(tokens)
+        # |A ∩ B| / |A ∪ B| >= t needs t*|A| <= |B| <= |A|/t, so most entries are skipped by length
+        min_size, max_size = size * threshold, size / threshold
+        best_key, best_score = None, threshold
+        for entry_key in self._entries:
+            entry_context, entry_negations, entry_tokens = entry_key
+            if (entry_context != context or entry_negations != negations
+                    or not min_size <= len(entry_tokens) <= max_size):
+                continue
+            overlap = len(tokens & entry_tokens)
+            score = overlap / (size + len(entry_tokens) - overlap)
+            if score >= best_score:
+                best_key, best_score = entry_key, score
+        return best_key
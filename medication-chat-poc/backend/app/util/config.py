@@ -27,6 +27,7 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "sqlite:///./medical_chat.db"
+    redis_url: str = ""  # Shared conversation history when set (in-process otherwise)
 
     # Medical workflow settings
     require_doctor_approval: bool = False  # Enable doctor approval workflow
@@ -63,6 +64,9 @@ class Settings(BaseSettings):
 
     # Medical AI specific settings
     max_conversation_history: int = 10
+    max_conversation_sessions: int = 1000
+    conversation_ttl_hours: float = 6.0
+    max_prompt_chars: int = 4000  # Longer LLM prompts are condensed before dispatch
     emergency_confidence_threshold: float = 0.8
     diagnosis_confidence_threshold: float = 0.6
     max_rag_results: int = 5
@@ -0,0 +1,67 @@
+# Multi-keyword matcher for Thai/English symptom text
+# Single-pass scanning of a fixed keyword set (Aho-Corasick with regex fallback)
+
+import re
+from typing import Dict, FrozenSet, Iterable, Set, Tuple
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+class KeywordMatcher:
+    """Find every keyword of a fixed set in one pass over the text
+
+    Uses a pyahocorasick automaton when installed. Otherwise falls back to a
+    single compiled regex alternation (longest keyword first, zero-width so
+    every start position is tried) plus a precomputed table of the keywords
+    contained in each keyword, so overlapping hits are still reported.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # Deduplicate while keeping insertion order; empty strings never match
+        self.keywords: Tuple[str, ...] = tuple(dict.fromkeys(k for k in keywords if k))
+        self._automaton = None
+        self._pattern = None
+
+        if not self.keywords:
+            return
+
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        else:
+            longest_first = sorted(self.keywords, key=len, reverse=True)
+            self._pattern = re.compile("(?=(" + "|".join(map(re.escape, longest_first)) + "))")
+            self._contained: Dict[str, FrozenSet[str]] = {
+                keyword: frozenset(other for other in self.keywords if other in keyword)
+                for keyword in self.keywords
+            }
+
+    def find(self, text: str) -> Set[str]:
+        """Return the set of keywords occurring anywhere in text"""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        if self._pattern is None:
+            return set()
+
+        found: Set[str] = set()
+        contained = self._contained
+        for match in self._pattern.finditer(text):
+            found |= contained[match.group(1)]
+        return found
+
+    def search(self, text: str) -> bool:
+        """Return True if any keyword occurs in text"""
+        if self._automaton is not None:
+            for _ in self._automaton.iter(text):
+                return True
+            return False
+        return self._pattern is not None and self._pattern.search(text) is not None
+
+    def __len__(self) -> int:
+        return len(self.keywords)
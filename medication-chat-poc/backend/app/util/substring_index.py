@@ -0,0 +1,48 @@
+# Inverted index for substring lookups over a fixed list of short Thai/English records
+# Character-bigram postings narrow a query down to the records that can contain it
+
+from typing import Dict, Iterable, List, Sequence, Set
+
+
+class SubstringIndex:
+    """Candidate filter for `query in field` checks over a fixed list of records
+
+    Each record is a sequence of already-normalised fields. A query can only be a
+    substring of a field that contains every character bigram of the query, so the
+    intersection of the bigram postings is a superset of the true matches - callers
+    still run their own substring test on the (usually few) candidates. Queries
+    shorter than two characters cannot be narrowed and return every record.
+    """
+
+    def __init__(self, records: Iterable[Sequence[str]]):
+        self._postings: Dict[str, Set[int]] = {}
+        self._size = 0
+        for position, fields in enumerate(records):
+            self._size = position + 1
+            for text in fields:
+                for start in range(len(text) - 1):
+                    self._postings.setdefault(text[start:start + 2], set()).add(position)
+
+    def candidates(self, query: str) -> Set[int]:
+        """Positions of the records that may contain query in one of their fields"""
+        if len(query) < 2:
+            return set(range(self._size))
+
+        # Intersect the rarest bigrams first so the working set shrinks quickly
+        postings: List[Set[int]] = []
+        for gram in {query[start:start + 2] for start in range(len(query) - 1)}:
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def __len__(self) -> int:
+        return self._size
@@ -6,6 +6,11 @@ import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+try:
+    import orjson  # noqa: F401  (ORJSONResponse needs it at render time)
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse
 from contextlib import asynccontextmanager
 
 from app.api.v1 import medical_chat, medical_diagnosis, medical_feedback, health, websocket
@@ -20,6 +25,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# None of our log formats use thread or process fields, so skip collecting them for every record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
 # Global services
 medical_ai_service = None
 
@@ -98,6 +108,8 @@ app = FastAPI(
         "url": "https://opensource.org/licenses/MIT",
     },
     lifespan=lifespan,
+    # orjson when installed: faster encoding of the Thai-heavy response payloads
+    default_response_class=DefaultJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -20,7 +20,8 @@ echo ""
 # Check if Ollama service is running
 if ! pgrep -x "ollama" > /dev/null; then
     echo "Starting Ollama service..."
-    ollama serve &
+    # Serve concurrent consultations in parallel instead of queueing them
+    OLLAMA_NUM_PARALLEL=${OLLAMA_NUM_PARALLEL:-4} ollama serve &
     sleep 5
     echo "✓ Ollama service started"
 else